@@ -0,0 +1,90 @@
+from decimal import Decimal
+from src.core.environment.orderbook import OrderBook
+
+
+class BookSnapshot(object):
+    '''
+    A frozen, compact copy of an OrderBook (or LevelBook). Only the aggregated price levels of
+    both sides are kept, as float64 arrays sorted by ascending price (shared
+    with the depth cache of the OrderTrees), so taking a snapshot never copies
+    the Order objects of the book.
+    The snapshot rehydrates into a live OrderBook lazily (copy-on-write): the
+    first call that has to mutate the book (i.e. process_order) builds it, all
+    read-only calls before that are answered from the arrays.
+    '''
+
+    def __init__(self, bid_prices, bid_volumes, ask_prices, ask_volumes, tick_size=0.0001,
+                 tape_mode='deque', tape_maxlen=None, book_cls=OrderBook):
+        self.bid_prices = bid_prices
+        self.bid_volumes = bid_volumes
+        self.ask_prices = ask_prices
+        self.ask_volumes = ask_volumes
+        self.tick_size = tick_size
+        self.tape_mode = tape_mode
+        self.tape_maxlen = tape_maxlen
+        self.book_cls = book_cls # OrderBook or LevelBook, the class rebuilt on thaw()
+        self._book = None # the live OrderBook, only built once needed
+
+    @classmethod
+    def from_order_book(cls, lob):
+        # the cached depth arrays of the trees are read-only and replaced on mutation, so they can be shared
+        bid_prices, bid_volumes = lob.bids.depth_arrays()
+        ask_prices, ask_volumes = lob.asks.depth_arrays()
+        return cls(bid_prices, bid_volumes, ask_prices, ask_volumes, lob.tick_size, lob.tape_mode, lob.tape_maxlen,
+                   type(lob))
+
+    def thaw(self):
+        '''Returns the live OrderBook of this snapshot, building it on first use.'''
+        if self._book is None:
+            self._book = self.to_order_book()
+        return self._book
+
+    def to_order_book(self):
+        '''Builds a new book of the type the snapshot was taken from, holding the levels of the snapshot.'''
+        return self.book_cls.from_arrays(self.bid_prices, self.bid_volumes, self.ask_prices, self.ask_volumes,
+                                         tick_size=self.tick_size, tape_mode=self.tape_mode,
+                                         tape_maxlen=self.tape_maxlen)
+
+    def process_order(self, quote, from_data, verbose):
+        return self.thaw().process_order(quote, from_data, verbose)
+
+    @property
+    def tape(self):
+        if self._book is None:
+            return ()
+        return self._book.tape
+
+    def get_best_bid(self):
+        if self._book is not None:
+            return self._book.get_best_bid()
+        return _to_decimal(self.bid_prices, -1)
+
+    def get_worst_bid(self):
+        if self._book is not None:
+            return self._book.get_worst_bid()
+        return _to_decimal(self.bid_prices, 0)
+
+    def get_best_ask(self):
+        if self._book is not None:
+            return self._book.get_best_ask()
+        return _to_decimal(self.ask_prices, 0)
+
+    def get_worst_ask(self):
+        if self._book is not None:
+            return self._book.get_worst_ask()
+        return _to_decimal(self.ask_prices, -1)
+
+    def depth_arrays(self, depth):
+        if self._book is not None:
+            return self._book.depth_arrays(depth)
+        n_bids = max(len(self.bid_prices) - depth, 0)
+        return self.bid_prices[n_bids:], self.bid_volumes[n_bids:], self.ask_prices[:depth], self.ask_volumes[:depth]
+
+    def __str__(self):
+        return str(self.thaw())
+
+
+def _to_decimal(prices, idx):
+    if len(prices) == 0:
+        return None
+    return Decimal(str(prices[idx]))
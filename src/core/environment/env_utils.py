@@ -1,6 +1,13 @@
 from src.core.environment.orderbook import OrderBook
+from src.core.environment.levelbook import LevelBook
 from decimal import Decimal
 
+# place_order takes the VWAP from the trades returned by process_order and nothing reads the tape of the snapshot
+# books, so the simulator doesn't keep one
+SIMULATOR_TAPE_MODE = None
+# Depth snapshots are aggregated by price level already, the simulator doesn't need per-order FIFO queues for them
+SIMULATOR_BOOK_TYPE = 'level'
+
 
 def split_book_to_orders(current_book, time, depth):
     """ Splits existing order book data into individual bid and ask orders """
@@ -38,14 +45,24 @@ def split_book_to_orders(current_book, time, depth):
     return bid_orders, ask_orders, all_orders
 
 
-def raw_to_order_book(current_book, time, depth):
-    """ Convert the raw LOB data into an OrderBook object """
+def raw_to_order_book(current_book, time, depth, tape_mode=SIMULATOR_TAPE_MODE, book_type=SIMULATOR_BOOK_TYPE):
+    """ Convert the raw LOB data into an OrderBook (book_type 'order') or a LevelBook (book_type 'level') """
+
+    tape_maxlen = depth if tape_mode == 'ring' else None
+    # the raw data holds asks ascending and bids descending, the books take both sides ascending
+    bid_prices, bid_volumes = current_book[2][:depth][::-1], current_book[3][:depth][::-1]
+    ask_prices, ask_volumes = current_book[0][:depth], current_book[1][:depth]
+    if book_type == 'level':
+        return LevelBook.from_arrays(bid_prices, bid_volumes, ask_prices, ask_volumes,
+                                     tape_mode=tape_mode, tape_maxlen=tape_maxlen)
+    elif book_type != 'order':
+        raise ValueError("book_type has to be either 'order' or 'level'")
 
     # transfer numerical data to orders
     _, _, all_orders = split_book_to_orders(current_book, time, depth)
-    order_book = OrderBook()
-    for orders in all_orders:
-        _, _ = order_book.process_order(orders, False, False)
+    order_book = OrderBook(tape_mode=tape_mode, tape_maxlen=tape_maxlen)
+    _, _ = order_book.process_orders(all_orders, False, False)
+    order_book.seed_depth_arrays(bid_prices, bid_volumes, ask_prices, ask_volumes)
 
     # place orders in OrderBook class
     """
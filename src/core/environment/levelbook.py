@@ -0,0 +1,172 @@
+import sys
+from decimal import Decimal
+from src.core.environment.orderbook import OrderBook
+from src.core.environment.ordertree import OrderTree
+from src.core.environment.leveltree import LevelTree
+
+
+class LevelBook(OrderBook):
+    '''
+    An OrderBook aggregated by price level. Depth snapshots only hold one quantity per price, so the market
+    side of the book is kept in LevelTrees instead of OrderTrees and matching takes quantity straight out of
+    the levels, without any Order objects or FIFO queues.
+    Orders placed into the book that don't fully trade rest in separate per-order OrderTrees (own_bids and
+    own_asks) if own_orders is set, otherwise their quantity is simply added to the level. Incoming orders
+    only match against the market levels and the best prices refer to the market levels.
+    '''
+
+    def __init__(self, tick_size=0.0001, tape_mode='deque', tape_maxlen=None, own_orders=True):
+        super(LevelBook, self).__init__(tick_size=tick_size, tape_mode=tape_mode, tape_maxlen=tape_maxlen)
+        self.bids = LevelTree()
+        self.asks = LevelTree()
+        self.own_orders = own_orders
+        self.own_bids = OrderTree() if own_orders else None
+        self.own_asks = OrderTree() if own_orders else None
+
+    @classmethod
+    def from_arrays(cls, bid_prices, bid_volumes, ask_prices, ask_volumes, tick_size=0.0001, tape_mode='deque',
+                    tape_maxlen=None):
+        '''
+        Builds the book from ascending price and volume arrays (one entry per level) with a bulk update per side.
+        A crossed or locked snapshot is matched like seeding one order per level (bids first, then the asks best
+        first), so the asks within the bids trade against them and only their rest is kept.
+        '''
+        lob = cls(tick_size=tick_size, tape_mode=tape_mode, tape_maxlen=tape_maxlen)
+        crossed = len(bid_prices) > 0 and len(ask_prices) > 0 and max(bid_prices) >= min(ask_prices)
+        for tree, prices, volumes in ((lob.bids, bid_prices, bid_volumes), (lob.asks, ask_prices, ask_volumes)):
+            prices = [Decimal(str(p)) for p in prices]
+            volumes = [Decimal(str(v)) for v in volumes]
+            if any(v <= 0 for v in volumes):
+                sys.exit('from_arrays() given level of quantity <= 0')
+            if tree is lob.asks and crossed:
+                lob._seed_crossed_asks(prices, volumes)
+            elif len(set(prices)) == len(prices):
+                tree.set_levels(prices, volumes)
+            else:
+                for price, volume in zip(prices, volumes):
+                    tree.add_quantity(price, volume)
+        # keep the counters where seeding one order per level would have left them
+        lob.time = lob.next_order_id = len(bid_prices) + len(ask_prices)
+        lob.seed_depth_arrays(bid_prices, bid_volumes, ask_prices, ask_volumes)
+        return lob
+
+    def _seed_crossed_asks(self, prices, volumes):
+        '''Adds the ask levels (best first) of a crossed snapshot, each matching the bid levels within its price'''
+        for trade_id, (price, quantity) in enumerate(sorted(zip(prices, volumes)), start=self.bids.depth):
+            quote = {'trade_id': trade_id}
+            while quantity > 0 and self.bids.depth > 0 and price <= self.bids.max_price():
+                quantity, _ = self._trade_level('bid', self.bids.max_price(), quantity, quote, False)
+            if quantity > 0:
+                self.asks.add_quantity(price, quantity)
+
+    def _trade_level(self, side, price, quantity_still_to_trade, quote, verbose):
+        '''Trades an incoming order against the level at price, the aggregated counterpart of process_order_list'''
+        tree = self.bids if side == 'bid' else self.asks
+        traded_quantity = min(quantity_still_to_trade, tree.price_map[price])
+        new_book_quantity = tree.remove_quantity(price, traded_quantity)
+        if new_book_quantity <= 0:
+            new_book_quantity = None
+        if verbose:
+            print(("TRADE: Time - {}, Price - {}, Quantity - {}, Matching TradeID - {}".format(self.time, price, traded_quantity, quote['trade_id'])))
+
+        transaction_record = {
+            'timestamp': self.time,
+            'price': price,
+            'quantity': traded_quantity,
+            'time': self.time
+        }
+        if side == 'bid':
+            transaction_record['party1'] = [None, 'bid', None, new_book_quantity]
+            transaction_record['party2'] = [quote['trade_id'], 'ask', None, None]
+        else:
+            transaction_record['party1'] = [None, 'ask', None, new_book_quantity]
+            transaction_record['party2'] = [quote['trade_id'], 'bid', None, None]
+
+        if self.tape is not None:
+            self.tape.append(transaction_record)
+        return quantity_still_to_trade - traded_quantity, transaction_record
+
+    def process_market_order(self, quote, verbose):
+        trades = []
+        quantity_to_trade = quote['quantity']
+        side = quote['side']
+        if side == 'bid':
+            while quantity_to_trade > 0 and self.asks.depth > 0:
+                quantity_to_trade, trade = self._trade_level('ask', self.asks.min_price(), quantity_to_trade, quote, verbose)
+                trades.append(trade)
+        elif side == 'ask':
+            while quantity_to_trade > 0 and self.bids.depth > 0:
+                quantity_to_trade, trade = self._trade_level('bid', self.bids.max_price(), quantity_to_trade, quote, verbose)
+                trades.append(trade)
+        else:
+            sys.exit('process_market_order() recieved neither "bid" nor "ask"')
+        return trades
+
+    def process_limit_order(self, quote, from_data, verbose):
+        order_in_book = None
+        trades = []
+        quantity_to_trade = quote['quantity']
+        side = quote['side']
+        price = quote['price']
+        if side == 'bid':
+            while self.asks.depth > 0 and price >= self.asks.min_price() and quantity_to_trade > 0:
+                quantity_to_trade, trade = self._trade_level('ask', self.asks.min_price(), quantity_to_trade, quote, verbose)
+                trades.append(trade)
+        elif side == 'ask':
+            while self.bids.depth > 0 and price <= self.bids.max_price() and quantity_to_trade > 0:
+                quantity_to_trade, trade = self._trade_level('bid', self.bids.max_price(), quantity_to_trade, quote, verbose)
+                trades.append(trade)
+        else:
+            sys.exit('process_limit_order() given neither "bid" nor "ask"')
+        # If volume remains, the order rests in the book
+        if quantity_to_trade > 0:
+            if not from_data:
+                quote['order_id'] = self.next_order_id
+            quote['quantity'] = quantity_to_trade
+            if self.own_orders:
+                self._own_tree(side).insert_order(quote)
+            else:
+                (self.bids if side == 'bid' else self.asks).add_quantity(price, quantity_to_trade)
+            order_in_book = quote
+        return trades, order_in_book
+
+    def _own_tree(self, side):
+        if side == 'bid':
+            return self.own_bids
+        elif side == 'ask':
+            return self.own_asks
+        else:
+            sys.exit('LevelBook given neither "bid" nor "ask"')
+
+    def cancel_order(self, side, order_id, time=None):
+        if time:
+            self.time = time
+        else:
+            self.update_time()
+        tree = self._own_tree(side)
+        if tree is not None and tree.order_exists(order_id):
+            tree.remove_order_by_id(order_id)
+
+    def modify_order(self, order_id, order_update, time=None):
+        if time:
+            self.time = time
+        else:
+            self.update_time()
+        order_update['order_id'] = order_id
+        order_update['timestamp'] = self.time
+        tree = self._own_tree(order_update['side'])
+        if tree is not None and tree.order_exists(order_id):
+            tree.update_order(order_update)
+
+    def _write_levels(self, tempfile):
+        tempfile.write("***Bids***\n")
+        for price, quantity in reversed(self.bids.price_map.items()):
+            tempfile.write('%s@%s\n' % (quantity, price))
+        tempfile.write("\n***Asks***\n")
+        for price, quantity in self.asks.price_map.items():
+            tempfile.write('%s@%s\n' % (quantity, price))
+        if self.own_orders:
+            tempfile.write("\n***Own Orders***\n")
+            for tree in (self.own_bids, self.own_asks):
+                for price, order_list in tree.price_map.items():
+                    tempfile.write('%s' % order_list)
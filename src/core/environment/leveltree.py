@@ -0,0 +1,91 @@
+import numpy as np
+from collections import namedtuple
+from sortedcontainers import SortedDict
+
+PriceLevel = namedtuple('PriceLevel', ['price', 'volume'])
+
+
+class LevelTree(object):
+    '''The aggregated counterpart of the OrderTree: one quantity per price, without Orders or OrderLists.
+    It offers the read interface of the OrderTree (prices, get_price_list(p).volume, min/max_price, depth
+    arrays), so it can replace an OrderTree wherever the book is only looked at level by level.
+    '''
+
+    def __init__(self):
+        self.price_map = SortedDict() # Dictionary containing price : quantity
+        self.prices = self.price_map.keys()
+        self.volume = 0 # Contains total quantity of all levels in tree
+        self.depth = 0 # Number of different prices in tree
+        self._depth_arrays = None # Cached (prices, volumes) float64 arrays of all levels, reset on every mutation
+
+    def __len__(self):
+        return self.depth
+
+    def get_price_list(self, price):
+        return PriceLevel(price, self.price_map[price])
+
+    def price_exists(self, price):
+        return price in self.price_map
+
+    def set_levels(self, prices, quantities):
+        '''Replaces all levels of the tree in one bulk update, prices have to be unique'''
+        self.price_map.clear()
+        self.price_map.update(zip(prices, quantities))
+        self.depth = len(self.price_map)
+        self.volume = sum(quantities)
+        self._depth_arrays = None
+
+    def add_quantity(self, price, quantity):
+        self._depth_arrays = None
+        if price not in self.price_map:
+            self.depth += 1
+            self.price_map[price] = quantity
+        else:
+            self.price_map[price] += quantity
+        self.volume += quantity
+
+    def remove_quantity(self, price, quantity):
+        '''Takes quantity out of a level, the level is removed once empty'''
+        self._depth_arrays = None
+        new_quantity = self.price_map[price] - quantity
+        if new_quantity > 0:
+            self.price_map[price] = new_quantity
+        else:
+            self.depth -= 1
+            del self.price_map[price]
+        self.volume -= quantity
+        return new_quantity
+
+    def insert_orders(self, quotes):
+        '''Adds the quantities of resting quotes to their levels (used by OrderBook.process_orders)'''
+        for quote in quotes:
+            self.add_quantity(quote['price'], quote['quantity'])
+
+    def invalidate_depth(self):
+        self._depth_arrays = None
+
+    def set_depth_arrays(self, prices, volumes):
+        '''Seeds the depth cache with ascending float64 arrays that are known to match the tree'''
+        prices.flags.writeable = False
+        volumes.flags.writeable = False
+        self._depth_arrays = (prices, volumes)
+
+    def depth_arrays(self):
+        '''Returns cached float64 arrays of the prices (ascending) and volumes of all levels'''
+        if self._depth_arrays is None:
+            prices = np.fromiter(self.price_map.keys(), dtype=np.float64, count=self.depth)
+            volumes = np.fromiter(self.price_map.values(), dtype=np.float64, count=self.depth)
+            self.set_depth_arrays(prices, volumes)
+        return self._depth_arrays
+
+    def max_price(self):
+        if self.depth > 0:
+            return self.prices[-1]
+        else:
+            return None
+
+    def min_price(self):
+        if self.depth > 0:
+            return self.prices[0]
+        else:
+            return None
@@ -1,3 +1,4 @@
+import copy
 import random
 import gym
 import math
@@ -8,7 +9,8 @@ from gym.utils import seeding
 from decimal import Decimal
 from abc import ABC
 
-from src.core.environment.limit_orders_setup.execution_algo import TWAPAlgo, RLAlgo
+from src.core.environment.limit_orders_setup.execution_algo import TWAPAlgo, RLAlgo, EVENT_TYPES, \
+    sample_placements
 
 DEFAULT_ENV_CONFIG = {'obs_config': {"lob_depth": 5,
                                      "nr_of_lobs": 5,
@@ -24,8 +26,7 @@ DEFAULT_ENV_CONFIG = {'obs_config': {"lob_depth": 5,
                                        'vol_high': 1000,
                                        'no_slices_low': 5,
                                        'no_slices_high': 10,
-                                       'bucket_func': lambda no_of_slices: (sorted([round(random.uniform(0, 1), 2) for _
-                                                                                    in range(no_of_slices)])),
+                                       'bucket_func': sample_placements,
                                        'rand_bucket_low': 0,
                                        'rand_bucket_high': 0},
                       'start_config': {'hour_low': 1,
@@ -41,25 +42,18 @@ DEFAULT_ENV_CONFIG = {'obs_config': {"lob_depth": 5,
 
 
 def lob_to_numpy(lob, depth, norm_price=None, norm_vol_bid=None, norm_vol_ask=None):
-    bid_prices = lob.bids.prices[-depth:]
-    bid_volumes = [float(lob.bids.get_price_list(p).volume) for p in bid_prices]
-    bid_prices = [float(bids) for bids in bid_prices]
-    ask_prices = lob.asks.prices[:depth]
-    ask_volumes = [float(lob.asks.get_price_list(p).volume) for p in ask_prices]
-    ask_prices = [float(asks) for asks in ask_prices]
+    bid_prices, bid_volumes, ask_prices, ask_volumes = lob.depth_arrays(depth)
 
     if norm_price:
-        # have to make sure bid_prices and ask_prices are lists
-        prices = (np.array(bid_prices + ask_prices) / float(norm_price))
+        prices = np.concatenate((bid_prices, ask_prices)) / float(norm_price)
     else:
-        prices = np.array(bid_prices + ask_prices)
+        prices = np.concatenate((bid_prices, ask_prices))
 
     if norm_vol_bid and norm_vol_ask:
-        volumes = np.concatenate((np.array(bid_volumes) / float(norm_vol_bid),
-                                  np.array(ask_volumes) / float(norm_vol_ask)), axis=0)
+        volumes = np.concatenate((bid_volumes / float(norm_vol_bid),
+                                  ask_volumes / float(norm_vol_ask)), axis=0)
     else:
-        volumes = np.concatenate((np.array(bid_volumes),
-                                  np.array(ask_volumes)), axis=0)
+        volumes = np.concatenate((bid_volumes, ask_volumes), axis=0)
     return prices, volumes
 
 def min_max_rescaling(array):
@@ -73,12 +67,14 @@ conv2date = lambda x: datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f')
 
 class BaseEnv(gym.Env, ABC):
 
-    def __init__(self, broker, action_space, config={}):
+    def __init__(self, broker, action_space, config={}, benchmark_cache=None):
 
         self.ui = None
         self.ui_epoch = 0
 
         self.broker = broker
+        # optional BenchmarkCache, benchmark episodes found in it are replayed instead of simulated
+        self.benchmark_cache = benchmark_cache
         self.config = self.add_default_dict(config)
         self._validate_config()
         self.reset_counter = 0
@@ -115,7 +111,12 @@ class BaseEnv(gym.Env, ABC):
 
         # reset the broker with the new benchmark_algo
         self.broker.reset(self.broker.benchmark_algo)
-        self.event_bmk, self.done_bmk, self.lob_bmk = self.broker.simulate_to_next_event(self.broker.benchmark_algo)
+        self._reset_benchmark_cache()
+        if self.bmk_replay is not None:
+            self._replay_benchmark_step()
+        else:
+            self.event_bmk, self.done_bmk, self.lob_bmk = self.broker.simulate_to_next_event(self.broker.benchmark_algo)
+            self._record_benchmark_step(n_logs=0, bucket_bound=False)
 
         # Declare the RLAlgo
         self.broker.rl_algo = RLAlgo(benchmark_algo=self.broker.benchmark_algo,
@@ -216,8 +217,16 @@ class BaseEnv(gym.Env, ABC):
         self.event_time_prev = self.event_bmk['time']
         self.bucket_time_prev = self.bucket_time
 
-        self.event_bmk, self.done_bmk, self.lob_bmk = self._step_algo(algo_type='benchmark')
-        self.event_rl, self.done_rl, self.lob_rl = self._step_algo(algo_type='rl', volume=vol_to_trade)
+        n_logs_bmk = len(self.broker.trade_logs["benchmark_algo"])
+        self.bucket_bound_bmk = False
+        if self.bmk_replay is not None:
+            # the benchmark episode is cached, so only the RL algo has to be simulated
+            self._replay_benchmark_step()
+            self._step_algos(volume=vol_to_trade, benchmark=False)
+        else:
+            self._step_algos(volume=vol_to_trade)
+        if self.bmk_replay is None:
+            self._record_benchmark_step(n_logs=n_logs_bmk, bucket_bound=self.bucket_bound_bmk)
 
         if self.done_bmk != self.done_rl:
             raise ValueError("Benchmark and RL algo have finished at different times !!!")
@@ -241,7 +250,7 @@ class BaseEnv(gym.Env, ABC):
         if not self.done:
             self.bucket_idx = self.broker.rl_algo.bucket_idx
             t = self.broker.benchmark_algo.algo_events[self.state_idx]
-            if t in self.broker.benchmark_algo.buckets.bucket_bounds:
+            if self.broker.benchmark_algo.event_table['type'][self.state_idx] == EVENT_TYPES.index('bucket_bound'):
                 raise ValueError("Can't build an observation at a bucket end!")
             self.state = self._build_observation_at_event(event_time=t)
         else:
@@ -255,40 +264,110 @@ class BaseEnv(gym.Env, ABC):
 
         return self.state, self.reward, self.done, self.info
 
-    def _step_algo(self, algo_type, volume=None):
-
+    def _step_algos(self, volume, benchmark=True):
+        """ Advances the RL algo (placing an order of 'volume' lots) and the benchmark algo to their next order
+        placement, the events of both are processed by the broker in time order (see Broker.step_lockstep) """
+
+        rl = {'algo': self.broker.rl_algo, 'event': self.event_rl, 'done': self.done_rl, 'lob': self.lob_rl,
+              'volume': volume}
+        bmk = {'algo': self.broker.benchmark_algo, 'event': self.event_bmk, 'done': self.done_bmk, 'lob': self.lob_bmk}
+        self.broker.step_lockstep([bmk, rl] if benchmark else [rl])
+        if benchmark:
+            self.event_bmk, self.done_bmk, self.lob_bmk = bmk['event'], bmk['done'], bmk['lob']
+            if bmk['bucket_bound']:
+                self._end_bucket('benchmark', self.event_bmk)
+        self.event_rl, self.done_rl, self.lob_rl = rl['event'], rl['done'], rl['lob']
+        if rl['bucket_bound']:
+            self._end_bucket('rl', self.event_rl)
+
+    def fork(self):
+        """ Returns a copy of the env at its current state, stepping it doesn't change this env (see Broker.fork).
+        The copy doesn't record the benchmark episode for the benchmark cache. """
+
+        clone = copy.copy(self)
+        clone.broker = self.broker.fork()
+        clone.mid_pxs = list(self.mid_pxs)
+        clone.bmk_record = None
+        clone.np_random = copy.deepcopy(self.np_random)
+        return clone
+
+    def evaluate_actions(self, actions, horizon='step'):
+        """ Evaluates alternative actions from the current state, each on its own fork of the env, so the env itself
+        is unchanged. With horizon 'step' each action is stepped once, with 'bucket' it is repeated until the bucket
+        of the RL algo is closed or the episode is done. Returns (state, reward, done, info) for each action, the
+        reward summed over the steps. """
+
+        if horizon not in ('step', 'bucket'):
+            raise ValueError("horizon must be 'step' or 'bucket', got {}".format(horizon))
+        results = []
+        for action in actions:
+            env = self.fork()
+            bucket_idx = env.broker.rl_algo.bucket_idx
+            total_reward = 0
+            while True:
+                state, reward, done, info = env.step(action)
+                total_reward += reward
+                if horizon == 'step' or done or env.broker.rl_algo.bucket_idx != bucket_idx:
+                    break
+            results.append((state, total_reward, done, info))
+        return results
+
+    def _end_bucket(self, algo_type, event):
         if algo_type == 'benchmark':
-            algo = self.broker.benchmark_algo
-            event, done, lob = self.event_bmk, self.done_bmk, self.lob_bmk
+            self.bucket_bound_bmk = True
+            self.event_bmk_bucket = event
+            self.bucket_time_bmk = self.broker.trade_logs["benchmark_algo"][-1]["timestamp"]
+            self.state_idx += 1
         else:
-            algo = self.broker.rl_algo
-            event, done, lob = self.event_rl, self.done_rl, self.lob_rl
-
-        _ = self.broker.place_next_order(algo, event, done, lob, volume)
-        event, done, lob = self.broker.simulate_to_next_event(algo)
-
-        if event['type'] == 'bucket_bound':
-            done = self.broker.place_next_order(algo, event, done, lob)
-            if not done:
-                event, done, lob = self.broker.simulate_to_next_event(algo)
-            if algo_type == 'benchmark':
-                self.event_bmk_bucket = event
-                self.bucket_time_bmk = self.broker.trade_logs["benchmark_algo"][-1]["timestamp"]
-                self.state_idx += 1
-            else:
-                self.event_rl_bucket = event
-                self.bucket_time_rl = self.broker.trade_logs["rl_algo"][-1]["timestamp"]
-
-        return event, done, lob
+            self.event_rl_bucket = event
+            self.bucket_time_rl = self.broker.trade_logs["rl_algo"][-1]["timestamp"]
+
+    def _reset_benchmark_cache(self):
+        """ Looks the new benchmark episode up in the cache, it is either replayed or recorded while simulated """
+
+        self.bmk_replay, self.bmk_record, self.bmk_step_idx = None, None, 0
+        if self.benchmark_cache is None:
+            return
+        self.bmk_key = self.benchmark_cache.key(self.broker.benchmark_algo, self.broker.data_feed,
+                                                self.broker.delete_vol)
+        episode = self.benchmark_cache.get(self.bmk_key)
+        if episode is not None:
+            self.bmk_replay = episode['steps']
+        else:
+            self.bmk_record = []
+
+    def _record_benchmark_step(self, n_logs, bucket_bound):
+        """ Records the outcome of a benchmark step and stores the episode in the cache once it is done """
+
+        if self.bmk_record is None:
+            return
+        self.bmk_record.append({'event': self.event_bmk,
+                                'done': self.done_bmk,
+                                'bucket_bound': bucket_bound,
+                                'logs': [dict(log) for log in self.broker.trade_logs["benchmark_algo"][n_logs:]],
+                                'state': self.broker.benchmark_algo.get_state()})
+        if self.done_bmk:
+            self.benchmark_cache.put(self.bmk_key, self.bmk_record)
+            self.bmk_record = None
+
+    def _replay_benchmark_step(self):
+        """ Replays the next step of a cached benchmark episode instead of simulating it """
+
+        step = self.bmk_replay[self.bmk_step_idx]
+        self.bmk_step_idx += 1
+        self.event_bmk, self.done_bmk, self.lob_bmk = dict(step['event']), step['done'], None
+        self.broker.trade_logs["benchmark_algo"].extend(dict(log) for log in step['logs'])
+        self.broker.benchmark_algo.set_state(step['state'])
+        if step['bucket_bound']:
+            self._end_bucket('benchmark', self.event_bmk)
 
     def infer_volume_from_action(self, action):
         """ Logic for inferring the volume from the action placed in the env """
         current_executing_volume = self.broker.rl_algo.volumes_per_trade[self.broker.rl_algo.bucket_idx][self.broker.rl_algo.order_idx]
         vol_to_add = Decimal(str(action)) * \
-                       self.broker.benchmark_algo.volumes_per_trade_default[self.broker.rl_algo.bucket_idx][self.broker.rl_algo.order_idx]# We add {0.8,1,1.2}*TWAP's volume
-        vol_to_trade = current_executing_volume + vol_to_add
-        factor = 10 ** (- self.broker.benchmark_algo.tick_size.as_tuple().exponent)
-        vol_to_trade = Decimal(str(math.floor(vol_to_trade * factor) / factor))
+                       int(self.broker.benchmark_algo.volumes_per_trade_default[self.broker.rl_algo.bucket_idx][self.broker.rl_algo.order_idx])# We add {0.8,1,1.2}*TWAP's volume
+        # the volumes are in lots, so rounding down to the lot size is rounding down to whole lots
+        vol_to_trade = int(current_executing_volume) + math.floor(vol_to_add)
         if vol_to_trade > self.broker.rl_algo.bucket_vol_remaining[self.broker.rl_algo.bucket_idx]:
             vol_to_trade = self.broker.rl_algo.bucket_vol_remaining[self.broker.rl_algo.bucket_idx]
         return vol_to_trade
@@ -331,15 +410,15 @@ class BaseEnv(gym.Env, ABC):
                                                 dtype=np.float64)
 
     def _build_observation_at_event(self, event_time):
-        """ Helper to pass only copy of datafeed/make sure datafeed is only affected by broker class """
+        """ Helper to build the observation with the broker's observation cursor, so the algo cursors are untouched """
 
-        obs = self.build_observation(event_time, self.broker.data_feed)
+        obs = self.build_observation(event_time, self.broker.obs_cursor)
         return obs
 
     def build_observation(self, event_time, data_feed):
         # Build observation using the history of order book data / data generated by the RL algo
 
-        data_feed.reset(time=event_time.strftime("%Y-%m-%d %H:%M:%S.%f"))
+        data_feed.reset(time=event_time)
         past_dts, past_lobs = data_feed.past_lob_snapshots(no_of_past_lobs=self.config['obs_config']['nr_of_lobs'])
 
         # check if we already have enough data collected in our hist
@@ -393,7 +472,7 @@ class BaseEnv(gym.Env, ABC):
             obs = np.concatenate((prices, volumes))
 
             obs = np.concatenate((obs,
-                                  np.array([self.broker.rl_algo.bucket_vol_remaining[self.bucket_idx]]),
+                                  np.array([self.broker.rl_algo.to_float_volume(self.broker.rl_algo.bucket_vol_remaining[self.bucket_idx])]),
                                   # vol left to trade in the bucket
                                   np.array([self.broker.rl_algo.no_of_slices - self.broker.rl_algo.order_idx - 1])),
                                  axis=0)  # orders left to place in the bucket
@@ -591,7 +670,7 @@ class NarrowTradeLimitEnvDiscrete(BaseEnv):
     def reward_func(self):
         """ Reward at end of each bucket as total $ improvement (VWAP improvement times the volume executed)"""
         reward = 0
-        vol = float(np.sum(self.broker.benchmark_algo.volumes_per_trade[self.bucket_idx]))
+        vol = float(self.broker.benchmark_algo.to_float_volume(np.sum(self.broker.benchmark_algo.volumes_per_trade[self.bucket_idx])))
         try:
             if self.bucket_time != self.bucket_time_prev:
                 vwap_bmk, vwap_rl = self.broker.calc_vwap_from_logs(start_date=self.bucket_time_prev,
@@ -0,0 +1,265 @@
+import numpy as np
+from datetime import datetime, timedelta
+
+from src.core.environment.limit_orders_setup.execution_algo import TWAPAlgo, EVENT_TYPES
+
+# remaining volumes below this (relative to the order) are float noise of the fills, not unexecuted volume
+VOLUME_EPS = 1e-9
+# snapshot cells (rows x levels) gathered at once for the order windows, bounds the memory of the batch simulation
+BLOCK_CELLS = 2 ** 20
+MIN_BLOCK_ROWS = 16
+
+
+def split_raw_data(data, depth):
+    """ Splits the raw data rows of a feed into the timestamps and the best-first price/volume arrays of both sides """
+
+    times = data[:, 0]
+    ask_prices = data[:, 1:1 + depth]
+    ask_volumes = data[:, 1 + depth:1 + 2 * depth]
+    bid_prices = data[:, 1 + 2 * depth:1 + 3 * depth]
+    bid_volumes = data[:, 1 + 3 * depth:1 + 4 * depth]
+    return times, ask_prices, ask_volumes, bid_prices, bid_volumes
+
+
+def sweep_cost(prices, volumes, quantities):
+    """ Cost of trading 'quantities' (one per row) against the best-first levels of each row, the levels are along the
+    last axis """
+
+    cum_volumes = np.cumsum(volumes, axis=-1)
+    taken = np.clip(quantities[..., None] - (cum_volumes - volumes), 0, volumes)
+    return np.sum(taken * prices, axis=-1)
+
+
+def fill_rows(prices, volumes, quantity, limits=None, side='bid', available_before=0):
+    """ Fills of an order re-placed on consecutive snapshot rows until it is executed, the vectorized counterpart of
+    placing the remaining order of the Broker on every LOB. Each row only offers its own levels (up to the limit
+    price of that row for limit orders), so the volume executed up to row k is min(quantity, cumsum(available)).
+
+    The rows can be stacked for several orders (prices and volumes of shape (orders, rows, levels), one quantity and
+    available_before per order), available_before is the volume offered by the rows of the order before these ones.
+
+    Returns the executed volume and cost of every row and the volume offered up to the last row.
+    """
+
+    if limits is None:
+        available = np.sum(volumes, axis=-1)
+    elif side == 'bid':
+        available = np.sum(volumes * (prices <= limits[..., None]), axis=-1)
+    else:
+        available = np.sum(volumes * (prices >= limits[..., None]), axis=-1)
+    quantity = np.asarray(quantity, dtype=np.float64)[..., None]
+    available_before = np.broadcast_to(np.asarray(available_before, dtype=np.float64)[..., None], quantity.shape)
+    cum_available = np.cumsum(np.concatenate([available_before, available], axis=-1), axis=-1)
+    filled = np.diff(np.minimum(quantity, cum_available), axis=-1)
+    # rows after the order was fully executed don't trade anymore
+    filled[filled <= VOLUME_EPS * np.maximum(quantity, 1)] = 0
+    cost = np.zeros(filled.shape)
+    traded = filled > 0
+    cost[traded] = sweep_cost(prices[traded], volumes[traded], filled[traded])
+    return filled, cost, cum_available[..., -1]
+
+
+def chase_limits(best_prices, tick_size, side='bid', limits_before=None):
+    """ Limit prices of a passive order following the market: placed one tick behind the best price of the first row
+    and moved to one tick behind the best price whenever the market moves away (see Broker._update_remaining_orders).
+
+    The rows are along the last axis, best_prices can be stacked for several orders (one tick_size per order) and
+    limits_before are the limits of orders which are already in the market before the first row.
+    """
+
+    sign = 1 if side == 'bid' else -1
+    best = np.atleast_2d(best_prices)
+    tick_size = np.broadcast_to(np.asarray(tick_size, dtype=np.float64), best.shape[:-1])
+    if limits_before is None:
+        limits_before = np.full(best.shape[:-1], -sign * np.inf)
+    # the Broker works on the decimal prices, rounding gives the float of the exact decimal (for up to 10 decimals)
+    behind = np.round(best - sign * tick_size[:, None], 10)
+    limits = sign * np.maximum.accumulate(sign * np.column_stack([limits_before, behind]), axis=1)
+    # the running max is only exact if the market never moves by less than a tick, otherwise follow it row by row
+    away = sign * best > sign * limits[:, :-1]
+    row_by_row = np.flatnonzero(np.any(away & (sign * behind < sign * limits[:, :-1]), axis=1))
+    limits = limits[:, 1:]
+    if len(row_by_row):
+        previous = np.asarray(limits_before)[row_by_row]
+        for k in range(best.shape[1]):
+            previous = np.where(sign * previous < sign * best[row_by_row, k], behind[row_by_row, k], previous)
+            limits[row_by_row, k] = previous
+    return limits.reshape(np.shape(best_prices))
+
+
+def fill_windows(prices, volumes, best_prices, start_rows, end_rows, quantities, tick_sizes, limit_orders,
+                 side='bid'):
+    """ Executed volume and cost of orders re-placed on the rows start_rows..end_rows - 1 of the snapshot arrays until
+    they are executed, one entry per order: limit orders chase the best price with chase_limits(), the others trade
+    at market. The windows of all orders are gathered in blocks of rows and filled at once with fill_rows().
+    """
+
+    sign = 1 if side == 'bid' else -1
+    n_rows, depth = volumes.shape
+    executed = np.zeros(len(start_rows))
+    cost = np.zeros(len(start_rows))
+    available_before = np.zeros(len(start_rows))
+    limits_before = np.full(len(start_rows), -sign * np.inf)
+    next_rows = np.array(start_rows)
+    active = np.flatnonzero(next_rows < end_rows)
+    while len(active):
+        n_block = max(MIN_BLOCK_ROWS, BLOCK_CELLS // (len(active) * depth))
+        n_block = min(n_block, int(np.max(end_rows[active] - next_rows[active])))
+        rows = next_rows[active, None] + np.arange(n_block)
+        in_window = rows < end_rows[active, None]
+        rows = np.minimum(rows, n_rows - 1)
+        limits = chase_limits(best_prices[rows], tick_sizes[active], side, limits_before[active])
+        limits[~limit_orders[active]] = sign * np.inf
+        filled, block_cost, available_before[active] = fill_rows(prices[rows], volumes[rows] * in_window[..., None],
+                                                                 quantities[active], limits, side,
+                                                                 available_before[active])
+        executed[active] += filled.sum(axis=1)
+        cost[active] += block_cost.sum(axis=1)
+        limits_before[active] = limits[:, -1]
+        next_rows[active] += n_block
+        active = active[(next_rows[active] < end_rows[active]) & (available_before[active] < quantities[active])]
+    return executed, cost
+
+
+def _simulate_side(times, prices, volumes, best_prices, algos, side, delete_vol):
+    """ Simulates TWAPAlgos trading on the same side at once: the event tables are stacked into (algo, event) matrices
+    and the k-th events of all algos are filled together with fill_windows() """
+
+    n_rows = len(times)
+    n_algos = len(algos)
+    n_events = max(len(algo.event_table) for algo in algos)
+    max_buckets = max(algo.buckets.n_buckets for algo in algos)
+    placement = EVENT_TYPES.index('order_placement')
+
+    # one padding column (type -1) at the end, so that every event has a next one
+    event_types = np.full((n_algos, n_events + 1), -1)
+    event_times = np.full((n_algos, n_events + 1), np.inf)
+    event_buckets = np.zeros((n_algos, n_events + 1), dtype=int)
+    event_orders = np.zeros((n_algos, n_events + 1), dtype=int)
+    # one padding bucket, so that the volume of the last bucket bound can be moved to the (unused) next bucket
+    volumes_per_trade = np.zeros((n_algos, max_buckets + 1, max(algo.no_of_slices for algo in algos)))
+    bucket_vol_remaining = np.zeros((n_algos, max_buckets + 1))
+    for i, algo in enumerate(algos):
+        table = algo.event_table
+        event_types[i, :len(table)] = table['type']
+        event_times[i, :len(table)] = table['time'] / 1e3
+        event_buckets[i, :len(table)] = table['bucket_idx']
+        event_orders[i, :len(table)] = np.maximum(table['order_idx'], 0)
+        volumes_per_trade[i, :algo.buckets.n_buckets, :algo.no_of_slices] = \
+            algo.to_float_volume(algo.volumes_per_trade_default)
+        bucket_vol_remaining[i, :algo.buckets.n_buckets] = algo.to_float_volume(algo.bucket_volumes)
+    n_buckets = np.array([algo.buckets.n_buckets for algo in algos])
+    tick_sizes = np.array([float(algo.tick_size) for algo in algos])
+
+    event_rows = np.searchsorted(times, event_times, side='right')
+    start_rows = np.minimum(event_rows[:, :-1], n_rows - 1)
+    # orders stay in the market until they are executed or the next event is reached, market orders at the bucket
+    # bounds are re-placed until the first order placement of the next bucket (or the end of the data)
+    placement_ends = np.minimum(event_rows[:, 1:], n_rows)
+    bound_ends = np.searchsorted(times, event_times[:, 1:], side='left')
+    last_bound = event_types[:, 1:] == -1
+    bound_ends[last_bound] = start_rows[last_bound] + 1 if delete_vol else n_rows
+    end_rows = np.maximum(np.where(event_types[:, :-1] == placement, placement_ends, bound_ends), start_rows + 1)
+
+    bucket_executed = np.zeros((n_algos, max_buckets + 1))
+    bucket_cost = np.zeros((n_algos, max_buckets + 1))
+    unexecuted_vol = np.zeros(n_algos)
+    algo_idx = np.arange(n_algos)
+    for k in range(n_events):
+        buckets, orders = event_buckets[:, k], event_orders[:, k]
+        is_placement = event_types[:, k] == placement
+        quantities = np.where(is_placement, volumes_per_trade[algo_idx, buckets, orders],
+                              bucket_vol_remaining[algo_idx, buckets])
+        live = np.where(is_placement, quantities > 0, quantities > VOLUME_EPS * np.maximum(quantities, 1))
+        a = np.flatnonzero(live & (event_types[:, k] >= 0))
+        b, o, quantities, is_placement = buckets[a], orders[a], quantities[a], is_placement[a]
+        filled, cost = fill_windows(prices, volumes, best_prices, start_rows[a, k], end_rows[a, k], quantities,
+                                    tick_sizes[a], is_placement, side)
+        bucket_executed[a, b] += filled
+        bucket_cost[a, b] += cost
+        bucket_vol_remaining[a, b] -= filled
+        remaining = quantities - filled
+        left = remaining > VOLUME_EPS * np.maximum(quantities, 1)
+        # unexecuted volume of a limit order is added to the next order of the bucket
+        to_next_order = left & is_placement & (event_types[a, k + 1] == placement)
+        volumes_per_trade[a[to_next_order], b[to_next_order], o[to_next_order] + 1] += remaining[to_next_order]
+        to_next_bucket = left & ~is_placement
+        if delete_vol:
+            unexecuted_vol[a[to_next_bucket]] += remaining[to_next_bucket]
+        else:
+            # move the volume to the next bucket
+            to_next_bucket &= b + 1 < n_buckets[a]
+            moved, b_moved, remaining = a[to_next_bucket], b[to_next_bucket], remaining[to_next_bucket]
+            volumes_per_trade[moved, b_moved + 1, 0] += remaining
+            bucket_vol_remaining[moved, b_moved] -= remaining
+            bucket_vol_remaining[moved, b_moved + 1] += remaining
+    return [(bucket_executed[i, :n_buckets[i]], bucket_cost[i, :n_buckets[i]], unexecuted_vol[i])
+            for i in range(n_algos)]
+
+
+def simulate_twap_algos(data_feed, algos, delete_vol=False):
+    """ Simulates already constructed TWAPAlgos on the data of a feed directly from the snapshot arrays, all episodes
+    (algos) of a side at once: the loop only runs over the event columns of the stacked event tables.
+
+        The result is the one of the event driven Broker (stepped as in the envs or Broker.simulate_algos): limit
+        orders are placed one tick behind the best price at each order placement and follow the market until the
+        next event, unexecuted volume is added to the next order of the bucket and the remaining bucket volume is
+        traded with a market order at each bucket bound.
+
+        Returns a dict with the arrays 'vwap', 'executed_volume', 'fill_ratio' and 'unexecuted_volume' (one entry
+        per algo) and the lists 'bucket_vwaps' and 'bucket_executed_volumes' (one array per algo).
+    """
+
+    times, ask_prices, ask_volumes, bid_prices, bid_volumes = split_raw_data(data_feed.data, data_feed.lob_depth)
+
+    algo_results = [None] * len(algos)
+    for trade_direction, side, prices, volumes, best_prices in ((1, 'bid', ask_prices, ask_volumes, bid_prices[:, 0]),
+                                                                (-1, 'ask', bid_prices, bid_volumes, ask_prices[:, 0])):
+        idx = [i for i, algo in enumerate(algos) if algo.trade_direction == trade_direction]
+        if idx:
+            side_results = _simulate_side(times, prices, volumes, best_prices, [algos[i] for i in idx], side,
+                                          delete_vol)
+            for i, algo_result in zip(idx, side_results):
+                algo_results[i] = algo_result
+
+    results = {'vwap': [], 'executed_volume': [], 'fill_ratio': [], 'unexecuted_volume': [],
+               'bucket_vwaps': [], 'bucket_executed_volumes': []}
+    for algo, (bucket_executed, bucket_cost, unexecuted_vol) in zip(algos, algo_results):
+        executed_volume = bucket_executed.sum()
+        results['vwap'].append(bucket_cost.sum() / executed_volume if executed_volume > 0 else 0)
+        results['executed_volume'].append(executed_volume)
+        results['fill_ratio'].append(executed_volume / float(algo.volume))
+        results['unexecuted_volume'].append(unexecuted_vol)
+        results['bucket_vwaps'].append(np.divide(bucket_cost, bucket_executed, out=np.zeros(len(bucket_cost)),
+                                                 where=bucket_executed > 0))
+        results['bucket_executed_volumes'].append(bucket_executed)
+
+    for k in ('vwap', 'executed_volume', 'fill_ratio', 'unexecuted_volume'):
+        results[k] = np.array(results[k])
+    return results
+
+
+def simulate_twap_batch(data_feed, start_times, exec_times, volumes, no_of_slices, bucket_placement_func,
+                        trade_direction=1, rand_bucket_bounds_width=None, delete_vol=False):
+    """ Batch TWAP simulator for benchmark tables: builds one TWAPAlgo per start time (exec_times in minutes, volumes
+    and no_of_slices can be scalars or one value per start time) and simulates all of them at once on the snapshot
+    arrays of the feed with simulate_twap_algos(). The algos draw the random order placements of the episodes (from
+    cached schedule templates), so the results are the ones of the same algos run by the Broker. """
+
+    n = len(start_times)
+    exec_times, volumes, no_of_slices = (np.broadcast_to(np.asarray(x, dtype=object), (n,))
+                                         for x in (exec_times, volumes, no_of_slices))
+    algos = []
+    for start_time, exec_time, volume, slices in zip(start_times, exec_times, volumes, no_of_slices):
+        if isinstance(start_time, datetime):
+            start_time = start_time.strftime('%Y-%m-%d %H:%M:%S')
+        end_time = str(datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S') + timedelta(minutes=exec_time))
+        algos.append(TWAPAlgo(trade_direction=trade_direction,
+                              volume=volume,
+                              no_of_slices=slices,
+                              bucket_placement_func=bucket_placement_func,
+                              start_time=start_time,
+                              end_time=end_time,
+                              rand_bucket_bounds_width=rand_bucket_bounds_width,
+                              broker_data_feed=data_feed))
+    return simulate_twap_algos(data_feed, algos, delete_vol)
@@ -0,0 +1,108 @@
+import os
+import pickle
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+from src.core.environment.limit_orders_setup.trade_log import TradeLog
+
+
+class BenchmarkCache:
+    """ Cache of simulated benchmark episodes.
+
+        The execution of the benchmark (TWAP) algo only depends on its parameters, its sampled schedule and the data,
+        so an episode is keyed by those and recorded step by step (event, trade logs and algo state after every env
+        step). An env replaying a cached episode doesn't have to simulate the benchmark at all.
+        Episodes are kept in memory (LRU) and, if a cache_dir is given, as pickle files on disk, so a directory can be
+        shared between workers. Files are written atomically, concurrent workers at worst simulate an episode twice.
+
+        Args:
+            maxsize (int): max number of episodes kept in memory
+            cache_dir (str): directory for the pickled episodes (default: None, memory only)
+    """
+
+    def __init__(self, maxsize=128, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self._episodes = OrderedDict()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(algo, data_feed, delete_vol=False):
+        """ Returns the key of the episode of a benchmark algo, built from its parameters, its schedule (the bucket
+         bounds and execution times sampled from bucket_placement_func) and the fingerprint of the data """
+
+        params = (type(algo).__name__,
+                  algo.trade_direction,
+                  str(algo.volume),
+                  algo.no_of_slices,
+                  str(algo.start_time),
+                  str(algo.end_time),
+                  str(algo.tick_size),
+                  str(algo.lot_size),
+                  [str(t) for t in algo.buckets.bucket_bounds],
+                  [[str(t) for t in bucket] for bucket in algo.execution_times],
+                  bool(delete_vol),
+                  data_feed.fingerprint())
+        return hashlib.sha1(repr(params).encode()).hexdigest()
+
+    def get(self, key):
+        """ Returns the recorded episode of a key or None """
+
+        if key in self._episodes:
+            self._episodes.move_to_end(key)
+            return self._episodes[key]
+        if self.cache_dir is not None:
+            try:
+                with open(self._file(key), 'rb') as f:
+                    episode = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                return None
+            self._remember(key, episode)
+            return episode
+        return None
+
+    def put(self, key, steps):
+        """ Stores the recorded steps of a finished episode """
+
+        episode = {'steps': steps,
+                   'event_times': [step['event']['time'] for step in steps],
+                   'bucket_vwaps': self._bucket_vwaps(steps)}
+        self._remember(key, episode)
+        if self.cache_dir is not None:
+            fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(episode, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self._file(key))
+        return episode
+
+    def clear(self):
+        self._episodes.clear()
+
+    def __len__(self):
+        return len(self._episodes)
+
+    def _remember(self, key, episode):
+        self._episodes[key] = episode
+        self._episodes.move_to_end(key)
+        if len(self._episodes) > self.maxsize:
+            self._episodes.popitem(last=False)
+
+    def _file(self, key):
+        return os.path.join(self.cache_dir, '{}.pkl'.format(key))
+
+    @staticmethod
+    def _bucket_vwaps(steps):
+        """ VWAP of every bucket from the running sums of the logs of the episode, the trades of a step closing a bucket
+        all belong to the closed bucket """
+
+        trade_log = TradeLog()
+        bucket_vwaps = []
+        bucket_start = 0
+        for step in steps:
+            trade_log.extend(step['logs'])
+            if step['bucket_bound']:
+                bucket_vwaps.append(trade_log.vwap_rows(bucket_start, len(trade_log)))
+                bucket_start = len(trade_log)
+        return bucket_vwaps
@@ -1,8 +1,23 @@
 import copy
+import heapq
 import numpy as np
 from abc import ABC
+from collections import deque
+from itertools import count
 from datetime import datetime
 from decimal import Decimal
+from src.core.environment.limit_orders_setup.trade_log import TradeLog, Fill, MESSAGES, ORDER_TYPES, SIDES, TRADE, \
+    to_unix_us
+from src.core.environment.limit_orders_setup.child_orders import ChildOrders
+from src.core.environment.limit_orders_setup.execution_algo import EVENT_TYPES
+from src.data.data_feed import FeedCursor
+from src.data.historical_data_feed import LobCache, to_unix_ms
+
+# the environments and tests look up the histories of the benchmark and the RL algo by these keys
+HIST_DICT_ALIASES = {'benchmark_algo': 'benchmark', 'rl_algo': 'rl'}
+HIST_MODES = ('full', 'rows', 'off')
+# events of the EventKernel, the algo events of EVENT_TYPES and the steps of the walk of a resting order to them
+KERNEL_EVENT_TYPES = ('order_placement', 'bucket_bound', 'market_snapshot', 'order_expiry')
 
 
 def calc_volume_weighted_price_from_trades(trades):
@@ -18,9 +33,10 @@ def calc_volume_weighted_price_from_trades(trades):
 
 
 def place_order(lob, dt, order):
-    """ places an order into the LOB """
+    """ places an order into the LOB and returns its Fill (None for orders without quantity) """
+    # the book writes into the order it processes
     ord = order.copy()
-    trade_message = None
+    fill = None
     if ord['quantity'] > 0:
         if ord['type'] == 'limit':
             # lob_temp = copy.deepcopy(lob)
@@ -30,78 +46,200 @@ def place_order(lob, dt, order):
             trades, _ = lob.process_order(ord, True, False)
         if trades:
             vol_wgt_price, vol = calc_volume_weighted_price_from_trades(trades)
-            msg = 'trade'
+            msg = TRADE
         else:
-            vol_wgt_price, vol, msg = order['price'], 0, 'no_trade'
-        trade_message = {'timestamp': datetime.strftime(dt, '%Y-%m-%d %H:%M:%S.%f'),
-                         'message': msg,
-                         'type': order['type'],
-                         'side': order['side'],
-                         'price': Decimal(str(vol_wgt_price)),
-                         'quantity': Decimal(str(vol)),
-                         'target_quantity': order['quantity']}
-    return trade_message
+            vol_wgt_price, vol, msg = float(order['price']), 0., MESSAGES.index('no_trade')
+        fill = Fill(to_unix_us(dt), vol_wgt_price, vol, float(order['quantity']), msg,
+                    ORDER_TYPES.index(order['type']), SIDES.index(order['side']))
+    return fill
 
 
 class Broker(ABC):
-    """ Currently only for placing trades and getting volume weighted execution prices """
+    """ Places the orders of execution algos into the LOB snapshots of a data feed and keeps their trade logs.
+
+    Any number of algos can be registered, each under its own name (see register_algo). Every algo walks the data
+    with its own cursor and trades on its own copies of the snapshots, so the algos don't affect each other and
+    can be compared on the same market path. The environments use the two names 'benchmark_algo' and 'rl_algo',
+    which are also available as the attributes benchmark_algo and rl_algo.
+    """
 
-    def __init__(self, data_feed,):
+    def __init__(self, data_feed, lockstep=True, jump_to_fills=True, hist='off'):
 
         self.data_feed = data_feed
+        # the broker itself only reads the last snapshot of the hist_dict, so by default ('off') only that one is kept
+        # and the memory of long episodes stays constant. An int N keeps the last N snapshots, 'full' every visited
+        # snapshot (for tests and analysis of single episodes) and 'rows' only the last book, but the timestamps and
+        # feed row indices of all visited snapshots, so its memory still grows with the episode (by two numbers per
+        # snapshot instead of a book)
+        if not (hist in HIST_MODES or (isinstance(hist, int) and not isinstance(hist, bool) and hist > 0)):
+            raise ValueError("hist must be one of {} or a positive int!".format(HIST_MODES))
+        self.hist = hist
+        # resting limit orders jump over the snapshots in which they can neither trade nor have to follow the market
+        # (see _skip_quiet_rows), those snapshots only get a 'no_trade' log and are not recorded in the hist_dict
+        self.jump_to_fills = jump_to_fills
+        # in lockstep mode the algos are stepped together (see step_lockstep) and all cursors share the
+        # books they build, so each snapshot is only built once for all algos and the observations
+        self.lockstep = lockstep
+        self.lob_cache = LobCache() if lockstep else None
+        # the observation builder gets its own cursor as well, so nobody has to seek the algo cursors back
+        self.obs_cursor = self._new_cursor()
+        self.delete_vol = False
+        self.algos = {}
+        self.cursors = {}
+        self.hist_dict = {}
+        self.remaining_order = {}
+        self.trade_logs = {}
+        self.current_dt = {}
+        # the next event of each algo (event, done, time in microseconds) while it walks there, see _begin_walk
+        self.next_event = {}
+        # passive child orders resting next to the orders of the schedule of each algo, see submit_child_order
+        self.child_orders = {}
         self.benchmark_algo = None
         self.rl_algo = None
-        self.hist_dict = {'benchmark': {'timestamp': [], 'lob': []},
-                          'rl': {'timestamp': [], 'lob': []}}
-        self.remaining_order = {'benchmark_algo': [],
-                                'rl_algo': []}
-        self.trade_logs = {'benchmark_algo': [],
-                           'rl_algo': []}
+
+    @property
+    def benchmark_algo(self):
+        return self.algos['benchmark_algo']
+
+    @benchmark_algo.setter
+    def benchmark_algo(self, algo):
+        self.register_algo('benchmark_algo', algo)
+
+    @property
+    def rl_algo(self):
+        return self.algos['rl_algo']
+
+    @rl_algo.setter
+    def rl_algo(self, algo):
+        self.register_algo('rl_algo', algo)
+
+    def register_algo(self, name, algo):
+        """ Registers an algo under a name (replacing the algo registered under it before) and sets up its cursor,
+        history, remaining orders and trade logs. The logs of the name are kept until the algo is reset. """
+
+        self.algos[name] = algo
+        if name not in self.cursors:
+            self.cursors[name] = self._new_cursor()
+            self.hist_dict[name] = self._new_hist()
+            self.remaining_order[name] = []
+            self.trade_logs[name] = TradeLog()
+            self.current_dt[name] = None
+            self.next_event[name] = None
+            self.child_orders[name] = ChildOrders('bid' if getattr(algo, 'trade_direction', 1) == 1 else 'ask')
+            if name in HIST_DICT_ALIASES:
+                self.hist_dict[HIST_DICT_ALIASES[name]] = self.hist_dict[name]
+
+    def _new_cursor(self):
+        """ Returns a new cursor over the data feed, feeds without cursors of their own are read by a FeedCursor """
+
+        if hasattr(self.data_feed, 'cursor'):
+            return self.data_feed.cursor(lob_cache=self.lob_cache)
+        return FeedCursor(self.data_feed)
+
+    def _name(self, algo):
+        """ Returns the name an algo is registered under, algos that aren't registered take the slot of their kind """
+
+        for name, registered_algo in self.algos.items():
+            if registered_algo is algo:
+                return name
+        name = 'rl_algo' if type(algo).__name__ == 'RLAlgo' else 'benchmark_algo'
+        self.register_algo(name, algo)
+        return name
 
     def reset(self, algo):
         """ Resetting the Broker class """
 
-        self.data_feed.reset(time=algo.start_time)
-        dt, lob = self.data_feed.next_lob_snapshot()
+        name = self._name(algo)
+        cursor = self.cursors[name]
+        cursor.reset(time=algo.start_time)
+        dt, lob = cursor.next_lob_snapshot()
 
         # reset the Broker logs
-        if type(algo).__name__ != 'RLAlgo':
-            self.hist_dict['benchmark']['timestamp'] = []
-            self.hist_dict['benchmark']['lob'] = []
-            self.remaining_order['benchmark_algo'] = []
-            self.trade_logs['benchmark_algo']= []
-            self.current_dt_bmk = dt
-        else:
-            self.hist_dict['rl']['timestamp'] = []
-            self.hist_dict['rl']['lob'] = []
-            self.remaining_order['rl_algo'] = []
-            self.trade_logs['rl_algo'] = []
-            self.current_dt_rl = dt
+        for records in self.hist_dict[name].values():
+            records.clear()
+        self.remaining_order[name] = []
+        self.trade_logs[name] = TradeLog()
+        self.current_dt[name] = dt
+        self.child_orders[name] = ChildOrders('bid' if algo.trade_direction == 1 else 'ask')
 
         # update to the first instance of the datafeed & record this
         algo.reset()
         # self._record_lob(dt, lob, algo)
 
+    def fork(self, names=None, hist='off'):
+        """ Returns a copy of the broker at its current state, e.g. to try alternative actions from the same state.
+        The fork shares the data feed and the books built from it (lob_cache) with this broker and gets its own copy
+        of the state of the algos registered under 'names' (all by default): the algo (see ExecutionAlgo.fork), a
+        cursor at the same row, the resting and child orders and the trade logs, which are only copied once the fork
+        appends to them (see TradeLog.fork). Its history starts with the last snapshot of this one, kept in the
+        'hist' mode of the fork. Stepping the fork never changes this broker and vice versa. """
+
+        if not (hist in HIST_MODES or (isinstance(hist, int) and not isinstance(hist, bool) and hist > 0)):
+            raise ValueError("hist must be one of {} or a positive int!".format(HIST_MODES))
+        fork = copy.copy(self)
+        fork.hist = hist
+        fork.obs_cursor = self._new_cursor()
+        for attr in ('algos', 'cursors', 'hist_dict', 'remaining_order', 'trade_logs', 'current_dt', 'next_event',
+                     'child_orders'):
+            setattr(fork, attr, {})
+        for name in (self.algos if names is None else names):
+            algo = self.algos[name]
+            fork.algos[name] = algo.fork() if algo is not None else None
+            fork.cursors[name] = copy.copy(self.cursors[name])
+            fork.hist_dict[name] = fork._new_hist()
+            for key, records in fork.hist_dict[name].items():
+                if len(self.hist_dict[name].get(key, ())) != 0:
+                    records.append(self.hist_dict[name][key][-1])
+            if name in HIST_DICT_ALIASES:
+                fork.hist_dict[HIST_DICT_ALIASES[name]] = fork.hist_dict[name]
+            # the orders are only updated by replacing their values, the child orders by replacing their arrays
+            fork.remaining_order[name] = [dict(order) for order in self.remaining_order[name]]
+            fork.trade_logs[name] = self.trade_logs[name].fork()
+            fork.current_dt[name] = self.current_dt[name]
+            fork.next_event[name] = self.next_event[name]
+            fork.child_orders[name] = copy.copy(self.child_orders[name])
+        return fork
+
     def simulate_algo(self, algo):
         """ Simulates the execution of an algorithm """
 
-        self.reset(algo)
-        # simulate to first event...
-        event, done, lob = self.simulate_to_next_event(algo)
-        while not done:
-
-            # place order at event...
-            _ = self.place_next_order(algo, event, done, lob)
-
-            # simulate to next event...
-            event, done, lob = self.simulate_to_next_event(algo)
+        self.simulate_algos({self._name(algo): algo})
+
+    def simulate_algos(self, algos):
+        """ Simulates the execution of several algorithms on the same market path. The algos are registered under
+        the keys of 'algos' (a dict of name: algo) and their events are processed in time order by an EventKernel,
+        so in lockstep mode the snapshots are only built once for all of them. The trade logs of each algo are the
+        same as when simulating them one after the other. """
+
+        kernel = EventKernel(self)
+        for name, algo in algos.items():
+            self.register_algo(name, algo)
+            self.reset(algo)
+            kernel.add(name, *self.simulate_to_next_event(algo))
+        kernel.run()
+
+    def step_lockstep(self, steps):
+        """ Advances several algos by one step together: each algo places the order at its current event and walks
+        to its next order placement, placing the bucket's market order at a bucket bound on the way. The events of
+        all algos are processed in time order by an EventKernel, so the algos walk the same snapshots right after
+        each other and, in lockstep mode, their cursors only build each book once. Each algo keeps its own cursor,
+        resting orders, history and logs, so the trades are the same as when stepping the algos one after the other.
+
+        'steps' is a list of dicts with the 'algo' and its current 'event', 'done' and 'lob' (and optionally the
+        'volume' of the order to place). They are updated in place, 'bucket_bound' is set if a bucket was closed.
+         """
 
-            # if event is a bucket bound, we place another trade (if necessary)...
-            if event['type'] == 'bucket_bound':
-                done = self.place_next_order(algo, event, done, lob)
-            if not done:
-                # if still not done, then simulate again to next event...
-                event, done, lob = self.simulate_to_next_event(algo)
+        kernel = EventKernel(self)
+        volumes = {}
+        for step in steps:
+            name = self._name(step['algo'])
+            kernel.add(name, step['event'], step['done'], step['lob'])
+            if step.get('volume') is not None:
+                volumes[name] = step['volume']
+        results = kernel.run(volumes=volumes, stop_at_placements=True)
+        for step in steps:
+            step.update(results[self._name(step['algo'])])
+        return steps
 
     def simulate_to_next_event(self, algo):
         """ Gets the next event from the benchmark algorithm and simulates the LOB up to this point if there are
@@ -109,334 +247,455 @@ class Broker(ABC):
 
          """
 
-        # get info from the algo about the type and time of next event
-        event, done = algo.get_next_event()
+        name = self._name(algo)
+        self._begin_walk(name)
+        arrival = None
+        while arrival is None:
+            arrival = self._walk_step(name)
+        return arrival
 
-        if type(algo).__name__ != 'RLAlgo':
-            remaining_order = self.remaining_order['benchmark_algo']
-            self.data_feed.reset(time=self.current_dt_bmk.strftime('%Y-%m-%d %H:%M:%S.%f'))
-        else:
-            remaining_order = self.remaining_order['rl_algo']
-            self.data_feed.reset(time=self.current_dt_rl.strftime('%Y-%m-%d %H:%M:%S.%f'))
-
-        if len(remaining_order) != 0 and remaining_order[0]['type']== 'limit':
-            # If we have remaining limit orders, we go through the LOBs until they are executed
-            while len(remaining_order) != 0:
-                # Loop through the LOBs
-                dt, lob = self.data_feed.next_lob_snapshot()
+    def _begin_walk(self, name):
+        """ Gets the next event of an algo, which is then reached step by step with _walk_step """
+
+        # get info from the algo about the type and time of next event
+        event, done = self.algos[name].get_next_event()
+        self.next_event[name] = (event, done, to_unix_us(event['time']))
+        self._skip_if_resting(name)
+
+    def _has_resting_limit_order(self, name):
+        return len(self.remaining_order[name]) != 0 and self.remaining_order[name][0]['type'] == 'limit'
+
+    def _skip_if_resting(self, name):
+        if self.jump_to_fills and self._has_resting_limit_order(name):
+            self._skip_quiet_rows(name, self.cursors[name], self.next_event[name][0])
+
+    def _walk_time(self, name):
+        """ Returns the time (in microseconds) and type (see KERNEL_EVENT_TYPES) of the next step of the walk of an
+        algo to its next event: the next snapshot its resting limit order is placed on, the expiry of the order at
+        the event (once the next snapshot is after it) or, without resting order, the event itself """
+
+        event, done, event_us = self.next_event[name]
+        if not self._has_resting_limit_order(name):
+            if len(self.child_orders[name]) != 0:
+                end = self._event_end_row(name)
+                child_row = self._next_child_row(name, end)
+                if child_row < end:
+                    return int(np.rint(self.cursors[name].data_feed.data[child_row, 0] * 1000)), 'market_snapshot'
+            return event_us, event['type']
+        cursor = self.cursors[name]
+        data = getattr(cursor.data_feed, 'data', None)
+        row_idx = getattr(cursor, 'row_idx', None)
+        if data is None or row_idx is None or row_idx >= data.shape[0]:
+            # the time of the snapshot is only known once it is read
+            return event_us, 'market_snapshot'
+        row_us = int(np.rint(data[row_idx, 0] * 1000))
+        if row_us <= event_us:
+            return row_us, 'market_snapshot'
+        return event_us, 'order_expiry'
+
+    def _walk_step(self, name):
+        """ Walks an algo one step to its next event: a resting limit order is placed on the next snapshot (the next
+        one it can trade on or has to follow the market on, if jumping to fills) and expires at the event, without
+        resting order the cursor moves to the snapshot of the event. Returns the (event, done, lob) once the event
+        is reached, None before. """
+
+        algo = self.algos[name]
+        cursor = self.cursors[name]
+        event, done, _ = self.next_event[name]
+
+        if self._has_resting_limit_order(name):
+            if self._walk_time(name)[1] == 'market_snapshot':
+                dt, lob = cursor.next_lob_snapshot()
                 if dt <= event['time']:
-                    self._record_lob(dt, lob, algo)
-                    order_temp_bmk, order_temp_rl = self._update_remaining_orders()
+                    self._record_lob(dt, lob, name)
+                    order_temp = self._update_remaining_orders(name)
 
                     # place the orders and update the remaining quantities to trade in the algo
-                    if type(algo).__name__ != 'RLAlgo':
-                        log = self.place_orders(order_temp_bmk, type(algo).__name__)
-                        algo.update_remaining_volume(log)
-                        remaining_order = self.remaining_order['benchmark_algo']
-                    else:
-                        log = self.place_orders(order_temp_rl, type(algo).__name__)
-                        algo.update_remaining_volume(log)
-                        remaining_order = self.remaining_order['rl_algo']
-                else:
-                    # We have reached the next event with unexecuted volume, if we are not at the end of a bucket
-                    # we add it to the volume of next order
-                    if event['type'] == 'order_placement':
-                        if type(algo).__name__ != 'RLAlgo':
-                            unexecuted_vol = self.remaining_order['benchmark_algo'][0]['quantity']
-                        else:
-                            unexecuted_vol = self.remaining_order['rl_algo'][0]['quantity']
-
-                        algo.volumes_per_trade[algo.bucket_idx][algo.order_idx] += unexecuted_vol
-
-                    # If the event is a bucket end, the market order will be placed according to the bucket_vol_remaining.
-                    # Either way, we remove the remaining orders.
-                    if type(algo).__name__ != 'RLAlgo':
-                        self.remaining_order['benchmark_algo'] = []
-                    else:
-                        self.remaining_order['rl_algo'] = []
-                    remaining_order = []
+                    log = self.place_orders(order_temp, name)
+                    algo.update_remaining_volume(log)
+                    self._skip_if_resting(name)
+                    return None
+
+            # We have reached the next event with unexecuted volume, if we are not at the end of a bucket
+            # we add it to the volume of next order
+            if event['type'] == 'order_placement':
+                unexecuted_lots = algo.to_lots(self.remaining_order[name][0]['quantity'])
+                algo.volumes_per_trade[algo.bucket_idx][algo.order_idx] += unexecuted_lots
+
+            # If the event is a bucket end, the market order will be placed according to the bucket_vol_remaining.
+            # Either way, we remove the remaining orders.
+            self.remaining_order[name] = []
+            return None
+
+        if len(self.child_orders[name]) != 0:
+            # the child orders trade on their own up to the event
+            end = self._event_end_row(name)
+            child_row = self._next_child_row(name, end)
+            if child_row < end:
+                self._match_child_orders(name, child_row + 1)
+                return None
 
         # If we have no remaining orders (for example after executing an entire limit order or after a bucket end),
-        # we reset the datafeed to jump to the LOB corresponding to the next event.
-        self.data_feed.reset(time=event['time'].strftime('%Y-%m-%d %H:%M:%S.%f'))
-        dt, lob = self.data_feed.next_lob_snapshot()
-        self._record_lob(dt, lob, algo)
-        if type(algo).__name__ != 'RLAlgo':
-            self.current_dt_bmk = dt
-        else:
-            self.current_dt_rl = dt
+        # we move the cursor to jump to the LOB corresponding to the next event.
+        cursor.reset(time=event['time'])
+        dt, lob = cursor.next_lob_snapshot()
+        self._record_lob(dt, lob, name)
+        self.current_dt[name] = dt
         return event, done, lob
 
-    def place_next_order(self, algo, event, done, lob, vol=None):
-
-        if type(algo).__name__ != 'RLAlgo':
-            self.data_feed.reset(time=self.current_dt_bmk.strftime('%Y-%m-%d %H:%M:%S.%f'))
+    def _skip_quiet_rows(self, name, cursor, event):
+        """ Moves the cursor of a resting limit order to the first snapshot up to the next event in which the order
+        trades or follows the market, found with the BestPriceIndex of the feed. The skipped snapshots get the same
+        'no_trade' logs placing the order on them would give. """
+
+        data_feed = cursor.data_feed
+        if not hasattr(data_feed, 'price_index'):
+            return
+        order = self.remaining_order[name][0]
+        price = float(order['price'])
+        tick_size = float(self.algos[name].tick_size)
+        start = cursor.row_idx
+        end = min(int(np.searchsorted(data_feed.data[:, 0], to_unix_ms(event['time']), side='right')),
+                  data_feed.data.shape[0])
+        # the snapshots child orders trade on are not skipped
+        end = self._next_child_row(name, end)
+        if start >= end:
+            return
+        # a bid resting one tick behind the best bid keeps its price and doesn't trade while the best ask is above it
+        # and the best bid doesn't move up (the other way round for an ask), the margin absorbs the float noise
+        eps = 1e-9 * max(abs(price), 1)
+        if order['side'] == 'bid':
+            row = data_feed.price_index().first_row(start, end, max_ask=price + eps, min_bid=price + tick_size + eps)
+            best_prices = data_feed.data[start:row, 1 + 2 * data_feed.lob_depth]
+            moves_back = (best_prices > price + eps) & (best_prices < price + tick_size - eps)
         else:
-            self.data_feed.reset(time=self.current_dt_rl.strftime('%Y-%m-%d %H:%M:%S.%f'))
+            row = data_feed.price_index().first_row(start, end, max_ask=price - tick_size - eps, min_bid=price - eps)
+            best_prices = data_feed.data[start:row, 1]
+            moves_back = (best_prices < price - eps) & (best_prices > price - tick_size + eps)
+        # a best price less than a tick away from the order also moves it
+        if np.any(moves_back):
+            row = start + int(np.argmax(moves_back))
+        if row > start:
+            self.trade_logs[name].append_rows(ts=np.rint(data_feed.data[start:row, 0] * 1000).astype(np.int64),
+                                              price=price,
+                                              quantity=0,
+                                              target_quantity=float(order['quantity']),
+                                              message='no_trade',
+                                              order_type=order['type'],
+                                              side=order['side'])
+            order['timestamp'] = datetime.strftime(data_feed.row_time(row - 1), '%Y-%m-%d %H:%M:%S.%f')
+        cursor.row_idx = row
+
+    def submit_child_order(self, algo, price, lots):
+        """ Submits a passive child order of 'lots' at a limit price for an algo. It rests next to the orders of the
+        schedule of the algo until it is executed, cancelled or the bucket ends, trades on the snapshots after the
+        current one of the algo that offer volume within its price (all child orders of the algo are matched at once,
+        see ChildOrders) and its executed volume counts towards the volume of the bucket.
+        The lots are reserved from the orders of the schedule still to be placed in the current bucket (the last ones
+        first), so the algo doesn't trade them twice. Child orders left at the bucket bound are cancelled, their lots
+        are traded by the market order of the bucket. Returns the id of the order. """
+
+        name = self._name(algo)
+        if not hasattr(self.cursors[name].data_feed, 'price_index'):
+            raise ValueError("Child orders need a data feed with a price index!")
+        if algo.bucket_idx >= algo.buckets.n_buckets:
+            raise ValueError("Child orders need a bucket of the algo to trade in!")
+        order_idx = self._pending_orders(name)
+        pending = algo.volumes_per_trade[algo.bucket_idx][order_idx]
+        if lots > pending.sum():
+            raise ValueError("Child orders can't exceed the volume the schedule still has to place in the bucket!")
+        # take the lots from the last orders of the bucket first
+        reserved = np.clip(lots - (np.cumsum(pending[::-1]) - pending[::-1]), 0, pending[::-1])[::-1]
+        algo.volumes_per_trade[algo.bucket_idx][order_idx] = pending - reserved
+        children = self.child_orders[name]
+        if len(children) == 0:
+            children.row = self.cursors[name].row_idx
+        return children.add(price, lots)
+
+    def cancel_child_order(self, algo, order_id):
+        """ Cancels a child order of an algo and returns its unexecuted lots, which go back to the next order of the
+        schedule in the bucket (or to the market order of the bucket if all orders are placed) """
+
+        name = self._name(algo)
+        lots = self.child_orders[name].cancel(order_id)
+        order_idx = self._pending_orders(name)
+        if len(order_idx) != 0:
+            algo.volumes_per_trade[algo.bucket_idx][order_idx[0]] += lots
+        return lots
+
+    def _pending_orders(self, name):
+        """ Returns the indices of the orders of the schedule of an algo still to be placed in its current bucket """
+
+        algo = self.algos[name]
+        table = algo.event_table
+        # the order at the event the algo walks to (or waits at) isn't placed yet
+        start_us = self.next_event[name][2] if self.next_event[name] is not None else -1
+        pending = (table['type'] == EVENT_TYPES.index('order_placement')) & \
+                  (table['bucket_idx'] == algo.bucket_idx) & (table['time'] >= start_us)
+        return table['order_idx'][pending]
+
+    def _event_end_row(self, name):
+        """ Returns the first row of the data after the next event of an algo """
+
+        data = self.cursors[name].data_feed.data
+        event_ms = self.next_event[name][2] / 1000
+        return min(int(np.searchsorted(data[:, 0], event_ms, side='right')), data.shape[0])
+
+    def _next_child_row(self, name, end):
+        """ Returns the first row before 'end' the child orders of an algo can trade on (or end if there is none) """
+
+        children = self.child_orders[name]
+        if len(children) == 0 or children.row >= end:
+            return end
+        max_ask, min_bid = children.thresholds()
+        return self.cursors[name].data_feed.price_index().first_row(children.row, end, max_ask, min_bid)
+
+    def _match_child_orders(self, name, end):
+        """ Matches the child orders of an algo on the snapshots up to (not including) row 'end' they can trade on,
+        logs the trades and updates the remaining volumes of the algo """
+
+        algo = self.algos[name]
+        children = self.child_orders[name]
+        data_feed = self.cursors[name].data_feed
+        depth = data_feed.lob_depth
+        lots_per_unit = int(1 / algo.lot_size)
+        row = self._next_child_row(name, end)
+        while row < end:
+            snapshot = data_feed.data[row]
+            if children.side == 'bid':
+                prices, volumes = snapshot[1:1 + depth], snapshot[1 + depth:1 + 2 * depth]
+            else:
+                prices, volumes = snapshot[1 + 2 * depth:1 + 3 * depth], snapshot[1 + 3 * depth:1 + 4 * depth]
+            ids, limits, lots, executed, avg_prices = children.match(prices,
+                                                                     np.rint(volumes * lots_per_unit).astype(np.int64))
+            if len(ids) != 0:
+                self.trade_logs[name].append_rows(ts=np.full(len(ids), int(np.rint(snapshot[0] * 1000))),
+                                                  price=avg_prices,
+                                                  quantity=executed / lots_per_unit,
+                                                  target_quantity=lots / lots_per_unit,
+                                                  message='trade',
+                                                  order_type='limit',
+                                                  side=children.side)
+                # child orders don't outlive their bucket, see place_next_order
+                algo.vol_remaining -= int(executed.sum())
+                algo.bucket_vol_remaining[algo.bucket_idx] -= int(executed.sum())
+            children.row = row + 1
+            row = self._next_child_row(name, end)
+        children.row = max(children.row, end)
 
+    def place_next_order(self, algo, event, done, lob, vol=None):
+
+        name = self._name(algo)
+        if event['type'] == 'bucket_bound':
+            # the child orders have traded up to the bound, the market order of the bucket takes their rest
+            self.child_orders[name].clear()
         algo_order = algo.get_order_at_event(event, lob)
         if vol is not None:
-            algo_order['quantity'] = Decimal(str(vol))
-        log = self.place_orders(algo_order, type(algo).__name__)
+            # the volume is given in lots, like the volumes of the algo
+            algo_order['quantity'] = algo.to_volume(vol)
+        log = self.place_orders(algo_order, name)
 
         # update the remaining quantities to trade
         algo.update_remaining_volume(log, event['type'])
 
-        if len(self.remaining_order['benchmark_algo']) != 0:
-            if self.remaining_order['benchmark_algo'][0]['type'] == 'market':
-                # We have a market order that didn't fully execute, so we place it again on subsequent LOBs until it is fully executed.
-                if self.benchmark_algo.bucket_idx < self.benchmark_algo.buckets.n_buckets:
-                    while len(self.remaining_order['benchmark_algo'])!= 0:
-                        dt, lob = self.data_feed.next_lob_snapshot()
-                        if dt < self.benchmark_algo.execution_times[self.benchmark_algo.bucket_idx][self.benchmark_algo.order_idx]:
-                            self._record_lob(dt, lob, algo)
-                            order_temp_bmk, order_temp_rl = self._update_remaining_orders()
-                            # place the orders and update the remaining quantities to trade in the algo
-                            log = self.place_orders(order_temp_bmk,type(algo).__name__)
-                            algo.vol_remaining -= Decimal(str(log['quantity']))
-                            algo.bucket_vol_remaining[algo.bucket_idx-1] -= Decimal(str(log['quantity']))
-                            if algo.vol_remaining < -algo.tick_size * len(algo.bucket_volumes) or algo.bucket_vol_remaining[algo.bucket_idx-1] < -algo.tick_size:
-                                raise ValueError("More volume than available placed!")
-                            self.current_dt_bmk = dt
-                        else:
-                            # We have reached the next order placement without having fully executed our market order
-                            if self.delete_vol:
-                                # We delete the unexecuted volume from the algo
-                                try:
-                                    self.benchmark_algo.unexecuted_vol += self.remaining_order['benchmark_algo'][0]['quantity']
-                                except:
-                                    self.benchmark_algo.unexecuted_vol = self.remaining_order['benchmark_algo'][0]['quantity']
-                                self.benchmark_algo.vol_remaining -= self.remaining_order['benchmark_algo'][0]['quantity']
-                                self.remaining_order['benchmark_algo'] = []
-                            else:
-                                # We add the volume to the next event
-                                self.benchmark_algo.volumes_per_trade[self.benchmark_algo.bucket_idx][self.benchmark_algo.order_idx] += self.remaining_order['benchmark_algo'][0]['quantity']
-                                # Move the volume between buckets
-                                self.benchmark_algo.bucket_vol_remaining[self.benchmark_algo.bucket_idx-1] -= self.remaining_order['benchmark_algo'][0]['quantity']
-                                self.benchmark_algo.bucket_vol_remaining[self.benchmark_algo.bucket_idx] += self.remaining_order['benchmark_algo'][0]['quantity']
-                                self.remaining_order['benchmark_algo'] = []
-                else:
-                    # We are at the last bucket of the episode
-                    if self.delete_vol:
-                        # We delete the unexecuted volume from the algo
-                        try:
-                            self.benchmark_algo.unexecuted_vol += self.remaining_order['benchmark_algo'][0]['quantity']
-                        except:
-                            self.benchmark_algo.unexecuted_vol = self.remaining_order['benchmark_algo'][0]['quantity']
-                        self.benchmark_algo.vol_remaining -= self.remaining_order['benchmark_algo'][0]['quantity']
-                        self.remaining_order['benchmark_algo'] = []
-
+        if len(self.remaining_order[name]) != 0 and self.remaining_order[name][0]['type'] == 'market':
+            # We have a market order that didn't fully execute, so we place it again on subsequent LOBs until it is fully executed.
+            if algo.bucket_idx < algo.buckets.n_buckets:
+                while len(self.remaining_order[name]) != 0:
+                    dt, lob = self.cursors[name].next_lob_snapshot()
+                    if dt < algo.execution_times[algo.bucket_idx][algo.order_idx]:
+                        self._place_remaining_market_order(dt, lob, algo, name)
                     else:
-                        while len(self.remaining_order['benchmark_algo'])!= 0:
-                            dt, lob = self.data_feed.next_lob_snapshot()
-                            self._record_lob(dt, lob, algo)
-                            order_temp_bmk, order_temp_rl = self._update_remaining_orders()
-                            # place the orders and update the remaining quantities to trade in the algo
-                            log = self.place_orders(order_temp_bmk,type(algo).__name__)
-                            algo.vol_remaining -= Decimal(str(log['quantity']))
-                            algo.bucket_vol_remaining[algo.bucket_idx-1] -= Decimal(str(log['quantity']))
-                            if algo.vol_remaining < -algo.tick_size * len(algo.bucket_volumes) or algo.bucket_vol_remaining[algo.bucket_idx-1] < -algo.tick_size:
-                                raise ValueError("More volume than available placed!")
-                            self.current_dt_bmk = dt
-
-
-
-        if len(self.remaining_order['rl_algo'])!= 0:
-            if self.remaining_order['rl_algo'][0]['type'] == 'market':
-                # We have a market order that didn't fully execute, so we place it again on subsequent LOBs until it is fully executed.
-                if self.rl_algo.bucket_idx < self.rl_algo.buckets.n_buckets:
-                    while len(self.remaining_order['rl_algo'])!= 0:
-                        dt, lob = self.data_feed.next_lob_snapshot()
-                        if dt < self.rl_algo.execution_times[self.rl_algo.bucket_idx][self.rl_algo.order_idx]:
-                            self._record_lob(dt, lob, algo)
-                            order_temp_bmk, order_temp_rl = self._update_remaining_orders()
-                            # place the orders and update the remaining quantities to trade in the algo
-                            log = self.place_orders(order_temp_rl,type(algo).__name__)
-                            algo.vol_remaining -= Decimal(str(log['quantity']))
-                            algo.bucket_vol_remaining[algo.bucket_idx-1] -= Decimal(str(log['quantity']))
-                            if algo.vol_remaining < -algo.tick_size * len(algo.bucket_volumes) or algo.bucket_vol_remaining[algo.bucket_idx-1] < -algo.tick_size:
-                                raise ValueError("More volume than available placed!")
-
-                            self.current_dt_rl = dt
+                        # We have reached the next order placement without having fully executed our market order,
+                        # the snapshot belongs to the next event so it has to be read again
+                        self.cursors[name].rewind()
+                        if self.delete_vol:
+                            self._delete_remaining_volume(algo, name)
                         else:
-                            # We have reached the next order placement without having fully executed our market order
-                            if self.delete_vol:
-                                # We delete the unexecuted volume from the algo
-                                try:
-                                    self.rl_algo.unexecuted_vol += self.remaining_order['rl_algo'][0]['quantity']
-                                except:
-                                    self.rl_algo.unexecuted_vol = self.remaining_order['rl_algo'][0]['quantity']
-                                self.rl_algo.vol_remaining -= self.remaining_order['rl_algo'][0]['quantity']
-                                self.remaining_order['rl_algo'] = []
-                            else:
-                                # We add the volume to the next event
-                                self.rl_algo.volumes_per_trade[self.rl_algo.bucket_idx][self.rl_algo.order_idx] += self.remaining_order['rl_algo'][0]['quantity']
-                                # Move the volume between buckets
-                                self.rl_algo.bucket_vol_remaining[self.rl_algo.bucket_idx-1] -= self.remaining_order['rl_algo'][0]['quantity']
-                                self.rl_algo.bucket_vol_remaining[self.rl_algo.bucket_idx] += self.remaining_order['rl_algo'][0]['quantity']
-                                self.remaining_order['rl_algo'] = []
+                            # We add the volume to the next event
+                            remaining_lots = algo.to_lots(self.remaining_order[name][0]['quantity'])
+                            algo.volumes_per_trade[algo.bucket_idx][algo.order_idx] += remaining_lots
+                            # Move the volume between buckets
+                            algo.bucket_vol_remaining[algo.bucket_idx-1] -= remaining_lots
+                            algo.bucket_vol_remaining[algo.bucket_idx] += remaining_lots
+                            self.remaining_order[name] = []
+            else:
+                # We are at the last bucket of the episode
+                if self.delete_vol:
+                    self._delete_remaining_volume(algo, name)
                 else:
-                    # We are at the last bucket of the episode
-                    if self.delete_vol:
-                        # We delete the unexecuted volume from the algo
-                        try:
-                            self.rl_algo.unexecuted_vol += self.remaining_order['rl_algo'][0]['quantity']
-                        except:
-                            self.rl_algo.unexecuted_vol = self.remaining_order['rl_algo'][0]['quantity']
-                        self.rl_algo.vol_remaining -= self.remaining_order['rl_algo'][0]['quantity']
-                        self.remaining_order['rl_algo'] = []
-                    else:
-                        while len(self.remaining_order['rl_algo'])!= 0:
-                            dt, lob = self.data_feed.next_lob_snapshot()
-                            self._record_lob(dt, lob, algo)
-                            order_temp_bmk, order_temp_rl = self._update_remaining_orders()
-                            # place the orders and update the remaining quantities to trade in the algo
-                            log = self.place_orders(order_temp_rl,type(algo).__name__)
-                            algo.vol_remaining -= Decimal(str(log['quantity']))
-                            algo.bucket_vol_remaining[algo.bucket_idx-1] -= Decimal(str(log['quantity']))
-                            if algo.vol_remaining < -algo.tick_size * len(algo.bucket_volumes) or algo.bucket_vol_remaining[algo.bucket_idx-1] < -algo.tick_size:
-                                raise ValueError("More volume than available placed!")
-
-                            self.current_dt_rl = dt
-
-        if type(algo).__name__ != 'RLAlgo':
-            self.benchmark_algo = algo
-        else:
-            self.rl_algo = algo
+                    while len(self.remaining_order[name]) != 0:
+                        dt, lob = self.cursors[name].next_lob_snapshot()
+                        self._place_remaining_market_order(dt, lob, algo, name)
         return done
 
-    def _record_lob(self, dt, lob, algo):
-        """ Records lob steps in a dict """
-
-        if type(algo).__name__ != 'RLAlgo':
-            self.hist_dict['benchmark']['timestamp'].append(dt)
-            self.hist_dict['benchmark']['lob'].append(copy.deepcopy(lob))
-        else:
-            self.hist_dict['rl']['timestamp'].append(dt)
-            self.hist_dict['rl']['lob'].append(copy.deepcopy(lob))
-
-    def _update_remaining_orders(self):
-        """ Updates the orders not previously executed with new LOB data """
-
-        order_temp_bmk = None
-        order_temp_rl = None
-
-        if len(self.remaining_order['benchmark_algo']) != 0:
+    def _place_remaining_market_order(self, dt, lob, algo, name):
+        """ Places the rest of a market order on the next LOB and updates the remaining volumes of the algo """
+
+        self._record_lob(dt, lob, name)
+        order_temp = self._update_remaining_orders(name)
+        # place the orders and update the remaining quantities to trade in the algo
+        log = self.place_orders(order_temp, name)
+        lots = algo.to_lots(log.quantity)
+        algo.vol_remaining -= lots
+        algo.bucket_vol_remaining[algo.bucket_idx-1] -= lots
+        if algo.vol_remaining < -len(algo.bucket_volumes) or algo.bucket_vol_remaining[algo.bucket_idx-1] < -1:
+            raise ValueError("More volume than available placed!")
+        self.current_dt[name] = dt
+
+    def _delete_remaining_volume(self, algo, name):
+        """ Deletes the unexecuted volume of a market order from the algo """
+
+        lots = algo.to_lots(self.remaining_order[name][0]['quantity'])
+        try:
+            algo.unexecuted_vol += lots
+        except:
+            algo.unexecuted_vol = lots
+        algo.vol_remaining -= lots
+        self.remaining_order[name] = []
+
+    def _new_hist(self):
+        """ Returns the empty history of an algo for the hist mode of the broker """
+
+        if self.hist == 'full':
+            return {'timestamp': [], 'lob': []}
+        if self.hist == 'rows':
+            return {'timestamp': [], 'row': [], 'lob': deque(maxlen=1)}
+        maxlen = 1 if self.hist == 'off' else self.hist
+        return {'timestamp': deque(maxlen=maxlen), 'lob': deque(maxlen=maxlen)}
+
+    def _record_lob(self, dt, lob, name):
+        """ Records lob steps in a dict as frozen snapshots, which are only rebuilt into a book once traded on """
+
+        self.hist_dict[name]['timestamp'].append(dt)
+        self.hist_dict[name]['lob'].append(lob.snapshot())
+        if 'row' in self.hist_dict[name]:
+            # the snapshot was just read by the cursor of the algo
+            self.hist_dict[name]['row'].append(self.cursors[name].row_idx - 1)
+        if len(self.child_orders[name]) != 0:
+            # the child orders trade up to and including the snapshot
+            self._match_child_orders(name, self.cursors[name].row_idx)
+
+    def _update_remaining_orders(self, name):
+        """ Updates the order of an algo not previously executed with new LOB data """
+
+        order_temp = None
+        if len(self.remaining_order[name]) != 0:
             # update the order and place it
-            dt = self.hist_dict['benchmark']['timestamp'][-1]
-            lob_bmk = self.hist_dict['benchmark']['lob'][-1]
-            order_temp_bmk = self.remaining_order['benchmark_algo'][0]
-            order_temp_bmk['timestamp'] = datetime.strftime(dt, '%Y-%m-%d %H:%M:%S.%f')
-            if order_temp_bmk['type'] == 'limit':
+            dt = self.hist_dict[name]['timestamp'][-1]
+            lob = self.hist_dict[name]['lob'][-1]
+            tick_size = self.algos[name].tick_size
+            order_temp = self.remaining_order[name][0]
+            order_temp['timestamp'] = datetime.strftime(dt, '%Y-%m-%d %H:%M:%S.%f')
+            if order_temp['type'] == 'limit':
                 # update the price also
-                if order_temp_bmk['side'] == 'bid' and order_temp_bmk['price'] < lob_bmk.get_best_bid():
-                    order_temp_bmk['price'] = lob_bmk.get_best_bid() - self.benchmark_algo.tick_size
-                    # order_temp_bmk['price'] = lob_bmk.get_best_bid() + 10 * self.benchmark_algo.tick_size # Allows for execution up to an adverse price movement of 10 ticks in the next LOB
-
-                if order_temp_bmk['side'] == 'ask' and order_temp_bmk['price'] > lob_bmk.get_best_ask():
-                    order_temp_bmk['price'] = lob_bmk.get_best_ask() + self.benchmark_algo.tick_size
-                    # order_temp_bmk['price'] = lob_bmk.get_best_ask() - 10 * self.benchmark_algo.tick_size # Allows for execution up to an adverse price movement of 10 ticks in the next LOB
-
-            self.remaining_order['benchmark_algo'] = []
-
-        if len(self.remaining_order['rl_algo']) != 0:
-            # update the order and place it
-            dt = self.hist_dict['rl']['timestamp'][-1]
-            lob_rl = self.hist_dict['rl']['lob'][-1]
-            order_temp_rl = self.remaining_order['rl_algo'][0]
-            order_temp_rl['timestamp'] = datetime.strftime(dt, '%Y-%m-%d %H:%M:%S.%f')
-            if order_temp_rl['type'] == 'limit':
-                # update the price also
-                if order_temp_rl['side'] == 'bid' and order_temp_rl['price'] < lob_rl.get_best_bid():
-                    order_temp_rl['price'] = lob_rl.get_best_bid() - self.benchmark_algo.tick_size
-                    # order_temp_rl['price'] = lob_rl.get_best_bid() + 10 * self.benchmark_algo.tick_size # Allows for execution up to an adverse price movement of 10 ticks in the next LOB
-
-                if order_temp_rl['side'] == 'ask' and order_temp_rl['price'] > lob_rl.get_best_ask():
-                    order_temp_rl['price'] = lob_rl.get_best_ask() + self.benchmark_algo.tick_size
-                    # order_temp_rl['price'] = lob_rl.get_best_ask() - 10 * self.benchmark_algo.tick_size # Allows for execution up to an adverse price movement of 10 ticks in the next LOB
-
-            self.remaining_order['rl_algo'] = []
-        return order_temp_bmk, order_temp_rl
-
-    def place_orders(self, order, algo_type):
-        """ Places orders of both benchmark and RL algos and store logs in the broker.trade_logs """
-
-        # update the remaining orders
-        if algo_type != 'RLAlgo':
-            log = place_order(self.hist_dict['benchmark']['lob'][-1],
-                              self.hist_dict['benchmark']['timestamp'][-1],
-                              order)
-            if log is not None:
-                self.trade_logs['benchmark_algo'].append(log)
-                bmk_order_temp = order.copy()
-                bmk_order_temp['quantity'] -= log['quantity']
-                if bmk_order_temp['quantity'] > 0:
-                    self.remaining_order['benchmark_algo'].append(bmk_order_temp)
-                else:
-                    self.remaining_order['benchmark_algo'] = []
-
-        if algo_type == 'RLAlgo':
-            log = place_order(self.hist_dict['rl']['lob'][-1],
-                              self.hist_dict['rl']['timestamp'][-1],
-                              order)
-            if log is not None:
-                self.trade_logs['rl_algo'].append(log)
-                rl_order_temp = order.copy()
-                rl_order_temp['quantity'] -= log['quantity']
-                if rl_order_temp['quantity'] > 0:
-                    self.remaining_order['rl_algo'].append(rl_order_temp)
-                else:
-                    self.remaining_order['rl_algo'] = []
-        return log
+                if order_temp['side'] == 'bid' and order_temp['price'] < lob.get_best_bid():
+                    order_temp['price'] = lob.get_best_bid() - tick_size
+                    # order_temp['price'] = lob.get_best_bid() + 10 * tick_size # Allows for execution up to an adverse price movement of 10 ticks in the next LOB
+
+                if order_temp['side'] == 'ask' and order_temp['price'] > lob.get_best_ask():
+                    order_temp['price'] = lob.get_best_ask() + tick_size
+                    # order_temp['price'] = lob.get_best_ask() - 10 * tick_size # Allows for execution up to an adverse price movement of 10 ticks in the next LOB
+
+            self.remaining_order[name] = []
+        return order_temp
+
+    def place_orders(self, order, name):
+        """ Places an order of the algo registered under 'name' and stores its Fill in the broker.trade_logs """
+
+        fill = place_order(self.hist_dict[name]['lob'][-1],
+                           self.hist_dict[name]['timestamp'][-1],
+                           order)
+        if fill is not None:
+            self.trade_logs[name].append_fill(fill)
+            remaining = order['quantity'] - Decimal(str(fill.quantity))
+            if remaining > 0:
+                self.remaining_order[name].append(dict(order, quantity=remaining))
+            else:
+                self.remaining_order[name] = []
+        return fill
 
     def calc_vwap_from_logs(self, start_date=None, end_date=None):
+        """ Returns the VWAPs of the benchmark and the RL algo between two dates """
 
-        f = lambda x: datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f')
-        # filter by start idx
-        # it seems possible that one algo has data in there and the other doesnt???
-        if start_date is None:
-            start_idx_bmk = 0
-            start_idx_rl = 0
-        else:
-            start_idx_bmk = next(x[0] for x in enumerate([f(log["timestamp"]) for log in self.trade_logs['benchmark_algo']])
-                                 if x[1] > start_date)
-            start_idx_rl = next(x[0] for x in enumerate([f(log["timestamp"]) for log in self.trade_logs['rl_algo']])
-                                if x[1] > start_date)
-
-        # filter by end idx
-        if end_date is None:
-            end_idx_bmk = len(self.trade_logs['benchmark_algo'])
-            end_idx_rl = len(self.trade_logs['rl_algo'])
-        else:
-            try:
-                end_idx_bmk = next(x[0] for x in enumerate([f(log["timestamp"]) for log in self.trade_logs['benchmark_algo']])
-                                   if x[1] >= end_date) + 1
-            except:
-                end_idx_bmk = len(self.trade_logs['benchmark_algo'])
-            try:
-                end_idx_rl = next(x[0] for x in enumerate([f(log["timestamp"]) for log in self.trade_logs['rl_algo']])
-                                  if x[1] >= end_date) + 1
-            except:
-                end_idx_rl = len(self.trade_logs['rl_algo'])
-
-        # get trade logs between the two dates
-        if len(self.trade_logs['benchmark_algo']) != 0:
-            bmk_vwap = self._calc_vwap(self.trade_logs['benchmark_algo'][start_idx_bmk:end_idx_bmk])
-        else:
-            bmk_vwap = 0
-
-        if len(self.trade_logs['rl_algo']) != 0:
-            rl_vwap = self._calc_vwap(self.trade_logs['rl_algo'][start_idx_rl:end_idx_rl])
-        else:
-            rl_vwap = 0
-
+        bmk_vwap = self.calc_vwap('benchmark_algo', start_date, end_date)
+        rl_vwap = self.calc_vwap('rl_algo', start_date, end_date)
         return bmk_vwap, rl_vwap
 
-    @staticmethod
-    def _calc_vwap(logs):
-        p = [Decimal(trade['price']) for trade in logs if trade['message'] == 'trade']
-        v = [trade['quantity'] for trade in logs if trade['message'] == 'trade']
-        if len(p) == 0 or len(v) == 0:
-            return 0
-        vwap = float(np.dot(p, v)/sum(v))
-        return vwap
+    def calc_vwap(self, name, start_date=None, end_date=None):
+        """ Returns the VWAP of the algo registered under 'name' between two dates """
+
+        return self.trade_logs[name].vwap(start_date, end_date)
+
+
+class EventKernel:
+    """
+        Discrete event simulation of the algos of a Broker. Every algo has exactly one pending event in a heap ordered
+        by time (see KERNEL_EVENT_TYPES): the algo event it waits at (an order placement or bucket bound, where it
+        places its next order) or the next step of its walk there (the next snapshot its resting limit order is
+        placed on or the expiry of the order). The events of any number of algos are processed once and in time
+        order, so the cursors of the algos move through the data together and the cost of a simulation is the
+        number of events.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._heap = []
+        self._seq = count()
+        # (event, done, lob) of the algos waiting at an algo event
+        self.waiting = {}
+
+    def add(self, name, event, done, lob):
+        """ Adds an algo of the broker waiting at an event (as returned by Broker.simulate_to_next_event) """
+
+        self.waiting[name] = (event, done, lob)
+        self._push(to_unix_us(event['time']), name)
+
+    def _push(self, time, name):
+        heapq.heappush(self._heap, (time, next(self._seq), name))
+
+    def _pop(self):
+        """ Returns the time and name of the algo of the next event """
+
+        time, _, name = heapq.heappop(self._heap)
+        return time, name
+
+    def run(self, volumes=None, stop_at_placements=False):
+        """ Processes the events until all algos are done or, with stop_at_placements, until every algo has placed one
+        order and reached its next order placement. 'volumes' gives the volume (in lots) of the first order of an
+        algo by name. Returns a dict of name: {'event', 'done', 'lob', 'bucket_bound'} with the event each algo
+        stopped at and whether it passed a bucket bound. """
+
+        volumes = dict(volumes or {})
+        results = {}
+        stopped = []
+        while self._heap:
+            _, name = self._pop()
+            result = results.setdefault(name, {'bucket_bound': False})
+            if name in self.waiting:
+                event, done, lob = self.waiting.pop(name)
+                result.update(event=event, done=done, lob=lob)
+                if event['type'] == 'order_placement':
+                    if done or (stop_at_placements and result.get('placed')):
+                        stopped.append((name, event, done, lob))
+                        continue
+                    self.broker.place_next_order(self.broker.algos[name], event, done, lob, volumes.pop(name, None))
+                    result['placed'] = True
+                else:
+                    result['bucket_bound'] = True
+                    result['done'] = self.broker.place_next_order(self.broker.algos[name], event, done, lob)
+                    if result['done']:
+                        continue
+                self.broker._begin_walk(name)
+            else:
+                arrival = self.broker._walk_step(name)
+                if arrival is not None:
+                    self.add(name, *arrival)
+                    continue
+            self._push(self.broker._walk_time(name)[0], name)
+
+        for name, event, done, lob in stopped:
+            self.add(name, event, done, lob)
+        for result in results.values():
+            result.pop('placed', None)
+        return results
@@ -0,0 +1,107 @@
+import numpy as np
+
+
+def match_levels(limits, lots, level_prices, level_lots, side='bid'):
+    """ Matches limit orders (sorted by priority, best price first) against the levels of one side of a snapshot
+    (best first) in one pass. Orders take the best levels first in priority order, so the lots executed by the
+    first k orders are the running min of the liquidity within the limit of each order (which shrinks along the
+    orders) plus the lots of the orders after it, and the cost of any cumulative quantity is read off the cost
+    curve of the levels.
+
+    Returns the executed lots and cost of each order.
+    """
+
+    sign = 1 if side == 'bid' else -1
+    eps = 1e-9 * np.maximum(np.abs(limits), 1)
+    cum_level_lots = np.concatenate(([0], np.cumsum(level_lots)))
+    cum_level_cost = np.concatenate(([0], np.cumsum(level_lots * level_prices)))
+    # liquidity within the limit of each order, the levels are sorted best first
+    in_limit = np.searchsorted(sign * level_prices, sign * limits + eps, side='right')
+    liquidity = cum_level_lots[in_limit]
+    cum_lots = np.cumsum(lots)
+    executed = np.minimum(cum_lots, cum_lots + np.minimum.accumulate(liquidity - cum_lots))
+    # once the liquidity within the limits is used up, the orders further back don't trade
+    executed = np.maximum.accumulate(np.maximum(executed, 0))
+    cost = np.interp(executed, cum_level_lots, cum_level_cost)
+    return np.diff(executed, prepend=0), np.diff(cost, prepend=0)
+
+
+class ChildOrders:
+    """
+        Live passive child orders of an algo on one side of the book, kept as arrays sorted by priority (best price
+        first, then order id) with a map from order id to row. A resting order keeps its limit price until it is
+        executed or cancelled and trades whenever a snapshot offers volume within it, all orders of the algo are
+        matched against a snapshot at once (see match_levels). Quantities are integer numbers of lots.
+
+        Args:
+            side (str): 'bid' or 'ask'
+    """
+
+    def __init__(self, side):
+        if side not in ('bid', 'ask'):
+            raise ValueError("side must be 'bid' or 'ask', got {}".format(side))
+        self.side = side
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.prices = np.zeros(0, dtype=np.float64)
+        self.lots = np.zeros(0, dtype=np.int64)
+        self._rows = {}
+        self._next_id = 0
+        # the orders are matched on the snapshots up to this row of the data feed
+        self.row = 0
+
+    def add(self, price, lots):
+        """ Adds an order of 'lots' at a limit price and returns its id """
+
+        if lots <= 0:
+            raise ValueError("Child orders need a positive number of lots, got {}".format(lots))
+        order_id = self._next_id
+        self._next_id += 1
+        self._set(np.append(self.ids, order_id), np.append(self.prices, float(price)), np.append(self.lots, lots))
+        return order_id
+
+    def cancel(self, order_id):
+        """ Cancels an order and returns its unexecuted lots """
+
+        row = self._rows[order_id]
+        lots = int(self.lots[row])
+        keep = np.arange(len(self.ids)) != row
+        self._set(self.ids[keep], self.prices[keep], self.lots[keep])
+        return lots
+
+    def clear(self):
+        self._set(self.ids[:0], self.prices[:0], self.lots[:0])
+
+    def get(self, order_id):
+        """ Returns the price and remaining lots of an order """
+
+        row = self._rows[order_id]
+        return float(self.prices[row]), int(self.lots[row])
+
+    def thresholds(self):
+        """ Returns the max_ask and min_bid of BestPriceIndex.first_row for the snapshots the orders can trade in """
+
+        if self.side == 'bid':
+            return self.prices[0] + 1e-9 * max(abs(self.prices[0]), 1), -np.inf
+        return np.inf, self.prices[0] - 1e-9 * max(abs(self.prices[0]), 1)
+
+    def match(self, level_prices, level_lots):
+        """ Matches all orders against the opposite side of a snapshot, removes the executed lots and returns the
+        ids, limit prices, lots before the match, executed lots and average prices of the orders that traded """
+
+        executed, cost = match_levels(self.prices, self.lots, level_prices, level_lots, self.side)
+        traded = executed > 0
+        result = (self.ids[traded], self.prices[traded], self.lots[traded], executed[traded],
+                  cost[traded] / executed[traded])
+        lots = self.lots - executed
+        filled = lots == 0
+        self._set(self.ids[~filled], self.prices[~filled], lots[~filled])
+        return result
+
+    def _set(self, ids, prices, lots):
+        # best price first, the older order first at the same price
+        order = np.lexsort((ids, prices if self.side == 'ask' else -prices))
+        self.ids, self.prices, self.lots = ids[order], prices[order], lots[order]
+        self._rows = {int(order_id): row for row, order_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
@@ -1,9 +1,11 @@
 import math
 import copy
+from collections import OrderedDict
 import numpy as np
 from datetime import datetime, timedelta
 from decimal import Decimal
 from random import randint
+from src.core.environment.limit_orders_setup.trade_log import to_unix_us
 import random
 
 
@@ -19,22 +21,65 @@ BUCKET_SIZES_IN_SECS = {"1m": 7,
                         "3h": 900,
                         "4h": 1200}
 
+# types of the events of an algo, the codes of the event table are the indices
+EVENT_TYPES = ('order_placement', 'bucket_bound')
+EVENT_TABLE_DTYPE = np.dtype([('time', np.int64), ('type', np.int8), ('bucket_idx', np.int32), ('order_idx', np.int32)])
+
+# attributes of an ExecutionAlgo that change during its execution, see ExecutionAlgo.get_state()
+ALGO_STATE_ATTRS = ('volumes_per_trade', 'vol_remaining', 'bucket_vol_remaining', 'unexecuted_vol',
+                    'event_idx', 'order_idx', 'bucket_idx')
+
+# placements are on a grid of 1/PLACEMENT_GRID of the bucket, see sample_placements()
+PLACEMENT_GRID = 100
+# draws of the bucket_placement_func of an algo before falling back to sample_placements()
+MAX_PLACEMENT_DRAWS = 100
+
 
 def split_across_buckets(quantity, n_splits, ticks):
-    base_vol, extra_vol = divmod(quantity * int(1/ticks), n_splits)
-    base_vol = Decimal(str(base_vol/int(1/ticks)))
-    extra_vol = Decimal(str(extra_vol/int(1/ticks)))
-    ticks_dec = Decimal(str(ticks))
-    split = [base_vol + ((Decimal(str(i)) * ticks_dec < extra_vol) * ticks_dec) for i in range(n_splits)]
-    return split
-
-
-def _get_execution_times(algo, idx):
-    sample_placements = algo.bucket_placement_func(algo.no_of_slices)
-    if not isinstance(sample_placements, list):
-        sample_placements = [sample_placements]
+    """ Splits a quantity into n_splits Decimal volumes of whole ticks as equally as possible """
+
+    lots_per_unit = int(1/ticks)
+    split = split_lots(round(quantity * lots_per_unit), n_splits)
+    return list(split.astype(object) / Decimal(lots_per_unit))
+
+
+def split_lots(lots, n_splits):
+    """ Splits an integer number of lots (or each of an array of them) into n_splits as equally as possible, the
+    first splits get one lot more. Returns an int64 array with the splits along the last axis. """
+
+    base_lots, extra_lots = np.divmod(np.asarray(lots, dtype=np.int64), n_splits)
+    return base_lots[..., None] + (np.arange(n_splits) < extra_lots[..., None])
+
+
+def allocate_lots(lots, weights):
+    """ Splits an integer number of lots in proportion to non-negative weights, the lots left after rounding down go
+    to the largest remainders. Zero weights everywhere split the lots equally. """
+
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.sum() <= 0:
+        weights = np.ones(len(weights))
+    quotas = int(lots) * weights / weights.sum()
+    allocated = np.floor(quotas).astype(np.int64)
+    allocated[np.argsort(allocated - quotas, kind='stable')[:int(lots) - allocated.sum()]] += 1
+    return allocated
+
+
+def sample_placements(no_of_slices, grid=PLACEMENT_GRID):
+    """ Sorted placements of no_of_slices orders within a bucket (as fractions of it), drawn without replacement
+    from the inner points of a grid of 1/grid, so they all differ and never fall on the bucket bounds. This is
+    the distribution of sorted uniforms rounded to the grid after rejecting duplicates and bounds, in one draw. """
+
+    if no_of_slices >= grid:
+        raise ValueError("A grid of {} can't hold {} placements".format(grid, no_of_slices))
+    return sorted(k / grid for k in random.sample(range(1, grid), no_of_slices))
+
+
+def _get_execution_times(algo, idx, placement_func=None):
+    placements = (placement_func or algo.bucket_placement_func)(algo.no_of_slices)
+    if not isinstance(placements, list):
+        placements = [placements]
     t_diff = algo.buckets.bucket_bounds[idx + 1] - algo.buckets.bucket_bounds[idx]
-    bucket_trades = [algo.buckets.bucket_bounds[idx] + t_diff * plcmt for plcmt in sample_placements]
+    bucket_trades = [algo.buckets.bucket_bounds[idx] + t_diff * plcmt for plcmt in placements]
     return bucket_trades
 
 
@@ -83,20 +128,25 @@ class Bucket:
 
         self.rand_width = rand_width
 
-        # derive bucket bounds
-        b_bounds = [self.start_time]
-        while b_bounds[-1] < self.end_time:
-            if rand_width:
+        # derive bucket bounds (in microseconds)
+        start = np.datetime64(self.start_time, 'us')
+        end = np.datetime64(self.end_time, 'us')
+        if rand_width:
+            # the widths are drawn one after the other until the end is passed, as they are random
+            widths = []
+            t = self.start_time
+            while t < self.end_time:
                 rand_add = randint(-rand_width, rand_width) # rand_width should be a % of the bucket_width, otherwise the bounds could be non-increasing.
-            else:
-                rand_add = 0
-            b_bounds.append(b_bounds[-1] + timedelta(days= 0, seconds= self.bucket_width * ( 1 + rand_add/100)))
-
-        # delete if one was added too much
-        if b_bounds[-1] >= self.end_time:
-            del b_bounds[-1]
+                widths.append(timedelta(days= 0, seconds= self.bucket_width * ( 1 + rand_add/100)))
+                t = t + widths[-1]
+            widths = np.array(widths[:-1], dtype='m8[us]')
+            b_bounds = start + np.concatenate(([np.timedelta64(0, 'us')], np.cumsum(widths)))
+        else:
+            width = np.timedelta64(timedelta(seconds=self.bucket_width), 'us')
+            b_bounds = start + np.arange(max(-(-(end - start) // width), 0)) * width
 
         # finally add the end time of the last bucket & set length
+        b_bounds = b_bounds[b_bounds < end].astype(datetime).tolist()
         b_bounds.append(self.end_time)
         n_buckets = len(b_bounds) - 1
 
@@ -104,6 +154,62 @@ class Bucket:
         self.n_buckets = n_buckets
         return self.bucket_bounds, self.n_buckets
 
+    def shifted(self, start_time):
+        """ Returns a copy of the buckets moved to another start time """
+
+        buckets = copy.copy(self)
+        buckets.start_time = start_time
+        buckets.end_time = start_time + self.duration
+        buckets.bucket_bounds = [start_time + (t - self.start_time) for t in self.bucket_bounds]
+        return buckets
+
+
+class ScheduleTemplateCache:
+    """ Cache of the deterministic part of TWAP schedules.
+
+        Without randomised bucket bounds the buckets and the split of the volume into lots only depend on the
+        duration, volume, number of slices and lot size of the parent order, so they are derived once and shifted to
+        the start time of every further algo with the same parameters. The execution times are still sampled for every
+        algo, as bucket_placement_func is usually random.
+
+        Args:
+            maxsize (int): max number of templates kept (default: 256)
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._templates = OrderedDict()
+
+    @staticmethod
+    def key(algo, duration):
+        return duration, str(algo.volume), algo.no_of_slices, str(algo.lot_size)
+
+    def get(self, key):
+        """ Returns the template (buckets, bucket volumes and volumes per trade in lots) of a key or None """
+
+        if key in self._templates:
+            self._templates.move_to_end(key)
+            return self._templates[key]
+        return None
+
+    def put(self, key, algo):
+        """ Stores the schedule of an algo as template """
+
+        self._templates[key] = (algo.buckets, algo.bucket_volumes.copy(), algo.volumes_per_trade_default.copy())
+        self._templates.move_to_end(key)
+        if len(self._templates) > self.maxsize:
+            self._templates.popitem(last=False)
+
+    def clear(self):
+        self._templates.clear()
+
+    def __len__(self):
+        return len(self._templates)
+
+
+# schedule templates shared by all TWAPAlgos (see TWAPAlgo.schedule_cache)
+SCHEDULE_TEMPLATES = ScheduleTemplateCache()
+
 
 class ExecutionAlgo:
     """ Parent class for the benchmark algos as well as the RL algo itself.
@@ -115,9 +221,13 @@ class ExecutionAlgo:
             end_time (string): end of execution in '%Y-%m-%d %H:%M:%S' format
             no_of_slices (int): number of order splits within a bucket
             bucket_placement_func (func): function returning random splits of buckets
-            tick_size (Decimal): tick size of the market the RL agent is trained on
+            tick_size (Decimal): price tick of the market the RL agent is trained on, the offset of the limit orders
+            lot_size (Decimal): smallest quantity of the market, the unit of the volumes of the algo
             rand_bucket_bounds_width (int): Max % of the bucket width to add/substract from each bucket
 
+        The schedule and the remaining volumes (volumes_per_trade, bucket_volumes, bucket_vol_remaining,
+        vol_remaining) are kept as integer numbers of lots of lot_size, only the orders get Decimal volumes.
+
         """
 
     def __init__(self,
@@ -143,13 +253,10 @@ class ExecutionAlgo:
 
     def reset(self):
         if type(self).__name__ != 'RLAlgo':
-            self.volumes_per_trade = copy.deepcopy(self.volumes_per_trade_default)
+            self.volumes_per_trade = self.volumes_per_trade_default.copy()
         else:
-            volumes_per_trade = []
-            for bucket in range(len(self.volumes_per_trade)):
-                volumes_per_trade.append(list([Decimal(0) for order_event in self.volumes_per_trade_default[bucket]]))
-            self.volumes_per_trade = volumes_per_trade
-        self.vol_remaining = Decimal(str(self.volume))
+            self.volumes_per_trade = np.zeros_like(self.volumes_per_trade_default)
+        self.vol_remaining = self.volume_lots
         self.bucket_vol_remaining = self.bucket_volumes.copy()
         self.event_idx = 0
         self.order_idx = 0
@@ -157,26 +264,77 @@ class ExecutionAlgo:
 
     def _sample_execution_times(self):
         exec_times = []
+        bucket_bounds = set(self.buckets.bucket_bounds)
 
         for i in range(0, self.buckets.n_buckets):
             bucket_trades = _get_execution_times(self, i)
             # make sure trade times are different from each other and from bucket bounds
+            draws = 1
             while len(set(bucket_trades)) < self.no_of_slices or \
-                    any(trade in self.buckets.bucket_bounds for trade in bucket_trades):
+                    any(trade in bucket_bounds for trade in bucket_trades):
+                if draws == MAX_PLACEMENT_DRAWS:
+                    bucket_trades = _get_execution_times(self, i, sample_placements)
+                    break
                 bucket_trades = _get_execution_times(self, i)
+                draws += 1
             exec_times.append(bucket_trades)
         self.execution_times = exec_times
         flat_exec_times = [item for sublist in exec_times for item in sublist]
         self.algo_events = sorted(list(set(flat_exec_times + self.buckets.bucket_bounds[1:])))
+        self._build_event_table()
+
+    def _build_event_table(self):
+        """ Builds the table of the events (one row per entry of algo_events) with their time in microseconds, type
+        code (see EVENT_TYPES), bucket index and order index within the bucket (-1 for bucket bounds) """
+
+        events = {}
+        for bucket_idx, bucket_trades in enumerate(self.execution_times):
+            for order_idx, t in enumerate(bucket_trades):
+                events[t] = (EVENT_TYPES.index('order_placement'), bucket_idx, order_idx)
+        for bucket_idx, t in enumerate(self.buckets.bucket_bounds[1:]):
+            events.setdefault(t, (EVENT_TYPES.index('bucket_bound'), bucket_idx, -1))
+        self.event_table = np.array([(to_unix_us(t),) + events[t] for t in self.algo_events], dtype=EVENT_TABLE_DTYPE)
+
+    def to_lots(self, volume):
+        """ Converts a volume (Decimal, float or str) into the number of lots of lot_size """
+
+        return int((Decimal(str(volume)) / self.lot_size).to_integral_value())
+
+    def to_volume(self, lots):
+        """ Converts a number of lots into the Decimal volume of the orders """
+
+        return Decimal(int(lots)) * self.lot_size
+
+    def to_float_volume(self, lots):
+        """ Converts lots (or an array of lots) into float volumes """
+
+        return np.asarray(lots) / int(1 / self.lot_size)
+
+    def get_state(self):
+        """ Returns a copy of the state that changes while the algo is executed (volumes and event/order/bucket idx) """
+
+        state = {attr: copy.deepcopy(getattr(self, attr)) for attr in ALGO_STATE_ATTRS if hasattr(self, attr)}
+        return state
+
+    def set_state(self, state):
+        """ Restores a state returned by get_state() """
+
+        for attr, value in state.items():
+            setattr(self, attr, copy.deepcopy(value))
+
+    def fork(self):
+        """ Returns a copy of the algo with its own state (see get_state), the schedule is shared """
+
+        clone = copy.copy(self)
+        # get_state() already copies the state
+        clone.__dict__.update(self.get_state())
+        return clone
 
     def get_next_event(self):
         """ gets the time stamp for the next event which might trigger an order """
 
         event_time = self.algo_events[self.event_idx]
-        event_type = 'order_placement'
-        if not any(event_time in sublist for sublist in self.execution_times):
-            event_type = 'bucket_bound'
-        event = {'type': event_type, 'time': event_time}
+        event = {'type': EVENT_TYPES[self.event_table['type'][self.event_idx]], 'time': event_time}
 
         # update the event_idx
         if not self.event_idx == len(self.algo_events)-1:
@@ -208,7 +366,7 @@ class ExecutionAlgo:
             order = {'type': 'limit',
                      'timestamp': datetime.strftime(event['time'], '%Y-%m-%d %H:%M:%S.%f'),
                      'side': side,
-                     'quantity': self.volumes_per_trade[self.bucket_idx][self.order_idx],
+                     'quantity': self.to_volume(self.volumes_per_trade[self.bucket_idx][self.order_idx]),
                      'price': p,
                      'trade_id': trade_id}
             self.order_idx += 1
@@ -217,7 +375,7 @@ class ExecutionAlgo:
             order = {'type': 'market',
                      'timestamp': datetime.strftime(event['time'], '%Y-%m-%d %H:%M:%S.%f'),
                      'side': side,
-                     'quantity': self.bucket_vol_remaining[self.bucket_idx],
+                     'quantity': self.to_volume(self.bucket_vol_remaining[self.bucket_idx]),
                      'trade_id': trade_id}
         else:
             raise ValueError('No such event type allowed !!!')
@@ -228,11 +386,13 @@ class ExecutionAlgo:
         return order
 
     def update_remaining_volume(self, trade_log, event_type=None):
-        if trade_log is not None and trade_log['quantity'] > 0:
-            self.vol_remaining -= Decimal(str(trade_log['quantity']))
-            self.bucket_vol_remaining[self.bucket_idx] -= Decimal(str(trade_log['quantity']))
+        # trade_log is the Fill of the order (see broker.place_order)
+        if trade_log is not None and trade_log.quantity > 0:
+            lots = self.to_lots(trade_log.quantity)
+            self.vol_remaining -= lots
+            self.bucket_vol_remaining[self.bucket_idx] -= lots
 
-        if self.vol_remaining < -self.tick_size * len(self.bucket_volumes) or self.bucket_vol_remaining[self.bucket_idx] < -self.tick_size:
+        if self.vol_remaining < -len(self.bucket_volumes) or self.bucket_vol_remaining[self.bucket_idx] < -1:
             raise ValueError("More volume than available placed!")
 
         if event_type is not None and event_type == 'bucket_bound':
@@ -243,7 +403,7 @@ class ExecutionAlgo:
 
         import matplotlib.pyplot as plt
         # Get all the volumes of all limit orders
-        y = [float(item) for sublist in self.volumes_per_trade for item in sublist]
+        y = [float(item) for sublist in self.to_float_volume(self.volumes_per_trade) for item in sublist]
         # And the bucket bounds
         i = self.no_of_slices
         while i < len(y):
@@ -301,57 +461,131 @@ class ExecutionAlgo:
 class TWAPAlgo(ExecutionAlgo):
     """ Implementation of a TWAP Execution Algo based on the base algo logic """
 
+    # set to None to derive the buckets and volumes of every algo from scratch
+    schedule_cache = SCHEDULE_TEMPLATES
+
     def __init__(self, *args, **kwargs):
         super(TWAPAlgo, self).__init__(*args, **kwargs)
-        # get the tick size implied by LOB data_feed
-        self.broker_data_feed.reset(time=self.start_time)
-        dt, lob = self.broker_data_feed.next_lob_snapshot()
-        v = lob.bids.get_price_list(lob.get_best_bid()).volume
-        tick = Decimal(str(1 / (10 ** abs(v.as_tuple().exponent))))
-        self.tick_size = tick
+        # get the price tick and lot size of the LOB data_feed, feeds resolve them once per day. Duck-typed feeds may
+        # not resolve them (or use the names for plain attributes), then the tick size is inferred from the data
+        resolvers = [getattr(self.broker_data_feed, name, None) for name in ('price_tick', 'lot_size')]
+        try:
+            if not all(callable(resolver) for resolver in resolvers):
+                raise NotImplementedError
+            self.tick_size, self.lot_size = (resolver(self.start_time) for resolver in resolvers)
+        except NotImplementedError:
+            self.tick_size = self.lot_size = self._infer_tick_size()
+        self.volume_lots = self.to_lots(self.volume)
         # Derive trading schedules
         start_time = datetime.strptime(self.start_time, '%Y-%m-%d %H:%M:%S')
         end_time = datetime.strptime(self.end_time, '%Y-%m-%d %H:%M:%S')
-        self.buckets = Bucket(start_time, end_time, self.rand_bucket_bounds_width)
-
-        # split volume across buckets and check if this worked
-        self._split_volume_across_buckets()
-        if abs(np.sum(self.bucket_volumes) - self.volume) > self.tick_size:
-            raise ValueError("Volumes split across buckets didn't work out!")
+        # randomised bucket bounds can't be reused
+        use_cache = self.schedule_cache is not None and not self.rand_bucket_bounds_width
+        template_key = ScheduleTemplateCache.key(self, end_time - start_time) if use_cache else None
+        template = self.schedule_cache.get(template_key) if use_cache else None
+
+        if template is None:
+            self.buckets = Bucket(start_time, end_time, self.rand_bucket_bounds_width)
+
+            # split volume across buckets and check if this worked
+            self._split_volume_across_buckets()
+            if np.sum(self.bucket_volumes) != self.volume_lots:
+                raise ValueError("Volumes split across buckets didn't work out!")
+
+            # split volume across orders/check
+            self._split_volume_within_buckets()
+            if np.sum(self.volumes_per_trade) != self.volume_lots:
+                raise ValueError("Volumes split across orders didn't work out!")
+            if use_cache:
+                self.schedule_cache.put(template_key, self)
+        else:
+            buckets, bucket_volumes, volumes_per_trade = template
+            self.buckets = buckets.shifted(start_time)
+            self.bucket_volumes = bucket_volumes.copy()
+            self.volumes_per_trade = volumes_per_trade.copy()
+            self.volumes_per_trade_default = volumes_per_trade.copy()
 
-        # get execution times and split volume across orders/check
+        # get execution times
         self._sample_execution_times()
-        self._split_volume_within_buckets()
-        if abs(np.sum(self.volumes_per_trade) - self.volume) > self.tick_size:
-            raise ValueError("Volumes split across orders didn't work out!")
         self.bmk_vwap = np.NaN
 
+    def _infer_tick_size(self):
+        """ Infers the tick size from the volume of the best bid at the start time, for feeds without price ticks
+        and lot sizes, where it serves as both """
+
+        self.broker_data_feed.reset(time=self.start_time)
+        dt, lob = self.broker_data_feed.next_lob_snapshot()
+        v = lob.bids.get_price_list(lob.get_best_bid()).volume
+        return Decimal(str(1 / (10 ** abs(v.as_tuple().exponent))))
+
     def _split_volume_across_buckets(self):
         """ Aims to split volume across buckets as equal as possible """
 
         perc_last_bucket = (self.buckets.bucket_bounds[-1] - self.buckets.bucket_bounds[-2]) / \
                            (self.buckets.bucket_bounds[-1] - self.buckets.bucket_bounds[0])
-        vol_last_bucket = math.floor(float(self.volume) * perc_last_bucket
-                                     * int(1/self.tick_size))/int(1/self.tick_size)
+        lots_last_bucket = math.floor(float(self.volume) * perc_last_bucket * int(1/self.lot_size))
 
         # distribute volume across all buckets and add remaining to last
-        bucket_vol = split_across_buckets(float(self.volume) - vol_last_bucket,
-                                          self.buckets.n_buckets - 1, float(self.tick_size))
-        bucket_vol.append(Decimal(str(vol_last_bucket)))
-
-        self.bucket_volumes = bucket_vol
+        bucket_lots = split_lots(self.volume_lots - lots_last_bucket, self.buckets.n_buckets - 1)
+        self.bucket_volumes = np.append(bucket_lots, lots_last_bucket)
 
     def _split_volume_within_buckets(self):
         """ Aims to split bucket volumes across trades as equal as possible """
 
-        split_vols = []
-        for i in range(self.buckets.n_buckets):
-            vols_per_trade = split_across_buckets(float(self.bucket_volumes[i]),
-                                                  self.no_of_slices, float(self.tick_size))
-            split_vols.append(vols_per_trade)
+        split_vols = split_lots(self.bucket_volumes, self.no_of_slices)
 
         self.volumes_per_trade = split_vols
-        self.volumes_per_trade_default = copy.deepcopy(split_vols)
+        self.volumes_per_trade_default = split_vols.copy()
+
+
+class VWAPAlgo(TWAPAlgo):
+    """ Implementation of a VWAP Execution Algo: the buckets and orders are the ones of the TWAP, but the volume is
+    split across the buckets in proportion to their expected market activity, read from the intraday activity
+    profile of the data feed (see HistoricalDataFeed.activity_profile) """
+
+    # the schedule depends on the time of day, so it can't be shifted to other start times
+    schedule_cache = None
+    # width of the bins of the activity profile
+    profile_bin_seconds = 60
+
+    def _expected_bucket_activity(self):
+        """ Returns the expected market activity of every bucket, one lookup in the profile for all of them """
+
+        profile = self.broker_data_feed.activity_profile(self.profile_bin_seconds)
+        bounds = np.array(self.buckets.bucket_bounds, dtype='M8[us]').astype(np.int64) / 1000
+        return profile.activity_between(bounds[:-1], bounds[1:])
+
+    def _split_volume_across_buckets(self):
+        """ Splits the volume across buckets in proportion to their expected activity """
+
+        self.bucket_volumes = allocate_lots(self.volume_lots, self._expected_bucket_activity())
+
+
+class POVAlgo(VWAPAlgo):
+    """ Implementation of a percent of volume Execution Algo: each bucket trades participation_rate of its expected
+    market activity (see VWAPAlgo) until the volume is done, the volume left at the end time is traded in the last
+    bucket.
+
+        Args:
+            participation_rate (float): share of the expected activity to trade, in (0, 1] (default: 0.1)
+            see ExecutionAlgo for the other arguments
+    """
+
+    def __init__(self, *args, participation_rate=0.1, **kwargs):
+        if not 0 < participation_rate <= 1:
+            raise ValueError("participation_rate has to be in (0, 1], got {}".format(participation_rate))
+        self.participation_rate = participation_rate
+        super(POVAlgo, self).__init__(*args, **kwargs)
+
+    def _split_volume_across_buckets(self):
+        """ Schedules participation_rate of the expected activity of the buckets up to the volume """
+
+        target_lots = self.participation_rate * self._expected_bucket_activity() * int(1 / self.lot_size)
+        # round away the float noise of the activity before rounding down to whole lots
+        target_lots = np.floor(np.round(target_lots, 6))
+        scheduled_lots = np.minimum(np.cumsum(target_lots.astype(np.int64)), self.volume_lots)
+        self.bucket_volumes = np.diff(scheduled_lots, prepend=0)
+        self.bucket_volumes[-1] += self.volume_lots - scheduled_lots[-1]
 
 
 class RLAlgo(ExecutionAlgo):
@@ -360,19 +594,20 @@ class RLAlgo(ExecutionAlgo):
     def __init__(self, benchmark_algo, *args, **kwargs):
         super(RLAlgo, self).__init__(*args, **kwargs)
         self.algo_events = benchmark_algo.algo_events
+        self.event_table = benchmark_algo.event_table
         self.start_time = benchmark_algo.start_time
         self.end_time = benchmark_algo.end_time
         self.execution_times = benchmark_algo.execution_times
         self.tick_size = benchmark_algo.tick_size
+        self.lot_size = benchmark_algo.lot_size
+        self.volume_lots = self.to_lots(self.volume)
         self.buckets = benchmark_algo.buckets
         self.bucket_volumes = benchmark_algo.bucket_volumes.copy()
         self.bucket_vol_remaining = benchmark_algo.bucket_volumes.copy()
-        self.volumes_per_trade = []
-        for bucket in range(len(benchmark_algo.volumes_per_trade)):
-            self.volumes_per_trade.append(list([Decimal(0) for order_event in benchmark_algo.volumes_per_trade_default[bucket]]))
-        self.volumes_per_trade_default = copy.deepcopy(benchmark_algo.volumes_per_trade_default)
+        self.volumes_per_trade = np.zeros_like(benchmark_algo.volumes_per_trade_default)
+        self.volumes_per_trade_default = benchmark_algo.volumes_per_trade_default.copy()
 
-        self.vol_remaining = Decimal(str(self.volume))
+        self.vol_remaining = self.volume_lots
         self.bucket_vol_remaining = self.bucket_volumes.copy()
         self.event_idx = 0
         self.order_idx = 0
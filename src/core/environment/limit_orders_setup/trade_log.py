@@ -0,0 +1,258 @@
+import copy
+import numpy as np
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+MESSAGES = ('trade', 'no_trade')
+ORDER_TYPES = ('limit', 'market')
+SIDES = ('bid', 'ask')
+TRADE = MESSAGES.index('trade')
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def to_unix_us(time):
+    """ Converts a (naive UTC) datetime or a timestamp string of the trade logs into microseconds since the epoch """
+
+    if isinstance(time, str):
+        time = datetime.strptime(time, TIMESTAMP_FORMAT)
+    return (time - EPOCH) // ONE_MICROSECOND
+
+
+class Fill:
+    """
+        Outcome of placing one order on a snapshot (see broker.place_order) with numeric fields only: the timestamp in
+        microseconds, the volume weighted price, the executed and target quantity and the message, order type and
+        side as indices into MESSAGES, ORDER_TYPES and SIDES. TradeLog.append_fill writes it into the columns as is,
+        the log dicts with formatted timestamps are only built when the logs are read.
+    """
+
+    __slots__ = ('ts', 'price', 'quantity', 'target_quantity', 'message', 'order_type', 'side')
+
+    def __init__(self, ts, price, quantity, target_quantity, message, order_type, side):
+        self.ts = ts
+        self.price = price
+        self.quantity = quantity
+        self.target_quantity = target_quantity
+        self.message = message
+        self.order_type = order_type
+        self.side = side
+
+
+class TradeLog:
+    """
+        Columnar trade log of one algo. Every placement of an order is one row of typed arrays (timestamp in
+        microseconds, price, executed and target quantity, message, order type and side), which grow by doubling, so
+        appending is cheap and VWAPs over time ranges are computed on the arrays without parsing any timestamps.
+        Running sums of the traded value and quantity are kept along with the rows, so the VWAP of any range is
+        a difference of two sums and, as long as the logs are in time order, a range is found by binary search.
+
+        Indexing and iterating give the log dicts the Broker used to store ('timestamp' as string, 'price' and
+        'quantity' as Decimal), so code reading single logs (e.g. ExecutionAlgo.plot_schedule) works unchanged.
+    """
+
+    def __init__(self, capacity=256):
+        self.n = 0
+        self._ts = np.zeros(capacity, dtype=np.int64)
+        self._price = np.zeros(capacity, dtype=np.float64)
+        self._quantity = np.zeros(capacity, dtype=np.float64)
+        self._target_quantity = np.zeros(capacity, dtype=np.float64)
+        self._message = np.zeros(capacity, dtype=np.int8)
+        self._type = np.zeros(capacity, dtype=np.int8)
+        self._side = np.zeros(capacity, dtype=np.int8)
+        # traded value (price x quantity) and quantity up to and including each row
+        self._cum_value = np.zeros(capacity, dtype=np.float64)
+        self._cum_quantity = np.zeros(capacity, dtype=np.float64)
+        self._in_time_order = True
+        # forks share the columns (see fork), a log that doesn't own its columns copies them before writing
+        self._owns_columns = True
+        self._shared_rows = 0
+
+    @property
+    def ts(self):
+        return self._ts[:self.n]
+
+    @property
+    def price(self):
+        return self._price[:self.n]
+
+    @property
+    def quantity(self):
+        return self._quantity[:self.n]
+
+    @property
+    def target_quantity(self):
+        return self._target_quantity[:self.n]
+
+    @property
+    def is_trade(self):
+        return self._message[:self.n] == MESSAGES.index('trade')
+
+    def append(self, log, dt=None):
+        """ Appends a log dict of place_order(), the datetime of the log saves parsing its timestamp """
+
+        self.append_rows(ts=to_unix_us(dt if dt is not None else log['timestamp']),
+                         price=float(log['price']),
+                         quantity=float(log['quantity']),
+                         target_quantity=float(log['target_quantity']),
+                         message=log['message'],
+                         order_type=log['type'],
+                         side=log['side'])
+
+    def append_fill(self, fill):
+        """ Appends the Fill of one order placement """
+
+        n = self.n
+        self._reserve(n + 1)
+        self._ts[n] = fill.ts
+        self._price[n] = fill.price
+        self._quantity[n] = fill.quantity
+        self._target_quantity[n] = fill.target_quantity
+        self._message[n] = fill.message
+        self._type[n] = fill.order_type
+        self._side[n] = fill.side
+        traded = fill.quantity if fill.message == TRADE else 0
+        cum_value, cum_quantity = (self._cum_value[n - 1], self._cum_quantity[n - 1]) if n > 0 else (0, 0)
+        self._cum_value[n] = cum_value + fill.price * traded
+        self._cum_quantity[n] = cum_quantity + traded
+        if self._in_time_order and n > 0 and fill.ts < self._ts[n - 1]:
+            self._in_time_order = False
+        self.n = n + 1
+
+    def extend(self, logs):
+        for log in logs:
+            self.append(log)
+
+    def append_rows(self, ts, price, quantity, target_quantity, message, order_type, side):
+        """ Appends one or more rows at once, the arguments are broadcast against the timestamps (in microseconds) """
+
+        ts = np.atleast_1d(ts)
+        n_new = len(ts)
+        self._reserve(self.n + n_new)
+        rows = slice(self.n, self.n + n_new)
+        self._ts[rows] = ts
+        self._price[rows] = price
+        self._quantity[rows] = quantity
+        self._target_quantity[rows] = target_quantity
+        self._message[rows] = MESSAGES.index(message)
+        self._type[rows] = ORDER_TYPES.index(order_type)
+        self._side[rows] = SIDES.index(side)
+        traded = self._quantity[rows] * (self._message[rows] == MESSAGES.index('trade'))
+        cum_value, cum_quantity = 0, 0
+        if self.n > 0:
+            cum_value, cum_quantity = self._cum_value[self.n - 1], self._cum_quantity[self.n - 1]
+        self._cum_value[rows] = cum_value + np.cumsum(self._price[rows] * traded)
+        self._cum_quantity[rows] = cum_quantity + np.cumsum(traded)
+        if self._in_time_order:
+            self._in_time_order = bool(np.all(np.diff(self._ts[max(self.n - 1, 0):self.n + n_new]) >= 0))
+        self.n += n_new
+
+    def clear(self):
+        self.n = 0
+        self._in_time_order = True
+        if self._shared_rows:
+            # the rows are still read by forks, so the next rows go into new columns
+            self._owns_columns = False
+            self._shared_rows = 0
+
+    def fork(self):
+        """ Returns a copy of the log which shares the columns with this log until it appends rows (copy-on-write).
+        Both logs only append after their own rows, so this log keeps writing into the shared columns. """
+
+        clone = copy.copy(self)
+        clone._owns_columns = False
+        clone._shared_rows = 0
+        self._shared_rows = max(self._shared_rows, self.n)
+        return clone
+
+    def range_indices(self, start_date=None, end_date=None):
+        """ Returns the rows from the first log after start_date up to and including the first log at or after
+        end_date (up to the last log if there is none). Raises a ValueError if there is no log after start_date. """
+
+        ts = self.ts
+        start_idx, end_idx = 0, self.n
+        if start_date is not None:
+            start = to_unix_us(start_date)
+            if self._in_time_order:
+                start_idx = int(np.searchsorted(ts, start, side='right'))
+            else:
+                after_start = ts > start
+                start_idx = int(np.argmax(after_start)) if after_start.any() else self.n
+            if start_idx == self.n:
+                raise ValueError("No trade logs after {}".format(start_date))
+        if end_date is not None:
+            end = to_unix_us(end_date)
+            if self._in_time_order:
+                end_idx = min(int(np.searchsorted(ts, end, side='left')) + 1, self.n)
+            else:
+                after_end = ts >= end
+                if after_end.any():
+                    end_idx = int(np.argmax(after_end)) + 1
+        return start_idx, end_idx
+
+    def vwap(self, start_date=None, end_date=None):
+        """ Returns the VWAP of the trades between two dates (see range_indices) or 0 if there are none """
+
+        return self.vwap_rows(*self.range_indices(start_date, end_date))
+
+    def vwap_rows(self, start_idx=0, end_idx=None):
+        """ Returns the VWAP of the trades in the rows start_idx up to end_idx (excluded) or 0 if there are none """
+
+        end_idx = self.n if end_idx is None else end_idx
+        if end_idx <= start_idx:
+            return 0
+        value = self._cum_value[end_idx - 1]
+        quantity = self._cum_quantity[end_idx - 1]
+        if start_idx > 0:
+            value -= self._cum_value[start_idx - 1]
+            quantity -= self._cum_quantity[start_idx - 1]
+        if quantity <= 0:
+            return 0
+        return float(value / quantity)
+
+    def _reserve(self, capacity):
+        if capacity <= len(self._ts) and self._owns_columns:
+            return
+        new_capacity = max(capacity, 2 * len(self._ts)) if capacity > len(self._ts) else len(self._ts)
+        for attr in ('_ts', '_price', '_quantity', '_target_quantity', '_message', '_type', '_side', '_cum_value',
+                     '_cum_quantity'):
+            column = getattr(self, attr)
+            new_column = np.zeros(new_capacity, dtype=column.dtype)
+            new_column[:self.n] = column[:self.n]
+            setattr(self, attr, new_column)
+        self._owns_columns = True
+
+    def _log(self, idx):
+        return {'timestamp': (EPOCH + int(self._ts[idx]) * ONE_MICROSECOND).strftime(TIMESTAMP_FORMAT),
+                'message': MESSAGES[self._message[idx]],
+                'type': ORDER_TYPES[self._type[idx]],
+                'side': SIDES[self._side[idx]],
+                'price': Decimal(str(float(self._price[idx]))),
+                'quantity': Decimal(str(float(self._quantity[idx]))),
+                'target_quantity': Decimal(str(float(self._target_quantity[idx])))}
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._log(i) for i in range(*idx.indices(self.n))]
+        if idx < 0:
+            idx += self.n
+        if not 0 <= idx < self.n:
+            raise IndexError("Trade log index out of range")
+        return self._log(idx)
+
+    def __iter__(self):
+        return (self._log(i) for i in range(self.n))
+
+    def __eq__(self, other):
+        if isinstance(other, TradeLog):
+            return self.n == other.n and all(np.array_equal(getattr(self, attr)[:self.n], getattr(other, attr)[:self.n])
+                                             for attr in ('_ts', '_price', '_quantity', '_target_quantity',
+                                                          '_message', '_type', '_side'))
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
@@ -1,13 +1,25 @@
 import sys
+import numpy as np
 from collections import deque # a faster insert/pop queue
 from six.moves import cStringIO as StringIO
 from decimal import Decimal
 from src.core.environment.ordertree import OrderTree
+from src.core.environment.tradetape import TradeTape
+
+# None disables the tape, 'deque' keeps every trade dict, 'ring' keeps the last tape_maxlen trade dicts
+# and 'columnar' keeps prices and quantities in typed arrays (see TradeTape)
+TAPE_MODES = (None, 'deque', 'ring', 'columnar')
 
 
 class OrderBook(object):
-    def __init__(self, tick_size = 0.0001):
-        self.tape = deque(maxlen=None) # Index[0] is most recent trade
+    def __init__(self, tick_size = 0.0001, tape_mode='deque', tape_maxlen=None):
+        if tape_mode not in TAPE_MODES:
+            raise ValueError("tape_mode has to be one of {}".format(TAPE_MODES))
+        if tape_mode == 'ring' and not tape_maxlen:
+            raise ValueError("tape_mode 'ring' requires a positive tape_maxlen")
+        self.tape_mode = tape_mode
+        self.tape_maxlen = tape_maxlen
+        self.tape = self._new_tape()
         self.bids = OrderTree()
         self.asks = OrderTree()
         self.last_tick = None
@@ -16,6 +28,15 @@ class OrderBook(object):
         self.time = 0
         self.next_order_id = 0
 
+    def _new_tape(self):
+        if self.tape_mode == 'deque':
+            return deque(maxlen=None) # Index[0] is the oldest trade
+        elif self.tape_mode == 'ring':
+            return deque(maxlen=self.tape_maxlen)
+        elif self.tape_mode == 'columnar':
+            return TradeTape(maxlen=self.tape_maxlen)
+        return None
+
     def update_time(self):
         self.time += 1
 
@@ -40,6 +61,66 @@ class OrderBook(object):
             sys.exit("order_type for process_order() is neither 'market' or 'limit'")
         return trades, order_in_book
 
+    def process_orders(self, quotes, from_data=False, verbose=False):
+        '''
+        Processes a batch of orders, e.g. for seeding a book from a snapshot or replaying data in bulk.
+        The batch is validated once and limit orders which don't cross the book are inserted into the
+        price levels in bulk. Market orders and crossing limit orders still go through process_order.
+        '''
+        for quote in quotes:
+            if quote['quantity'] <= 0:
+                sys.exit('process_orders() given order of quantity <= 0')
+            if quote['type'] not in ('market', 'limit'):
+                sys.exit("order_type for process_orders() is neither 'market' or 'limit'")
+            if quote['side'] not in ('bid', 'ask'):
+                sys.exit('process_orders() given neither "bid" nor "ask"')
+
+        trades = []
+        orders_in_book = []
+        pending = {'bid': [], 'ask': []} # resting orders waiting for the bulk insert
+        pending_best = {'bid': None, 'ask': None} # best price among the pending orders of each side
+        for quote in quotes:
+            side = quote['side']
+            if quote['type'] == 'limit':
+                quote['price'] = Decimal(quote['price'])
+                if not self._crosses(quote, pending_best):
+                    if from_data:
+                        self.time = quote['timestamp']
+                    else:
+                        self.update_time()
+                        quote['timestamp'] = self.time
+                        self.next_order_id += 1
+                        quote['order_id'] = self.next_order_id
+                    pending[side].append(quote)
+                    if pending_best[side] is None or (quote['price'] > pending_best[side]) == (side == 'bid'):
+                        pending_best[side] = quote['price']
+                    orders_in_book.append(quote)
+                    continue
+            # the order trades, so the pending orders have to be in the book before matching
+            self._flush_pending(pending, pending_best)
+            new_trades, order_in_book = self.process_order(quote, from_data, verbose)
+            trades += new_trades
+            if order_in_book is not None:
+                orders_in_book.append(order_in_book)
+        self._flush_pending(pending, pending_best)
+        return trades, orders_in_book
+
+    def _crosses(self, quote, pending_best):
+        '''Checks if a limit order would trade against the book or against the pending orders of a batch'''
+        if quote['side'] == 'bid':
+            best_asks = [p for p in (self.asks.min_price(), pending_best['ask']) if p is not None]
+            return len(best_asks) > 0 and quote['price'] >= min(best_asks)
+        else:
+            best_bids = [p for p in (self.bids.max_price(), pending_best['bid']) if p is not None]
+            return len(best_bids) > 0 and quote['price'] <= max(best_bids)
+
+    def _flush_pending(self, pending, pending_best):
+        for side, tree in (('bid', self.bids), ('ask', self.asks)):
+            if pending[side]:
+                tree.insert_orders(pending[side])
+                pending[side] = []
+                pending_best[side] = None
+
     def process_order_list(self, side, order_list, quantity_still_to_trade, quote, verbose):
         '''
         Takes an OrderList (stack of orders at one price) and an incoming order and matches
@@ -57,6 +138,10 @@ class OrderBook(object):
                 # Do the transaction
                 new_book_quantity = head_order.quantity - quantity_to_trade
                 head_order.update_quantity(new_book_quantity, head_order.timestamp)
+                if side == 'bid':
+                    self.bids.invalidate_depth()
+                else:
+                    self.asks.invalidate_depth()
                 quantity_to_trade = 0
             elif quantity_to_trade == head_order.quantity:
                 traded_quantity = quantity_to_trade
@@ -89,7 +174,8 @@ class OrderBook(object):
                 transaction_record['party1'] = [counter_party, 'ask', head_order.order_id, new_book_quantity]
                 transaction_record['party2'] = [quote['trade_id'], 'bid', None, None]
 
-            self.tape.append(transaction_record)
+            if self.tape is not None:
+                self.tape.append(transaction_record)
             trades.append(transaction_record)
         return quantity_to_trade, trades
 
@@ -181,12 +267,12 @@ class OrderBook(object):
         if side == 'bid':
             volume = 0
             if self.bids.price_exists(price):
-                volume = self.bids.get_price(price).volume
+                volume = self.bids.get_price_list(price).volume
             return volume
         elif side == 'ask':
             volume = 0
             if self.asks.price_exists(price):
-                volume = self.asks.get_price(price).volume
+                volume = self.asks.get_price_list(price).volume
             return volume
         else:
             sys.exit('get_volume_at_price() given neither "bid" nor "ask"')
@@ -203,18 +289,72 @@ class OrderBook(object):
     def get_worst_ask(self):
         return self.asks.max_price()
 
+    def depth_arrays(self, depth):
+        '''
+        Returns float64 arrays (bid_prices, bid_volumes, ask_prices, ask_volumes) of the best 'depth' levels
+        of each side, all sorted by ascending price. The arrays are cached by the OrderTrees.
+        '''
+        bid_prices, bid_volumes = self.bids.depth_arrays()
+        ask_prices, ask_volumes = self.asks.depth_arrays()
+        n_bids = max(len(bid_prices) - depth, 0)
+        return bid_prices[n_bids:], bid_volumes[n_bids:], ask_prices[:depth], ask_volumes[:depth]
+
+    def seed_depth_arrays(self, bid_prices, bid_volumes, ask_prices, ask_volumes):
+        '''
+        Fills the depth caches of a freshly built book straight from the float arrays it was built from.
+        This only happens if every entry became one price level and the prices are ascending, otherwise
+        the trees build the arrays lazily.
+        '''
+        bid_prices = np.array(bid_prices, dtype=np.float64)
+        ask_prices = np.array(ask_prices, dtype=np.float64)
+        if len(ask_prices) == self.asks.depth and len(bid_prices) == self.bids.depth and \
+                np.all(np.diff(ask_prices) > 0) and np.all(np.diff(bid_prices) > 0):
+            self.asks.set_depth_arrays(ask_prices, np.array(ask_volumes, dtype=np.float64))
+            self.bids.set_depth_arrays(bid_prices, np.array(bid_volumes, dtype=np.float64))
+
+    @classmethod
+    def from_arrays(cls, bid_prices, bid_volumes, ask_prices, ask_volumes, tick_size=0.0001, tape_mode='deque',
+                    tape_maxlen=None):
+        '''Builds a book holding one order per price level from ascending price and volume arrays'''
+        lob = cls(tick_size=tick_size, tape_mode=tape_mode, tape_maxlen=tape_maxlen)
+        quotes = []
+        # same insertion order as raw_to_order_book: bids then asks, best price first
+        for side, prices, volumes in (('bid', bid_prices[::-1], bid_volumes[::-1]),
+                                      ('ask', ask_prices, ask_volumes)):
+            for price, volume in zip(prices, volumes):
+                quotes.append({'type': 'limit',
+                               'side': side,
+                               'quantity': Decimal(str(volume)),
+                               'price': Decimal(str(price)),
+                               'trade_id': len(quotes)})
+        lob.process_orders(quotes, False, False)
+        lob.seed_depth_arrays(bid_prices, bid_volumes, ask_prices, ask_volumes)
+        return lob
+
+    def snapshot(self):
+        '''Returns a compact frozen copy of the price levels of the book (see BookSnapshot).'''
+        from src.core.environment.booksnapshot import BookSnapshot
+        return BookSnapshot.from_order_book(self)
+
+    def clone(self):
+        '''Returns an independent copy of the book aggregated by price level, without deep copying it.'''
+        return self.snapshot().to_order_book()
+
     def tape_dump(self, filename, filemode, tapemode):
-        dumpfile = open(filename, filemode)
-        for tapeitem in self.tape:
-            dumpfile.write('Time: %s, Price: %s, Quantity: %s\n' % (tapeitem['time'],
-                                                                    tapeitem['price'],
-                                                                    tapeitem['quantity']))
-        dumpfile.close()
+        if self.tape is None:
+            return
+        with open(filename, filemode) as dumpfile:
+            if self.tape_mode == 'columnar':
+                self.tape.dump(dumpfile)
+            else:
+                dumpfile.write(''.join(['Time: %s, Price: %s, Quantity: %s\n' % (tapeitem['time'],
+                                                                                tapeitem['price'],
+                                                                                tapeitem['quantity'])
+                                        for tapeitem in self.tape]))
         if tapemode == 'wipe':
-            self.tape = []
+            self.tape = self._new_tape()
 
-    def __str__(self):
-        tempfile = StringIO()
+    def _write_levels(self, tempfile):
         tempfile.write("***Bids***\n")
         if self.bids != None and len(self.bids) > 0:
             for key, value in reversed(self.bids.price_map.items()):
@@ -223,12 +363,19 @@ class OrderBook(object):
         if self.asks != None and len(self.asks) > 0:
             for key, value in self.asks.price_map.items():
                 tempfile.write('%s' % value)
+
+    def __str__(self):
+        tempfile = StringIO()
+        self._write_levels(tempfile)
         tempfile.write("\n***Trades***\n")
         if self.tape != None and len(self.tape) > 0:
             num = 0
             for entry in self.tape:
                 if num < 10: # get last 5 entries
-                    tempfile.write(str(entry['quantity']) + " @ " + str(entry['price']) + " (" + str(entry['timestamp']) + ") " + str(entry['party1'][0]) + "/" + str(entry['party2'][0]) + "\n")
+                    tempfile.write(str(entry['quantity']) + " @ " + str(entry['price']) + " (" + str(entry['timestamp']) + ")")
+                    if 'party1' in entry: # the columnar tape does not keep the parties
+                        tempfile.write(" " + str(entry['party1'][0]) + "/" + str(entry['party2'][0]))
+                    tempfile.write("\n")
                     num += 1
                 else:
                     break
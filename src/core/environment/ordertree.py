@@ -1,3 +1,4 @@
+import numpy as np
 from sortedcontainers import SortedDict
 from src.core.environment.orderlist import OrderList
 from src.core.environment.order import Order
@@ -15,6 +16,7 @@ class OrderTree(object):
         self.volume = 0 # Contains total quantity from all Orders in tree
         self.num_orders = 0 # Contains count of Orders in tree
         self.depth = 0 # Number of different prices in tree (http://en.wikipedia.org/wiki/Order_book_(trading)#Book_depth)
+        self._depth_arrays = None # Cached (prices, volumes) float64 arrays of all levels, reset on every mutation
 
     def __len__(self):
         return len(self.order_map)
@@ -41,6 +43,7 @@ class OrderTree(object):
         return order in self.order_map
 
     def insert_order(self, quote):
+        self._depth_arrays = None
         if self.order_exists(quote['order_id']):
             self.remove_order_by_id(quote['order_id'])
         self.num_orders += 1
@@ -51,7 +54,27 @@ class OrderTree(object):
         self.order_map[order.order_id] = order
         self.volume += order.quantity
 
+    def insert_orders(self, quotes):
+        '''Inserts many orders at once, all new price levels are added to the tree in a single bulk update'''
+        self._depth_arrays = None
+        new_prices = {quote['price'] for quote in quotes if quote['price'] not in self.price_map}
+        if new_prices:
+            self.depth += len(new_prices)
+            self.price_map.update({price: OrderList() for price in new_prices})
+        for quote in quotes:
+            if self.order_exists(quote['order_id']):
+                # replacing an order may remove its price level, so take the single order path
+                self.insert_order(quote)
+                continue
+            self.num_orders += 1
+            order_list = self.price_map[quote['price']]
+            order = Order(quote, order_list)
+            order_list.append_order(order)
+            self.order_map[order.order_id] = order
+            self.volume += order.quantity
+
     def update_order(self, order_update):
+        self._depth_arrays = None
         order = self.order_map[order_update['order_id']]
         original_quantity = order.quantity
         if order_update['price'] != order.price:
@@ -67,6 +90,7 @@ class OrderTree(object):
         self.volume += order.quantity - original_quantity
 
     def remove_order_by_id(self, order_id):
+        self._depth_arrays = None
         self.num_orders -= 1
         order = self.order_map[order_id]
         self.volume -= order.quantity
@@ -75,6 +99,26 @@ class OrderTree(object):
             self.remove_price(order.price)
         del self.order_map[order_id]
 
+    def invalidate_depth(self):
+        '''Has to be called when the quantity of an order in the tree is changed from outside the tree'''
+        self._depth_arrays = None
+
+    def set_depth_arrays(self, prices, volumes):
+        '''Seeds the depth cache with ascending float64 arrays that are known to match the tree'''
+        prices.flags.writeable = False
+        volumes.flags.writeable = False
+        self._depth_arrays = (prices, volumes)
+
+    def depth_arrays(self):
+        '''Returns float64 arrays of the prices (ascending) and aggregate volumes of all price levels.
+        The arrays are cached until the tree changes and must not be modified.'''
+        if self._depth_arrays is None:
+            prices = np.fromiter(self.price_map.keys(), dtype=np.float64, count=self.depth)
+            volumes = np.fromiter((order_list.volume for order_list in self.price_map.values()),
+                                  dtype=np.float64, count=self.depth)
+            self.set_depth_arrays(prices, volumes)
+        return self._depth_arrays
+
     def max_price(self):
         if self.depth > 0:
             return self.prices[-1]
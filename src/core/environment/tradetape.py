@@ -0,0 +1,87 @@
+import numpy as np
+
+
+class TradeTape(object):
+    '''
+    A columnar record of the trades of an OrderBook. Prices and quantities are
+    kept in growable float64 arrays instead of one dict per fill, the book time
+    of each fill is kept alongside (it is either the integer book counter or
+    the timestamp string of a data driven order).
+    If maxlen is given the tape behaves as a ring buffer keeping only the most
+    recent maxlen trades.
+    '''
+
+    def __init__(self, maxlen=None, capacity=16):
+        self.maxlen = maxlen
+        if maxlen is not None:
+            capacity = maxlen
+        self.time = np.empty(capacity, dtype=object)
+        self.price = np.empty(capacity, dtype=np.float64)
+        self.quantity = np.empty(capacity, dtype=np.float64)
+        self.length = 0 # number of trades currently stored
+        self.start = 0 # position of the oldest trade (only moves in ring buffer mode)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for idx in range(self.length):
+            yield self[idx]
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.length
+        if not 0 <= idx < self.length:
+            raise IndexError('TradeTape index out of range')
+        pos = (self.start + idx) % len(self.price)
+        return {'timestamp': self.time[pos],
+                'time': self.time[pos],
+                'price': self.price[pos],
+                'quantity': self.quantity[pos]}
+
+    def _grow(self):
+        capacity = 2 * len(self.price)
+        for column in ('time', 'price', 'quantity'):
+            old = getattr(self, column)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.length] = old[:self.length]
+            setattr(self, column, new)
+
+    def append(self, transaction_record):
+        if self.maxlen is None:
+            if self.length == len(self.price):
+                self._grow()
+            pos = self.length
+            self.length += 1
+        elif self.length < self.maxlen:
+            pos = (self.start + self.length) % self.maxlen
+            self.length += 1
+        else:
+            # ring buffer is full, overwrite the oldest trade
+            pos = self.start
+            self.start = (self.start + 1) % self.maxlen
+        self.time[pos] = transaction_record['time']
+        self.price[pos] = transaction_record['price']
+        self.quantity[pos] = transaction_record['quantity']
+
+    def columns(self):
+        '''Returns (time, price, quantity) arrays ordered from the oldest to the most recent trade.'''
+        order = (self.start + np.arange(self.length)) % len(self.price)
+        return self.time[order], self.price[order], self.quantity[order]
+
+    def vwap(self, start=0):
+        '''Volume weighted price and total volume of the trades from position start onwards.'''
+        _, price, quantity = self.columns()
+        volume = quantity[start:].sum()
+        if volume == 0:
+            return 0.0, 0.0
+        return float(np.dot(price[start:], quantity[start:]) / volume), float(volume)
+
+    def clear(self):
+        self.length = 0
+        self.start = 0
+
+    def dump(self, dumpfile):
+        '''Writes the whole tape to an open file in one bulk call.'''
+        if self.length > 0:
+            np.savetxt(dumpfile, np.column_stack(self.columns()), fmt='Time: %s, Price: %s, Quantity: %s')
@@ -0,0 +1,66 @@
+import numpy as np
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+def top_of_book_turnover(data, depth):
+    """ Turnover of the top of the book of every row of raw data (timestamp, asks, ask volumes, bids, bid volumes):
+    the absolute change of the best ask and best bid volumes since the previous row of the same day """
+
+    best_volumes = data[:, [1 + depth, 1 + 3 * depth]]
+    turnover = np.zeros(len(data))
+    turnover[1:] = np.sum(np.abs(np.diff(best_volumes, axis=0)), axis=1)
+    # the first row of a day has no previous row
+    days = data[:, 0] // MS_PER_DAY
+    turnover[1:][days[1:] != days[:-1]] = 0
+    return turnover
+
+
+class IntradayProfile:
+    """
+        Average market activity per time of day bin (per day of data) with its cumulative curve, so the expected
+        activity of any time interval is a difference of two interpolated points of the curve. Built once per data
+        set, the expected activity of all buckets of an algo is a single vectorized lookup.
+
+        Args:
+            activity (array): average activity of each bin of the day
+            bin_seconds (int): width of the bins, has to divide a day (default: 60)
+    """
+
+    def __init__(self, activity, bin_seconds=60):
+        self.bin_ms = int(bin_seconds * 1000)
+        if MS_PER_DAY % self.bin_ms != 0:
+            raise ValueError("bin_seconds has to divide a day, got {}".format(bin_seconds))
+        self.n_bins = MS_PER_DAY // self.bin_ms
+        self.activity = np.asarray(activity, dtype=np.float64)
+        if self.activity.shape != (self.n_bins,):
+            raise ValueError("Expected {} bins of activity, got {}".format(self.n_bins, self.activity.shape))
+        self.cum_activity = np.concatenate(([0], np.cumsum(self.activity)))
+        self.daily_activity = self.cum_activity[-1]
+
+    @classmethod
+    def from_raw_data(cls, data, depth, bin_seconds=60):
+        """ Builds the profile of the top of book turnover (see top_of_book_turnover) of the raw rows of a feed """
+
+        times = data[:, 0]
+        n_days = max(len(np.unique(times // MS_PER_DAY)), 1)
+        bin_ms = int(bin_seconds * 1000)
+        bins = ((times % MS_PER_DAY) // bin_ms).astype(np.int64)
+        activity = np.bincount(bins, weights=top_of_book_turnover(data, depth), minlength=MS_PER_DAY // bin_ms)
+        return cls(activity / n_days, bin_seconds)
+
+    def cumulative(self, times):
+        """ Expected activity from the midnight of the epoch up to the times (in ms), linear within the bins """
+
+        days, time_of_day = np.divmod(np.asarray(times, dtype=np.float64), MS_PER_DAY)
+        bins, offset = np.divmod(time_of_day, self.bin_ms)
+        bins = bins.astype(np.int64)
+        return days * self.daily_activity + self.cum_activity[bins] + self.activity[bins] * offset / self.bin_ms
+
+    def activity_between(self, start_times, end_times):
+        """ Expected activity between start and end times (unix ms, scalars or arrays) """
+
+        start_times = np.asarray(start_times, dtype=np.float64)
+        # count from the midnight of the start times, the cumulative activity since the epoch would cost precision
+        midnights = start_times - start_times % MS_PER_DAY
+        return self.cumulative(np.asarray(end_times) - midnights) - self.cumulative(start_times - midnights)
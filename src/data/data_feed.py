@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from datetime import datetime
 
 HISTORICAL_DATA_FEED    = "historical"
 
@@ -16,3 +17,76 @@ class DataFeed(ABC):
             time: datetime. Timestamp from which to start sampling.
         """
         raise NotImplementedError
+    @abstractmethod
+    def cursor(self, time=None, lob_cache=None):
+        """
+         Return a new cursor over the data of the feed. Cursors share the data but keep their own position and
+         offer reset(time), next_lob_snapshot() and past_lob_snapshots(no_of_past_lobs). Cursors given the same
+         lob_cache share the books they build.
+        """
+        raise NotImplementedError
+
+    def fingerprint(self):
+        """ Return a hash identifying the data of the feed, used as part of the key of cached simulation results """
+        raise NotImplementedError
+
+    def price_tick(self, time):
+        """ Return the price tick (Decimal) of the prices on the day of 'time', the limit price offset of the algos """
+        raise NotImplementedError
+
+    def lot_size(self, time):
+        """ Return the lot size (Decimal) of the quantities on the day of 'time', the volume unit of the algos """
+        raise NotImplementedError
+
+    def activity_profile(self, bin_seconds=60):
+        """ Return the IntradayProfile of the market activity of the data, used by the volume profile algos """
+        raise NotImplementedError
+
+
+class FeedCursor:
+    """
+        Cursor over a feed without cursors of its own (see DataFeed.cursor), e.g. a generator of snapshots which only
+        offers reset(time) and next_lob_snapshot(). It keeps the time of the last snapshot it read and seeks the feed
+        there before every read, so several cursors can read the same feed without moving each other.
+    """
+
+    def __init__(self, data_feed, time=None):
+        self.data_feed = data_feed
+        self.time = None
+        self.previous_time = None
+        if time is not None:
+            self.reset(time)
+
+    def reset(self, time=None):
+        """ Moves the cursor to the first snapshot after 'time' (or to the start of the feed if time is None) """
+
+        self.time = time
+        self.previous_time = None
+
+    def rewind(self, no_of_lobs=1):
+        """ Steps back so that the last snapshot is returned again by next_lob_snapshot(), the cursor only remembers
+        the time before the last snapshot """
+
+        if no_of_lobs != 1:
+            raise ValueError("A FeedCursor can only step back by one snapshot!")
+        self.time = self.previous_time
+
+    def next_lob_snapshot(self, previous_lob_snapshot=None):
+        """ return next snapshot of the limit order book """
+
+        self._seek()
+        dt, lob = self.data_feed.next_lob_snapshot()
+        self.previous_time, self.time = self.time, dt
+        return dt, lob
+
+    def past_lob_snapshots(self, no_of_past_lobs, lob_format=True):
+        """ return past snapshots of the limit order book """
+
+        self._seek()
+        return self.data_feed.past_lob_snapshots(no_of_past_lobs, lob_format)
+
+    def _seek(self):
+        time = self.time
+        if isinstance(time, datetime):
+            time = time.strftime('%Y-%m-%d %H:%M:%S.%f')
+        self.data_feed.reset(time=time)
@@ -1,23 +1,58 @@
 import warnings
 import copy
 import calendar
+import hashlib
 import numpy as np
-from os import listdir, path
+from os import listdir, path, stat
 import re
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from decimal import Decimal
 from src.data.data_feed import DataFeed
-from src.core.environment.env_utils import raw_to_order_book
+from src.data.price_index import BestPriceIndex
+from src.data.activity_profile import IntradayProfile, MS_PER_DAY
+from src.core.environment.env_utils import raw_to_order_book, SIMULATOR_BOOK_TYPE
+
+
+def to_unix_ms(t):
+    """ Converts a datetime or a '%Y-%m-%d %H:%M:%S(.%f)' string to the millisecond timestamps of the data """
+
+    if isinstance(t, datetime):
+        start_t = t
+    else:
+        try:
+            start_t = datetime.strptime(t, '%Y-%m-%d %H:%M:%S.%f')
+        except:
+            start_t = datetime.strptime(t, '%Y-%m-%d %H:%M:%S')
+    start_dt = datetime(start_t.year, start_t.month, start_t.day, start_t.hour, start_t.minute, start_t.second, start_t.microsecond)
+    return calendar.timegm(start_dt.utctimetuple()) * 1e3 + start_dt.microsecond / 1e3
+
+
+# structures derived from the data and built on first use, they don't count when comparing feeds
+FEED_CACHE_ATTRS = ('_price_index', '_price_index_data', '_precisions', '_precisions_data', '_activity_profiles',
+                    '_activity_profiles_data')
+# decimals of the prices and quantities of known instruments, digits of the data beyond them are float noise
+INSTRUMENT_DECIMALS = {'btcusdt': {'price': 2, 'quantity': 6}}
+# decimals the prices and quantities of other instruments are capped at
+MAX_DATA_DECIMALS = 8
+
+
+def min_decimals(values, max_decimals=MAX_DATA_DECIMALS):
+    """ Returns the number of decimals (at least 1, as in str() of a float) needed to write all values, values
+    which need more than max_decimals (e.g. due to float noise) give max_decimals """
+
+    values = np.abs(np.asarray(values, dtype=np.float64))
+    for decimals in range(1, max_decimals):
+        scaled = values * 10.0 ** decimals
+        if np.all(np.abs(scaled - np.rint(scaled)) <= 1e-12 * np.maximum(scaled, 1)):
+            return decimals
+    return max_decimals
 
 
 def get_time_idx_from_raw_data(data, t):
     """ Returns the index of data right before a given time 't' """
 
-    try:
-        start_t = datetime.strptime(t, '%Y-%m-%d %H:%M:%S.%f')
-    except:
-        start_t = datetime.strptime(t, '%Y-%m-%d %H:%M:%S')
-    start_dt = datetime(start_t.year, start_t.month, start_t.day, start_t.hour, start_t.minute, start_t.second, start_t.microsecond)
-    unix_t = calendar.timegm(start_dt.utctimetuple()) * 1e3 + start_dt.microsecond / 1e3
+    unix_t = to_unix_ms(t)
     idx = (np.abs(data - unix_t)).argmin()
     # These two lines were giving the lob_snapshot previous to dt, when it should be the one after If we are placing trades (to account for computing time/latency etc)
     while data[idx] <= unix_t:
@@ -25,6 +60,101 @@ def get_time_idx_from_raw_data(data, t):
     return idx
 
 
+class LobCache:
+    """
+        Bounded cache of the books built from the rows of a feed, keyed by row index. Cursors that walk the same
+        rows close behind each other (e.g. the benchmark and the RL algo of a lockstep broker) can share a cache,
+        so each book is only built once. Books handed out by the cache are shared and have to be treated as
+        read-only (the broker only trades on snapshots of them). The cache is emptied whenever the feed loads
+        other data.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._data = None
+        self._lobs = OrderedDict()
+
+    def lob_at(self, data_feed, row_idx):
+        """ Returns the timestamp and book of a row of the feed, building the book only if it isn't cached """
+
+        if self._data is not data_feed.data:
+            self.clear()
+            self._data = data_feed.data
+        if row_idx in self._lobs:
+            self._lobs.move_to_end(row_idx)
+            return self._lobs[row_idx]
+        dt_lob = data_feed.lob_from_row(data_feed.data[row_idx])
+        self._lobs[row_idx] = dt_lob
+        if len(self._lobs) > self.maxsize:
+            self._lobs.popitem(last=False)
+        return dt_lob
+
+    def clear(self):
+        self._lobs.clear()
+        self._data = None
+
+    def __len__(self):
+        return len(self._lobs)
+
+
+class HistoricalDataCursor:
+    """
+        Lightweight read position over the data of a HistoricalDataFeed. Any number of cursors can share the data
+        of one feed, each of them only holds its own row index, so moving one cursor never affects the others.
+        Seeking takes a datetime (or string) and is a binary search over the timestamp column.
+        Cursors given the same LobCache share the books they build.
+    """
+
+    def __init__(self, data_feed, time=None, lob_cache=None):
+        self.data_feed = data_feed
+        self.lob_cache = lob_cache
+        self.row_idx = 0
+        self.time = None
+        if time is not None:
+            self.reset(time)
+
+    def reset(self, time=None):
+        """ Moves the cursor to the first snapshot after 'time' (or to the first snapshot if time is None) """
+
+        self.time = time
+        if time is None:
+            self.row_idx = 0
+        else:
+            self.row_idx = int(np.searchsorted(self.data_feed.data[:, 0], to_unix_ms(time), side='right'))
+
+    def rewind(self, no_of_lobs=1):
+        """ Steps back so that the last 'no_of_lobs' snapshots are returned again by next_lob_snapshot() """
+
+        self.row_idx = max(self.row_idx - no_of_lobs, 0)
+
+    def next_lob_snapshot(self, previous_lob_snapshot=None, lob_format=True):
+        """ return next snapshot of the limit order book """
+
+        if self.row_idx >= self.data_feed.data.shape[0]:
+            warnings.warn("Datafeed reached end of file, reset to initial time. Make sure this was intended! ")
+            self.reset(self.time)
+
+        row_idx = self.row_idx
+        self.row_idx += 1
+        if lob_format and self.lob_cache is not None:
+            return self.lob_cache.lob_at(self.data_feed, row_idx)
+        return self.data_feed.lob_from_row(self.data_feed.data[row_idx], lob_format)
+
+    def past_lob_snapshots(self, no_of_past_lobs, lob_format=True):
+        """ return past snapshots of the limit order book """
+
+        timestamp_dts = []
+        output = []
+        for row_idx in range(max(self.row_idx - no_of_past_lobs, 0), self.row_idx):
+            if lob_format and self.lob_cache is not None:
+                timestamp_dt, lob = self.lob_cache.lob_at(self.data_feed, row_idx)
+            else:
+                timestamp_dt, lob = self.data_feed.lob_from_row(self.data_feed.data[row_idx], lob_format)
+            timestamp_dts.append(timestamp_dt)
+            output.append(lob)
+        return timestamp_dts, output
+
+
 class HistoricalDataFeed(DataFeed):
     """
         Flat binary format, each float is saved as a float64** in a continuous memory:
@@ -41,7 +171,8 @@ class HistoricalDataFeed(DataFeed):
                  start_day=None,
                  end_day=None,
                  time=None,
-                 lob_depth=20):
+                 lob_depth=20,
+                 book_type=SIMULATOR_BOOK_TYPE):
 
         self.data_dir = data_dir
         self.instrument = instrument
@@ -75,6 +206,13 @@ class HistoricalDataFeed(DataFeed):
         self._remaining_rows_in_file = None
 
         self.lob_depth = lob_depth
+        self.book_type = book_type
+        self._price_index = None
+        self._price_index_data = None
+        self._precisions = {}
+        self._precisions_data = None
+        self._activity_profiles = {}
+        self._activity_profiles_data = None
         self._load_data()
         self.reset(time)
 
@@ -96,36 +234,101 @@ class HistoricalDataFeed(DataFeed):
         self.data_row_idx += 1
         self._remaining_rows_in_file -= 1
 
-        timestamp_dt = datetime.utcfromtimestamp(lob[0] / 1000)
-        lob = lob[1:]
+        return self.lob_from_row(lob, lob_format)
+
+    def lob_from_row(self, row, lob_format=True):
+        """ Converts a raw data row into its timestamp and a book (or the reshaped raw data) """
+
+        timestamp_dt = datetime.utcfromtimestamp(row[0] / 1000)
+        lob = row[1:].reshape(-1, self.lob_depth)
         if lob_format:
-            lob_out = raw_to_order_book(current_book=lob.reshape(-1, self.lob_depth),
-                                        time=timestamp_dt.strftime('%Y-%m-%d %H:%M:%S.%f'),
-                                        depth=self.lob_depth)
-            return timestamp_dt, lob_out
-        else:
-            return timestamp_dt, lob.reshape(-1, self.lob_depth)
+            # only the per-order book uses the time of the snapshot, so skip formatting it otherwise
+            lob = raw_to_order_book(current_book=lob,
+                                    time=timestamp_dt.strftime('%Y-%m-%d %H:%M:%S.%f') if self.book_type == 'order' else None,
+                                    depth=self.lob_depth,
+                                    book_type=self.book_type)
+        return timestamp_dt, lob
+
+    def price_index(self):
+        """ Returns the BestPriceIndex of the loaded data, built on first use """
+
+        if self._price_index is None or self._price_index_data is not self.data:
+            self._price_index = BestPriceIndex.from_raw_data(self.data, self.lob_depth)
+            self._price_index_data = self.data
+        return self._price_index
+
+    def price_tick(self, time):
+        """ Returns the price tick of the day of 'time', the smallest increment of all bid and ask prices of that
+        day """
+
+        return self._day_precision(time)[0]
+
+    def lot_size(self, time):
+        """ Returns the lot size of the day of 'time', the smallest increment of all bid and ask quantities of that
+        day """
+
+        return self._day_precision(time)[1]
+
+    def _day_precision(self, time):
+        """ Returns the price tick and lot size of the day of 'time', found once per day with a vectorized scan of
+        the price and quantity columns. The decimals are capped at the ones of the instrument (see
+        INSTRUMENT_DECIMALS) or at MAX_DATA_DECIMALS, so float noise in the data doesn't give finer sizes. """
+
+        if self._precisions_data is not self.data:
+            self._precisions = {}
+            self._precisions_data = self.data
+        day = int(to_unix_ms(time) // MS_PER_DAY)
+        if day not in self._precisions:
+            rows = slice(*np.searchsorted(self.data[:, 0], [day * MS_PER_DAY, (day + 1) * MS_PER_DAY], side='left'))
+            depth = self.lob_depth
+            columns = self.data[rows, 1:].reshape(-1, 4, depth)
+            max_decimals = INSTRUMENT_DECIMALS.get(self.instrument, {})
+            price_decimals = min_decimals(columns[:, ::2], max_decimals.get('price', MAX_DATA_DECIMALS))
+            quantity_decimals = min_decimals(columns[:, 1::2], max_decimals.get('quantity', MAX_DATA_DECIMALS))
+            self._precisions[day] = Decimal(1).scaleb(-price_decimals), Decimal(1).scaleb(-quantity_decimals)
+        return self._precisions[day]
+
+    def activity_profile(self, bin_seconds=60):
+        """ Returns the IntradayProfile of the top of book turnover of the loaded data, built once per bin width """
+
+        if self._activity_profiles_data is not self.data:
+            self._activity_profiles = {}
+            self._activity_profiles_data = self.data
+        if bin_seconds not in self._activity_profiles:
+            self._activity_profiles[bin_seconds] = IntradayProfile.from_raw_data(self.data, self.lob_depth, bin_seconds)
+        return self._activity_profiles[bin_seconds]
+
+    def row_time(self, row_idx):
+        """ Returns the timestamp of a row of the data as datetime """
+
+        return datetime.utcfromtimestamp(self.data[row_idx, 0] / 1000)
+
+    def fingerprint(self):
+        """ Returns a hash identifying the data of the feed (instrument, depth and name, size and modification time of
+         every binary file), so results simulated on the data can be cached across processes """
+
+        files = []
+        for f in sorted(self.binary_files):
+            file_stat = stat(path.join(self.data_dir, f))
+            files.append((f, file_stat.st_size, file_stat.st_mtime_ns))
+        return hashlib.sha1(repr((self.instrument, self.lob_depth, files)).encode()).hexdigest()
+
+    def cursor(self, time=None, lob_cache=None):
+        """ Returns a new cursor with its own position over the data of this feed """
+
+        return HistoricalDataCursor(self, time, lob_cache)
 
     def past_lob_snapshots(self, no_of_past_lobs, lob_format=True):
         """ return past snapshots of the limit order book """
 
         past_lobs = self.data[self.data_row_idx-no_of_past_lobs:self.data_row_idx ]
         timestamp_dts =[]
-        for lob in past_lobs:
-            timestamp_dts.append(datetime.utcfromtimestamp(lob[0] / 1000))
-
         output = []
-        if lob_format:
-            for lob in past_lobs:
-                lob_out = raw_to_order_book(current_book=lob[1:].reshape(-1, self.lob_depth),
-                                            time=datetime.utcfromtimestamp(lob[0] / 1000).strftime('%Y-%m-%d %H:%M:%S.%f'),
-                                            depth=self.lob_depth)
-                output.append(lob_out)
-            return timestamp_dts, output
-        else:
-            for lob in past_lobs:
-                output.append(lob.reshape(-1, self.lob_depth))
-            return timestamp_dts, output
+        for row in past_lobs:
+            timestamp_dt, lob = self.lob_from_row(row, lob_format)
+            timestamp_dts.append(timestamp_dt)
+            output.append(lob)
+        return timestamp_dts, output
 
     def reset(self, time=None):
         """ Reset the datafeed and set from when to start sampling """
@@ -186,6 +389,8 @@ class HistoricalDataFeed(DataFeed):
     def __eq__(self, other):
         if self.__class__ == other.__class__:
             for k, v in self.__dict__.items():
+                if k in FEED_CACHE_ATTRS:
+                    continue
                 try:
                     tst = v == other.__dict__[k]
                     if not tst:
@@ -0,0 +1,56 @@
+import numpy as np
+
+
+class BestPriceIndex:
+    """
+        Sparse tables of the running minima of the best asks and maxima of the best bids of the rows of a feed.
+        Any range min/max is answered in O(1) and the first row of a range in which the best ask drops to or the best
+        bid rises to a given price in O(log n), so resting orders can jump over the snapshots in which nothing
+        happens to them.
+    """
+
+    def __init__(self, best_asks, best_bids):
+        self.n_rows = len(best_asks)
+        self.min_asks = [np.asarray(best_asks, dtype=np.float64)]
+        self.max_bids = [np.asarray(best_bids, dtype=np.float64)]
+        # level k holds the min/max of the 2**k rows starting at each row
+        width = 1
+        while 2 * width <= self.n_rows:
+            self.min_asks.append(np.minimum(self.min_asks[-1][:-width], self.min_asks[-1][width:]))
+            self.max_bids.append(np.maximum(self.max_bids[-1][:-width], self.max_bids[-1][width:]))
+            width *= 2
+
+    @classmethod
+    def from_raw_data(cls, data, depth):
+        """ Builds the index from the raw rows of a feed (timestamp, asks, ask volumes, bids, bid volumes) """
+
+        return cls(data[:, 1], data[:, 1 + 2 * depth])
+
+    def min_ask(self, start, end):
+        """ Lowest best ask of the rows start, ..., end - 1 (inf for an empty range) """
+
+        end = min(end, self.n_rows)
+        if end <= start:
+            return np.inf
+        k = (end - start).bit_length() - 1
+        return min(self.min_asks[k][start], self.min_asks[k][end - 2 ** k])
+
+    def max_bid(self, start, end):
+        """ Highest best bid of the rows start, ..., end - 1 (-inf for an empty range) """
+
+        end = min(end, self.n_rows)
+        if end <= start:
+            return -np.inf
+        k = (end - start).bit_length() - 1
+        return max(self.max_bids[k][start], self.max_bids[k][end - 2 ** k])
+
+    def first_row(self, start, end, max_ask=np.inf, min_bid=-np.inf):
+        """ Returns the first row of start, ..., end - 1 with a best ask <= max_ask or a best bid >= min_bid
+        (or end if there is none) """
+
+        row = start
+        end = min(end, self.n_rows)
+        for k in range(len(self.min_asks) - 1, -1, -1):
+            if row + 2 ** k <= end and self.min_asks[k][row] > max_ask and self.max_bids[k][row] < min_bid:
+                row += 2 ** k
+        return min(row, end)
@@ -26,9 +26,8 @@ class DerivedEnv(ExampleEnvRewardAtStep):
 
     def infer_volume_from_action(self, action):
         vol_to_trade = Decimal(str(0.8 + 0.2*action)) *\
-                       (self.broker.benchmark_algo.volumes_per_trade_default[self.broker.rl_algo.bucket_idx][self.broker.rl_algo.order_idx]) # We trade {0,0.1,0.2,...2}*TWAP's volume
-        factor = 10 ** (- self.broker.benchmark_algo.tick_size.as_tuple().exponent)
-        vol_to_trade = Decimal(str(math.floor(vol_to_trade * factor) / factor))
+                       int(self.broker.benchmark_algo.volumes_per_trade_default[self.broker.rl_algo.bucket_idx][self.broker.rl_algo.order_idx]) # We trade {0,0.1,0.2,...2}*TWAP's volume
+        vol_to_trade = math.floor(vol_to_trade)
         if vol_to_trade > self.broker.rl_algo.bucket_vol_remaining[self.broker.rl_algo.bucket_idx]:
             vol_to_trade = self.broker.rl_algo.bucket_vol_remaining[self.broker.rl_algo.bucket_idx]
         return vol_to_trade
@@ -0,0 +1,78 @@
+import unittest
+import random
+import numpy as np
+
+from src.core.environment.limit_orders_setup import batch_twap
+from src.core.environment.limit_orders_setup.batch_twap import simulate_twap_algos, simulate_twap_batch, chase_limits
+from src.core.environment.limit_orders_setup.broker import Broker
+from src.core.environment.limit_orders_setup.execution_algo import TWAPAlgo
+from src.tests.test_data_feed import FakeFeedTestCase
+
+bucket_func = lambda no_of_slices: (sorted([round(random.uniform(0, 1), 2) for _ in range(no_of_slices)]))
+
+
+class TestBatchTWAP(FakeFeedTestCase):
+
+    n_rows = 900
+
+    def test_same_as_broker(self):
+        random.seed(0)
+        algos = [TWAPAlgo(trade_direction=trade_direction,
+                          volume=volume,
+                          no_of_slices=3,
+                          bucket_placement_func=bucket_func,
+                          start_time='2021-06-21 09:0{}:00'.format(minute),
+                          end_time='2021-06-21 09:0{}:00'.format(minute + 5),
+                          broker_data_feed=self.lob_feed)
+                 for trade_direction, volume, minute in ((1, 5, 1), (-1, 5, 2), (1, 40, 3), (-1, 40, 4))]
+        for delete_vol in (False, True):
+            results = simulate_twap_algos(self.lob_feed, algos, delete_vol=delete_vol)
+            broker = Broker(self.lob_feed)
+            broker.delete_vol = delete_vol
+            broker.simulate_algos({str(i): algo for i, algo in enumerate(algos)})
+            for i in range(len(algos)):
+                executed_volume = sum(float(log['quantity']) for log in broker.trade_logs[str(i)])
+                self.assertAlmostEqual(results['vwap'][i], broker.calc_vwap(str(i)), 10, 'VWAP differs from the broker')
+                self.assertAlmostEqual(results['executed_volume'][i], executed_volume, 10, 'Volume differs from the broker')
+                self.assertAlmostEqual(results['bucket_executed_volumes'][i].sum(), executed_volume, 10,
+                                       'Bucket volumes should add up to the executed volume')
+
+    def test_batch(self):
+        random.seed(1)
+        start_times = ['2021-06-21 09:0{}:00'.format(minute) for minute in range(1, 5)]
+        results = simulate_twap_batch(self.lob_feed, start_times, exec_times=5, volumes=[5, 6, 7, 8], no_of_slices=2,
+                                      bucket_placement_func=bucket_func)
+        self.assertEqual(results['vwap'].shape, (4,), 'One VWAP per start time expected')
+        np.testing.assert_allclose(results['fill_ratio'], 1, err_msg='Without deleting volume, everything trades')
+
+    def test_blocks(self):
+        # the order windows gathered a few rows at a time give the same fills as gathered at once
+        random.seed(2)
+        start_times = ['2021-06-21 09:0{}:00'.format(minute) for minute in range(1, 5)]
+        results = simulate_twap_batch(self.lob_feed, start_times, exec_times=5, volumes=[5, 40, 7, 60],
+                                      no_of_slices=3, bucket_placement_func=bucket_func, trade_direction=-1,
+                                      delete_vol=True)
+        block_cells, min_block_rows = batch_twap.BLOCK_CELLS, batch_twap.MIN_BLOCK_ROWS
+        batch_twap.BLOCK_CELLS, batch_twap.MIN_BLOCK_ROWS = 1, 2
+        try:
+            random.seed(2)
+            block_results = simulate_twap_batch(self.lob_feed, start_times, exec_times=5, volumes=[5, 40, 7, 60],
+                                                no_of_slices=3, bucket_placement_func=bucket_func, trade_direction=-1,
+                                                delete_vol=True)
+        finally:
+            batch_twap.BLOCK_CELLS, batch_twap.MIN_BLOCK_ROWS = block_cells, min_block_rows
+        for k in ('vwap', 'executed_volume', 'unexecuted_volume'):
+            np.testing.assert_allclose(block_results[k], results[k], rtol=1e-12, err_msg=k)
+
+    def test_chase_limits(self):
+        # the market moves by less than a tick, so the limit follows it row by row (and can move back)
+        best_bids = np.array([10.0, 10.5, 10.2, 10.6])
+        np.testing.assert_allclose(chase_limits(best_bids, 1, 'bid'), [9, 9.5, 9.2, 9.6])
+        np.testing.assert_allclose(chase_limits(np.array([10.0, 9.0, 9.5, 8.0]), 1, 'ask'), [11, 10, 10.5, 9])
+        # stacked orders, the second one is already in the market with a limit of 10.2 (above the best bid)
+        limits = chase_limits(np.array([best_bids, best_bids]), [1, 0.5], 'bid', np.array([-np.inf, 10.2]))
+        np.testing.assert_allclose(limits, [[9, 9.5, 9.2, 9.6], [10.2, 10, 9.7, 10.1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
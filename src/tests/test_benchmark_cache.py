@@ -0,0 +1,52 @@
+import unittest
+import shutil
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+
+from src.core.environment.limit_orders_setup.benchmark_cache import BenchmarkCache
+from src.tests.test_data_feed import FakeFeedTestCase
+
+
+def fake_step(bucket_bound, price, quantity):
+    return {'event': {'type': 'bucket_bound' if bucket_bound else 'order_placement', 'time': datetime(2021, 6, 21)},
+            'done': False,
+            'bucket_bound': bucket_bound,
+            'logs': [{'timestamp': '2021-06-21 09:00:00.000000', 'message': 'trade', 'type': 'limit', 'side': 'bid',
+                      'price': Decimal(price), 'quantity': Decimal(quantity), 'target_quantity': Decimal(quantity)}],
+            'state': {}}
+
+
+class TestBenchmarkCache(FakeFeedTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestBenchmarkCache, cls).setUpClass()
+        cls.cache_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TestBenchmarkCache, cls).tearDownClass()
+        shutil.rmtree(cls.cache_dir)
+
+    def test_key(self):
+        key = BenchmarkCache.key(self.twap(1), self.lob_feed)
+        self.assertEqual(key, BenchmarkCache.key(self.twap(1), self.lob_feed), 'Same episode should give the same key')
+        self.assertNotEqual(key, BenchmarkCache.key(self.twap(2), self.lob_feed), 'Schedule should be part of the key')
+        self.assertNotEqual(key, BenchmarkCache.key(self.twap(1), self.lob_feed, delete_vol=True),
+                            'delete_vol should be part of the key')
+
+    def test_disk_cache(self):
+        steps = [fake_step(False, '30', '1'), fake_step(True, '32', '1'), fake_step(True, '31', '2')]
+        cache = BenchmarkCache(maxsize=1, cache_dir=self.cache_dir)
+        episode = cache.put('episode', steps)
+        self.assertEqual(episode['bucket_vwaps'], [31, 31], 'Bucket VWAPs are not correct')
+        cache.put('other_episode', steps)
+        self.assertEqual(len(cache), 1, 'Memory cache should be bounded')
+        episode_from_disk = BenchmarkCache(cache_dir=self.cache_dir).get('episode')
+        self.assertEqual(episode_from_disk['steps'], steps, 'Episode should be read back from disk')
+        self.assertIsNone(cache.get('missing_episode'), 'Unknown episodes should not be found')
+
+
+if __name__ == '__main__':
+    unittest.main()
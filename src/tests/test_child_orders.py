@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+from decimal import Decimal
+
+from src.core.environment.limit_orders_setup.broker import Broker, EventKernel
+from src.core.environment.limit_orders_setup.child_orders import ChildOrders, match_levels
+from src.core.environment.limit_orders_setup.execution_algo import TWAPAlgo, sample_placements
+from src.tests.test_data_feed import FakeFeedTestCase
+
+
+def match_one_by_one(limits, lots, level_prices, level_lots, side):
+    """ Matches the orders one after the other against what the orders before them left """
+
+    level_lots = level_lots.copy()
+    executed, cost = [], []
+    for limit, quantity in zip(limits, lots):
+        taken_lots, taken_cost = 0, 0
+        for k in range(len(level_prices)):
+            if (level_prices[k] > limit) if side == 'bid' else (level_prices[k] < limit):
+                break
+            take = min(quantity - taken_lots, level_lots[k])
+            level_lots[k] -= take
+            taken_lots += take
+            taken_cost += take * level_prices[k]
+        executed.append(taken_lots)
+        cost.append(taken_cost)
+    return np.array(executed), np.array(cost)
+
+
+class TestChildOrders(FakeFeedTestCase):
+
+    def test_match_levels(self):
+        rng = np.random.RandomState(0)
+        for side in ('bid', 'ask'):
+            for _ in range(200):
+                level_prices = np.round(10 + 0.1 * np.arange(5) * (1 if side == 'bid' else -1), 1)
+                level_lots = rng.randint(0, 20, 5)
+                children = ChildOrders(side)
+                for _ in range(rng.randint(1, 6)):
+                    children.add(np.round(rng.uniform(9.5, 10.5), 1), rng.randint(1, 30))
+                executed, cost = match_levels(children.prices, children.lots, level_prices, level_lots, side)
+                expected_executed, expected_cost = match_one_by_one(children.prices, children.lots, level_prices,
+                                                                    level_lots, side)
+                np.testing.assert_array_equal(executed, expected_executed, 'Wrong executed lots')
+                np.testing.assert_allclose(cost, expected_cost, err_msg='Wrong cost')
+
+    def test_priority_and_cancel(self):
+        children = ChildOrders('bid')
+        first = children.add(10.0, 5)
+        best = children.add(10.2, 5)
+        second = children.add(10.0, 5)
+        self.assertEqual(children.ids.tolist(), [best, first, second], 'Best price and then the oldest order first')
+        self.assertEqual(children.cancel(first), 5, 'Cancelling should return the unexecuted lots')
+        self.assertEqual(children.get(second), (10.0, 5), 'Other orders should be kept')
+        self.assertEqual(len(children), 2, 'Cancelled order should be removed')
+
+    def test_broker_child_orders(self):
+        algo = TWAPAlgo(trade_direction=1,
+                        volume=5,
+                        no_of_slices=3,
+                        bucket_placement_func=sample_placements,
+                        start_time='2021-06-21 09:01:00',
+                        end_time='2021-06-21 09:06:00',
+                        broker_data_feed=self.lob_feed)
+        broker = Broker(self.lob_feed)
+        broker.register_algo('twap', algo)
+        broker.reset(algo)
+        kernel = EventKernel(broker)
+        kernel.add('twap', *broker.simulate_to_next_event(algo))
+        scheduled = algo.volumes_per_trade.copy()
+        self.assertEqual(scheduled[0].tolist(), [2, 2, 1], 'Unexpected schedule of the first bucket')
+
+        # the lots of the child orders are reserved from the last orders of the bucket first
+        broker.submit_child_order(algo, 30.25, 3)
+        self.assertEqual(algo.volumes_per_trade[0].tolist(), [2, 0, 0], 'Child lots should be reserved')
+        second = broker.submit_child_order(algo, 30.15, 2)
+        with self.assertRaises(ValueError):
+            broker.submit_child_order(algo, 30.15, 1)
+        self.assertEqual(broker.cancel_child_order(algo, second), 2, 'Cancelling should return the unexecuted lots')
+        self.assertEqual(algo.volumes_per_trade[0].tolist(), [2, 0, 0], 'Cancelled lots should go back')
+        broker.submit_child_order(algo, 30.15, 2)
+        np.testing.assert_array_equal(algo.volumes_per_trade[1:], scheduled[1:], 'Other buckets should be unchanged')
+        kernel.run()
+
+        logs = list(broker.trade_logs['twap'])
+        # the child orders hold all lots of the first bucket, so the schedule doesn't trade in it
+        first_bound = algo.buckets.bucket_bounds[1].strftime('%Y-%m-%d %H:%M:%S.%f')
+        child_logs = [log for log in logs if log['message'] == 'trade' and log['timestamp'] <= first_bound]
+        self.assertEqual(len(child_logs), 2, 'Both child orders should have traded at once in their bucket')
+        self.assertEqual(child_logs[0]['timestamp'], child_logs[1]['timestamp'], 'Both should trade on one snapshot')
+        self.assertEqual(len(broker.child_orders['twap']), 0, 'Executed child orders should be removed')
+        self.assertEqual(sum(log['quantity'] for log in child_logs), Decimal('0.5'), 'Wrong child volume')
+        self.assertEqual(algo.vol_remaining, 0, 'Everything should have been executed')
+        self.assertEqual(sum(log['quantity'] for log in logs), algo.volume,
+                         'Child orders and the schedule should execute the volume once')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import unittest
+import os
+import random
+import shutil
+import tempfile
+import calendar
+import numpy as np
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from src.data.historical_data_feed import HistoricalDataFeed, LobCache, min_decimals
+from src.data.price_index import BestPriceIndex
+from src.data.activity_profile import IntradayProfile
+from src.core.environment.limit_orders_setup.execution_algo import TWAPAlgo, sample_placements
+
+
+def write_fake_data(data_dir, day, n_rows=100, lob_depth=3, volume_func=None):
+    """ Writes a binary file with one snapshot per second starting at 09:00:00 of 'day', the volumes of every level
+    are 1 or volume_func(row) """
+
+    start = calendar.timegm(datetime(day.year, day.month, day.day, 9).utctimetuple()) * 1e3
+    rows = []
+    for i in range(n_rows):
+        mid = 30 + 0.1 * (i % 7)
+        volumes = np.ones(lob_depth) * (volume_func(i) if volume_func is not None else 1)
+        rows.append(np.concatenate(([start + 1000 * i],
+                                    np.round(mid + 0.05 + 0.1 * np.arange(lob_depth), 2), volumes,
+                                    np.round(mid - 0.05 - 0.1 * np.arange(lob_depth), 2), volumes)))
+    np.array(rows, dtype=np.float64).tofile(os.path.join(data_dir, 'btcusdt__{}.dat'.format(day.strftime('%Y_%m_%d'))))
+
+
+def fake_feed(data_dir, day, n_rows=100, volume_func=None):
+    """ Writes fake data of 'day' (see write_fake_data) into data_dir and returns a feed of depth 3 on it """
+
+    write_fake_data(data_dir, day, n_rows=n_rows, volume_func=volume_func)
+    return HistoricalDataFeed(data_dir=data_dir, instrument='btcusdt', start_day=day, end_day=day, lob_depth=3)
+
+
+class FakeFeedTestCase(unittest.TestCase):
+    """ Base of the tests on a feed of n_rows fake snapshots of 'day', written to a temporary data_dir """
+
+    day = datetime(2021, 6, 21)
+    n_rows = 600
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.mkdtemp()
+        cls.lob_feed = fake_feed(cls.data_dir, cls.day, n_rows=cls.n_rows)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.data_dir)
+
+    def twap(self, seed, trade_direction=1, minute=1):
+        """ TWAPAlgo from 09:0<minute> for 5 minutes with random order placements drawn after seeding with 'seed' """
+
+        random.seed(seed)
+        return TWAPAlgo(trade_direction=trade_direction,
+                        volume=5,
+                        no_of_slices=3,
+                        bucket_placement_func=lambda no_of_slices: (sorted([round(random.uniform(0, 1), 2) for _
+                                                                            in range(no_of_slices)])),
+                        start_time='2021-06-21 09:0{}:00'.format(minute),
+                        end_time='2021-06-21 09:0{}:00'.format(minute + 5),
+                        broker_data_feed=self.lob_feed)
+
+
+class TestDataFeedCursor(FakeFeedTestCase):
+
+    n_rows = 100
+
+    def test_same_snapshots_as_feed(self):
+        time = '2021-06-21 09:00:10.500000'
+        self.lob_feed.reset(time=time)
+        cursor = self.lob_feed.cursor(time=datetime.strptime(time, '%Y-%m-%d %H:%M:%S.%f'))
+        for _ in range(5):
+            dt_feed, lob_feed = self.lob_feed.next_lob_snapshot()
+            dt_cursor, lob_cursor = cursor.next_lob_snapshot()
+            self.assertEqual(dt_feed, dt_cursor, 'Cursor and feed return different snapshots')
+            self.assertEqual(lob_feed.get_best_bid(), lob_cursor.get_best_bid(), 'Cursor and feed books differ')
+
+    def test_independent_cursors(self):
+        cursor_1 = self.lob_feed.cursor(time='2021-06-21 09:00:00')
+        cursor_2 = self.lob_feed.cursor(time='2021-06-21 09:00:50')
+        dt_1, _ = cursor_1.next_lob_snapshot()
+        dt_2, _ = cursor_2.next_lob_snapshot()
+        dt_1_next, _ = cursor_1.next_lob_snapshot()
+        self.assertEqual(dt_1_next - dt_1, timedelta(seconds=1), 'Cursors should not move each other')
+        self.assertEqual(dt_2, datetime(2021, 6, 21, 9, 0, 51), 'Cursor should start right after its reset time')
+
+    def test_rewind_and_past_snapshots(self):
+        cursor = self.lob_feed.cursor(time='2021-06-21 09:00:20')
+        dt, _ = cursor.next_lob_snapshot()
+        cursor.rewind()
+        dt_again, _ = cursor.next_lob_snapshot()
+        self.assertEqual(dt, dt_again, 'Rewinding should return the same snapshot again')
+        past_dts, past_lobs = cursor.past_lob_snapshots(no_of_past_lobs=3)
+        self.assertEqual(past_dts[-1], dt, 'Last past snapshot should be the last one read')
+        self.assertEqual(len(past_lobs), 3, 'Wrong number of past snapshots')
+
+    def test_shared_lob_cache(self):
+        lob_cache = LobCache(maxsize=2)
+        cursor_1 = self.lob_feed.cursor(time='2021-06-21 09:00:30', lob_cache=lob_cache)
+        cursor_2 = self.lob_feed.cursor(time='2021-06-21 09:00:30', lob_cache=lob_cache)
+        dt_1, lob_1 = cursor_1.next_lob_snapshot()
+        dt_2, lob_2 = cursor_2.next_lob_snapshot()
+        self.assertEqual(dt_1, dt_2, 'Cursors should read the same snapshot')
+        self.assertIs(lob_1, lob_2, 'Cursors sharing a cache should share the book')
+        self.assertIs(cursor_2.past_lob_snapshots(no_of_past_lobs=1)[1][0], lob_2, 'Past snapshots should use the cache')
+        for _ in range(3):
+            cursor_1.next_lob_snapshot()
+        self.assertEqual(len(lob_cache), 2, 'Cache should be bounded')
+
+    def test_lot_size(self):
+        self.assertEqual(min_decimals([1, 2.5, 0.125, 1e-3 * 7]), 3, 'Wrong number of decimals')
+        self.assertEqual(min_decimals([3, 4]), 1, 'Whole numbers should have one decimal, like str(float)')
+        self.assertEqual(self.lob_feed.lot_size('2021-06-21 09:00:10'), Decimal('0.1'), 'Wrong lot size')
+
+    def test_price_tick_and_lot_size(self):
+        data_dir = tempfile.mkdtemp()
+        try:
+            # quantities with 2 and then 5 decimals, the prices keep 2 decimals
+            feed = fake_feed(data_dir, self.day, volume_func=lambda i: 0.34 if i < 50 else 0.33334)
+            self.assertEqual(feed.price_tick('2021-06-21 09:00:10'), Decimal('0.01'), 'Wrong price tick')
+            self.assertEqual(feed.lot_size('2021-06-21 09:00:10'), Decimal('0.00001'), 'Wrong lot size')
+            algo = TWAPAlgo(trade_direction=1, volume=1, no_of_slices=2, bucket_placement_func=sample_placements,
+                            start_time='2021-06-21 09:00:10', end_time='2021-06-21 09:01:10', broker_data_feed=feed)
+            self.assertEqual((algo.tick_size, algo.lot_size), (Decimal('0.01'), Decimal('0.00001')),
+                             'Limit prices should be offset by the price tick, not the lot size')
+            feed = fake_feed(data_dir, self.day, volume_func=lambda i: 1.0000001)
+            self.assertEqual(feed.lot_size('2021-06-21 09:00:10'), Decimal('0.000001'),
+                             'Float noise should be capped at the decimals of the instrument')
+
+            # duck-typed feeds without the resolvers (here an attribute of the same name) infer the tick size
+            class SnapshotFeed:
+                price_tick = 0.1
+
+                def reset(self, time=None):
+                    feed.reset(time=time)
+
+                def next_lob_snapshot(self):
+                    return feed.next_lob_snapshot()
+
+            algo = TWAPAlgo(trade_direction=1, volume=1, no_of_slices=2, bucket_placement_func=sample_placements,
+                            start_time='2021-06-21 09:00:10', end_time='2021-06-21 09:01:10',
+                            broker_data_feed=SnapshotFeed())
+            self.assertEqual((algo.tick_size, algo.lot_size), (Decimal('0.0000001'), Decimal('0.0000001')),
+                             'Tick size should be inferred from the volume of the best bid')
+        finally:
+            shutil.rmtree(data_dir)
+
+    def test_equal_feeds(self):
+        feed = HistoricalDataFeed(data_dir=self.data_dir, instrument='btcusdt', start_day=self.day, end_day=self.day,
+                                  lob_depth=3)
+        other_feed = HistoricalDataFeed(data_dir=self.data_dir, instrument='btcusdt', start_day=self.day,
+                                        end_day=self.day, lob_depth=3)
+        feed.price_index()
+        feed.lot_size('2021-06-21 09:00:10')
+        feed.activity_profile()
+        self.assertTrue(feed == other_feed, 'Cached structures should not make feeds unequal')
+
+    def test_price_index(self):
+        rng = np.random.RandomState(0)
+        best_asks = np.round(rng.uniform(10, 11, 37), 2)
+        best_bids = best_asks - 0.5
+        index = BestPriceIndex(best_asks, best_bids)
+        for start, end in ((0, 37), (3, 4), (5, 20), (17, 36)):
+            self.assertEqual(index.min_ask(start, end), best_asks[start:end].min(), 'Wrong range min')
+            self.assertEqual(index.max_bid(start, end), best_bids[start:end].max(), 'Wrong range max')
+            for max_ask, min_bid in ((10.2, np.inf), (-np.inf, 10.4), (10.1, 10.45), (-np.inf, np.inf)):
+                rows = [row for row in range(start, end) if best_asks[row] <= max_ask or best_bids[row] >= min_bid]
+                self.assertEqual(index.first_row(start, end, max_ask, min_bid), rows[0] if rows else end,
+                                 'Wrong first row')
+        # empty ranges (also past the last row) have no best prices, like the ranges first_row finds nothing in
+        self.assertEqual((index.min_ask(1, 1), index.max_bid(1, 1)), (np.inf, -np.inf), 'Empty range expected')
+        self.assertEqual((index.min_ask(40, 45), index.max_bid(40, 45)), (np.inf, -np.inf), 'Empty range expected')
+        self.assertEqual(index.min_ask(30, 45), best_asks[30:].min(), 'Range should end at the last row')
+        self.assertIs(self.lob_feed.price_index(), self.lob_feed.price_index(), 'Index should be built once')
+
+    def test_activity_profile(self):
+        day_1 = calendar.timegm(datetime(2021, 6, 21, 9).utctimetuple()) * 1e3
+        day_2 = calendar.timegm(datetime(2021, 6, 22, 9).utctimetuple()) * 1e3
+        # timestamp, best ask, ask volume, best bid, bid volume
+        data = np.array([[day_1, 10.1, 1, 10, 1],
+                         [day_1 + 30e3, 10.1, 3, 10, 1],
+                         [day_1 + 70e3, 10.1, 3, 10, 2],
+                         [day_2, 10.1, 5, 10, 5],
+                         [day_2 + 20e3, 10.1, 5, 10, 1]])
+        profile = IntradayProfile.from_raw_data(data, depth=1)
+        # 09:00 has a turnover of 2 and 4 on the two days, 09:01 of 1 on the first day
+        self.assertEqual(profile.activity[9 * 60], 3, 'Wrong average activity')
+        self.assertEqual(profile.activity[9 * 60 + 1], 0.5, 'Wrong average activity')
+        self.assertEqual(profile.daily_activity, 3.5, 'Wrong daily activity')
+        self.assertAlmostEqual(profile.activity_between(day_1 + 30e3, day_1 + 90e3), 1.75, 10,
+                               'Activity should be interpolated within bins')
+        self.assertAlmostEqual(profile.activity_between(day_1, day_2), 3.5, 10, 'A day should have the daily activity')
+        with self.assertRaises(ValueError):
+            IntradayProfile(np.zeros(10), bin_seconds=7)
+        self.assertIs(self.lob_feed.activity_profile(), self.lob_feed.activity_profile(),
+                      'Profile should be built once')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from src.core.environment.limit_orders_setup.broker import Broker, EventKernel
+from src.core.environment.limit_orders_setup.execution_algo import TWAPAlgo
+from src.tests.test_data_feed import FakeFeedTestCase
+
+
+class TestEventKernel(FakeFeedTestCase):
+
+    def test_event_kernel(self):
+        class TimedKernel(EventKernel):
+            def _pop(self):
+                time, name = super(TimedKernel, self)._pop()
+                times.append(time)
+                return time, name
+
+        times = []
+        broker = Broker(self.lob_feed)
+        kernel = TimedKernel(broker)
+        for name, seed, trade_direction, minute in (('twap_1', 1, 1, 1), ('twap_2', 2, -1, 2)):
+            algo = self.twap(seed, trade_direction, minute)
+            broker.register_algo(name, algo)
+            broker.reset(algo)
+            kernel.add(name, *broker.simulate_to_next_event(algo))
+        results = kernel.run()
+        self.assertTrue(all(result['done'] for result in results.values()), 'All algos should be done')
+        self.assertEqual(times, sorted(times), 'Events should be processed in time order')
+        for name, seed, trade_direction, minute in (('twap_1', 1, 1, 1), ('twap_2', 2, -1, 2)):
+            broker_single = Broker(self.lob_feed)
+            broker_single.simulate_algo(self.twap(seed, trade_direction, minute))
+            self.assertEqual(broker.trade_logs[name], broker_single.trade_logs['benchmark_algo'],
+                             'Processing the events of several algos should not change their trades')
+
+    def test_every_order_is_placed(self):
+        def twap():
+            random.seed(0)
+            return TWAPAlgo(trade_direction=1, volume=7, no_of_slices=3,
+                            bucket_placement_func=lambda n: sorted([round(random.uniform(0, 1), 2) for _ in range(n)]),
+                            start_time='2021-06-21 09:01:00', end_time='2021-06-21 09:06:00',
+                            broker_data_feed=self.lob_feed)
+
+        broker = Broker(self.lob_feed)
+        algo = twap()
+        broker.simulate_algo(algo)
+        logs = broker.trade_logs['benchmark_algo']
+        times = [datetime.strptime(log['timestamp'], '%Y-%m-%d %H:%M:%S.%f') for log in logs]
+        for time in [time for bucket in algo.execution_times for time in bucket]:
+            self.assertTrue(any(time < t <= time + timedelta(seconds=1) for t in times),
+                            'Each order should be placed at the first snapshot after its execution time')
+
+        # the last order of the second bucket (at 09:01:45.3) trades on its own, it is not folded into the next one
+        self.assertEqual(algo.execution_times[1][2], datetime(2021, 6, 21, 9, 1, 45, 300000))
+        placed = logs[times.index(datetime(2021, 6, 21, 9, 1, 46))]
+        self.assertEqual((placed['message'], placed['target_quantity']), ('no_trade', Decimal('0.2')))
+        traded = logs[times.index(datetime(2021, 6, 21, 9, 1, 52))]
+        self.assertEqual((traded['message'], traded['quantity']), ('trade', Decimal('0.2')))
+
+        # the env steps the algo from one order placement to the next
+        broker_steps = Broker(self.lob_feed)
+        algo = twap()
+        broker_steps.reset(algo)
+        step = dict(zip(('event', 'done', 'lob'), broker_steps.simulate_to_next_event(algo)), algo=algo)
+        while not step['done']:
+            broker_steps.step_lockstep([step])
+        self.assertEqual(broker_steps.trade_logs['benchmark_algo'], logs,
+                         'simulate_algo should place the same orders as stepping the algo')
+
+
+if __name__ == '__main__':
+    unittest.main()
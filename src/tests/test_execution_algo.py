@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 from src.core.environment.limit_orders_setup.execution_algo import TWAPAlgo, BUCKET_SIZES_IN_SECS
 from src.core.environment.limit_orders_setup.broker import Broker
@@ -13,35 +14,43 @@ class FakeLOBGenerator:
                         29.9, 29.8, 29.7,  # bids
                         1, 1, 1])  # bid volumes
     speed_fac = 1
-    price_tick = 0.1
+    price_step = 0.1
+
+    # the prices are on a grid of 0.1 and the algos trade the volumes of 1 in lots of 0.1, the books keep their tape
+    # for the tests which compare the logs with the trades of the stored history
+    def price_tick(self, time):
+        return Decimal('0.1')
+
+    def lot_size(self, time):
+        return Decimal('0.1')
 
     def next_lob_snapshot(self):
         lob_new = self.fix_lob.copy()
-        lob_new[:3] -= self.speed_fac * self.price_tick * self.counter
-        lob_new[6:9] -= self.speed_fac * self.price_tick * self.counter
+        lob_new[:3] -= self.speed_fac * self.price_step * self.counter
+        lob_new[6:9] -= self.speed_fac * self.price_step * self.counter
 
         lob_new = np.round(lob_new, 2)
 
-        dt = datetime.today()
-        timestamp_dt = datetime(dt.year, dt.month, dt.day, self.time.hour, self.time.minute) + \
+        timestamp_dt = datetime(self.time.year, self.time.month, self.time.day, self.time.hour, self.time.minute) + \
                        timedelta(seconds=self.counter)
         self.counter += 1
         lob_out = raw_to_order_book(current_book=lob_new.reshape(-1, 3),
                                     time=timestamp_dt.strftime('%Y-%m-%d %H:%M:%S.%f'),
-                                    depth=3)
+                                    depth=3,
+                                    tape_mode='deque')
         return timestamp_dt, lob_out
 
     def reset(self, time):
         try:
-            self.time = datetime.strptime(time, '%H:%M:%S.%f')
-        except:
-            self.time = datetime.strptime(time, '%H:%M:%S')
+            self.time = datetime.strptime(time, '%Y-%m-%d %H:%M:%S.%f')
+        except ValueError:
+            self.time = datetime.strptime(time, '%Y-%m-%d %H:%M:%S')
         self.counter = self.time.second + 1
 
 
 class TestDataFeed(unittest.TestCase):
     fake_lob = FakeLOBGenerator()
-    random_time = "09:00:00"
+    random_time = "2021-06-21 09:00:00"
 
     def test_feed(self):
         # if the fake feed never gets reset, prices will just go downwards by one tick (0.1) steadily...
@@ -67,21 +76,21 @@ class TestExecutionAlgo(unittest.TestCase):
     # define the benchmark algo
     algo = TWAPAlgo(trade_direction=1,
                     volume=25,
-                    start_time='09:00:00',
-                    end_time='09:01:00',
+                    start_time='2021-06-21 09:00:00',
+                    end_time='2021-06-21 09:01:00',
                     no_of_slices=1,
                     bucket_placement_func=lambda no_of_slices: 0.5,
                     broker_data_feed=fake_lob)
 
     # define the broker class
-    broker = Broker(fake_lob)
+    broker = Broker(fake_lob, hist='full')
     broker.benchmark_algo = algo
     broker.simulate_algo(algo)
 
     rl_algo = RLAlgo(trade_direction=1,
                      volume=50,
-                     start_time='09:00:00',
-                     end_time='09:01:00',
+                     start_time='2021-06-21 09:00:00',
+                     end_time='2021-06-21 09:01:00',
                      no_of_slices=1,
                      bucket_placement_func=lambda no_of_slices: 0.5,
                      broker_data_feed=fake_lob)
@@ -96,10 +105,10 @@ class TestExecutionAlgo(unittest.TestCase):
         self.assertEqual(len(self.broker.benchmark_algo.bucket_volumes),
                          np.ceil(60 / BUCKET_SIZES_IN_SECS["1m"]),
                          'Bucket length not as expected')
-        self.assertEqual(float(sum(self.broker.benchmark_algo.bucket_volumes)),
+        self.assertEqual(float(self.broker.benchmark_algo.to_float_volume(sum(self.broker.benchmark_algo.bucket_volumes))),
                          25,
                          'Total volume is not correct')
-        self.assertEqual(float(self.broker.benchmark_algo.bucket_volumes[0]),
+        self.assertEqual(float(self.broker.benchmark_algo.to_float_volume(self.broker.benchmark_algo.bucket_volumes[0])),
                          3,
                          'First bucket volume not correct')
 
@@ -195,8 +204,8 @@ class TestExecutionLogic(unittest.TestCase):
         # define the benchmark algo
         algo = TWAPAlgo(trade_direction=1,
                         volume=1000,
-                        start_time='09:00:00',
-                        end_time='09:01:00',
+                        start_time='2021-06-21 09:00:00',
+                        end_time='2021-06-21 09:01:00',
                         no_of_slices=1,
                         bucket_placement_func=lambda no_of_slices: 0.99,
                         broker_data_feed=fake_lob)
@@ -218,8 +227,8 @@ class TestExecutionLogic(unittest.TestCase):
         # define the benchmark algo
         algo = TWAPAlgo(trade_direction=1,
                         volume=25,
-                        start_time='09:00:00',
-                        end_time='09:01:00',
+                        start_time='2021-06-21 09:00:00',
+                        end_time='2021-06-21 09:01:00',
                         no_of_slices=2,
                         bucket_placement_func=lambda no_of_slices: [0.5, 0.6],
                         broker_data_feed=fake_lob)
@@ -230,8 +239,10 @@ class TestExecutionLogic(unittest.TestCase):
         broker.simulate_algo(algo)
 
         dts = [trade['timestamp'] for trade in broker.trade_logs['benchmark_algo']]
-        res = all(i < j for i, j in zip(dts, dts[1:]))
+        res = all(i <= j for i, j in zip(dts, dts[1:]))
         self.assertEqual(res, True, 'Overlapping trades detected')
+        # every order is placed, the two orders of the short last bucket (at 58.0s and 58.4s) on the snapshot at 59s
+        self.assertEqual(len(dts) - len(set(dts)), 1, 'Only the orders of the last bucket should share a snapshot')
 
     def test_close_limit_orders(self):
         """ tests what happens if limit orders are extremely close to each other """
@@ -241,8 +252,8 @@ class TestExecutionLogic(unittest.TestCase):
         # define the benchmark algo
         algo = TWAPAlgo(trade_direction=1,
                         volume=25,
-                        start_time='09:00:00',
-                        end_time='09:01:00',
+                        start_time='2021-06-21 09:00:00',
+                        end_time='2021-06-21 09:01:00',
                         no_of_slices=2,
                         bucket_placement_func=lambda no_of_slices: [0.5, 0.8],
                         broker_data_feed=fake_lob)
@@ -263,14 +274,14 @@ class TestExecutionLogic(unittest.TestCase):
         # define the benchmark algo
         algo = TWAPAlgo(trade_direction=1,
                         volume=25,
-                        start_time='09:00:00',
-                        end_time='09:01:00',
+                        start_time='2021-06-21 09:00:00',
+                        end_time='2021-06-21 09:01:00',
                         no_of_slices=1,
                         bucket_placement_func=lambda no_of_slices: 0.5,
                         broker_data_feed=fake_lob)
 
         # define the broker class
-        broker = Broker(fake_lob)
+        broker = Broker(fake_lob, hist='full')
         broker.benchmark_algo = algo
         broker.simulate_algo(algo)
 
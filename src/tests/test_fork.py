@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+
+from src.core.environment.limit_orders_setup.broker import Broker
+from src.tests.test_data_feed import FakeFeedTestCase
+
+
+class TestFork(FakeFeedTestCase):
+
+    def test_fork(self):
+        def run(broker, step, volume=None):
+            while not step['done']:
+                step['volume'] = volume
+                broker.step_lockstep([step])
+            return broker.trade_logs['twap']
+
+        broker = Broker(self.lob_feed)
+        algo = self.twap(7)
+        broker.register_algo('twap', algo)
+        broker.reset(algo)
+        event, done, lob = broker.simulate_to_next_event(algo)
+        step = {'algo': algo, 'event': event, 'done': done, 'lob': lob}
+        broker.step_lockstep([step])
+        n_logs, state, row_idx = len(broker.trade_logs['twap']), algo.get_state(), broker.cursors['twap'].row_idx
+
+        fork = broker.fork()
+        self.assertIs(fork.data_feed, broker.data_feed, 'Fork should share the data')
+        self.assertIs(fork.lob_cache, broker.lob_cache, 'Fork should share the books')
+        run(fork, dict(step, algo=fork.algos['twap']), volume=0)
+        self.assertEqual(len(broker.trade_logs['twap']), n_logs, 'Fork should not change the logs')
+        self.assertEqual(broker.cursors['twap'].row_idx, row_idx, 'Fork should not move the cursor')
+        np.testing.assert_array_equal(algo.volumes_per_trade, state['volumes_per_trade'], 'Algo state changed')
+
+        same_fork = broker.fork()
+        run(same_fork, dict(step, algo=same_fork.algos['twap']))
+        self.assertNotEqual(fork.trade_logs['twap'], same_fork.trade_logs['twap'], 'Actions should give other logs')
+        self.assertEqual(run(broker, step), same_fork.trade_logs['twap'],
+                         'Fork with the same actions should trade the same as the broker')
+        broker_single = Broker(self.lob_feed)
+        broker_single.simulate_algos({'twap': self.twap(7)})
+        self.assertEqual(broker.trade_logs['twap'], broker_single.trade_logs['twap'], 'Forking changed the broker')
+
+
+if __name__ == '__main__':
+    unittest.main()
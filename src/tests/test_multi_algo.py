@@ -0,0 +1,78 @@
+import unittest
+
+from src.core.environment.limit_orders_setup.broker import Broker
+from src.tests.test_data_feed import FakeFeedTestCase
+
+
+class TestMultiAlgoBroker(FakeFeedTestCase):
+
+    def test_algos_are_independent(self):
+        broker = Broker(self.lob_feed)
+        broker.simulate_algos({'twap_1': self.twap(1), 'twap_2': self.twap(2)})
+        for name, seed in (('twap_1', 1), ('twap_2', 2)):
+            for lockstep in (True, False):
+                broker_single = Broker(self.lob_feed, lockstep=lockstep)
+                broker_single.simulate_algos({name: self.twap(seed)})
+                self.assertEqual(broker.trade_logs[name], broker_single.trade_logs[name],
+                                 'Simulating algos together should not change their trades')
+            self.assertNotEqual(broker.calc_vwap(name), 0, 'Algo should have traded')
+
+    def test_jump_to_fills(self):
+        broker = Broker(self.lob_feed, hist='full')
+        broker_all_rows = Broker(self.lob_feed, jump_to_fills=False, hist='full')
+        broker.simulate_algos({'twap': self.twap(3, trade_direction=-1)})
+        broker_all_rows.simulate_algos({'twap': self.twap(3, trade_direction=-1)})
+        self.assertEqual(broker.trade_logs['twap'], broker_all_rows.trade_logs['twap'],
+                         'Jumping over quiet snapshots should not change the logs')
+        self.assertLess(len(broker.hist_dict['twap']['lob']), len(broker_all_rows.hist_dict['twap']['lob']),
+                        'Quiet snapshots should have been skipped')
+
+    def test_bounded_history(self):
+        broker_full = Broker(self.lob_feed, hist='full')
+        broker_full.simulate_algos({'twap': self.twap(4)})
+        for hist, max_lobs in ((3, 3), ('rows', 1), ('off', 1)):
+            broker = Broker(self.lob_feed, hist=hist)
+            broker.simulate_algos({'twap': self.twap(4)})
+            self.assertEqual(broker.trade_logs['twap'], broker_full.trade_logs['twap'],
+                             'The history mode should not change the logs')
+            self.assertEqual(len(broker.hist_dict['twap']['lob']), max_lobs, 'History should be bounded')
+            if hist == 'rows':
+                self.assertEqual([self.lob_feed.row_time(row) for row in broker.hist_dict['twap']['row']],
+                                 broker_full.hist_dict['twap']['timestamp'], 'Rows should point to the snapshots')
+        self.assertEqual(Broker(self.lob_feed).hist, 'off', 'History should be bounded by default')
+        with self.assertRaises(ValueError):
+            Broker(self.lob_feed, hist='all')
+
+    def test_feed_without_cursors(self):
+        class SnapshotFeed:
+            """ Feed which only offers reset and next_lob_snapshot, like the generators of the older tests """
+
+            def __init__(self, data_feed):
+                self.data_feed = data_feed
+
+            def reset(self, time=None):
+                self.data_feed.reset(time=time)
+
+            def next_lob_snapshot(self):
+                return self.data_feed.next_lob_snapshot()
+
+        broker = Broker(self.lob_feed)
+        broker.simulate_algos({'twap_1': self.twap(8), 'twap_2': self.twap(9, trade_direction=-1)})
+        broker_snapshots = Broker(SnapshotFeed(self.lob_feed))
+        broker_snapshots.simulate_algos({'twap_1': self.twap(8), 'twap_2': self.twap(9, trade_direction=-1)})
+        for name in ('twap_1', 'twap_2'):
+            self.assertEqual(broker_snapshots.trade_logs[name], broker.trade_logs[name],
+                             'Reading the feed through FeedCursors should not change the trades')
+
+    def test_legacy_slots(self):
+        broker = Broker(self.lob_feed)
+        algo = self.twap(1)
+        broker.benchmark_algo = algo
+        self.assertIs(broker.algos['benchmark_algo'], algo, 'benchmark_algo should be registered by name')
+        self.assertIs(broker.hist_dict['benchmark'], broker.hist_dict['benchmark_algo'], 'History alias missing')
+        self.assertIsNone(broker.rl_algo, 'RL slot should be empty')
+        self.assertEqual(broker.calc_vwap_from_logs(), (0, 0), 'Empty logs should give VWAPs of 0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from decimal import Decimal
+
+from src.core.environment.orderbook import OrderBook
+from src.core.environment.levelbook import LevelBook
+from src.core.environment.env_utils import raw_to_order_book
+
+
+def fake_book(tape_mode='deque', tape_maxlen=None):
+    """ Builds a book with three ask and three bid levels of volume 1 each """
+
+    lob = OrderBook(tape_mode=tape_mode, tape_maxlen=tape_maxlen)
+    for side, prices in (('ask', ['30.0', '30.1', '30.2']), ('bid', ['29.9', '29.8', '29.7'])):
+        for p in prices:
+            lob.process_order({'type': 'limit',
+                               'side': side,
+                               'quantity': Decimal('1'),
+                               'price': Decimal(p),
+                               'trade_id': 0}, False, False)
+    return lob
+
+
+def sweep(lob, quantity='2.5'):
+    return lob.process_order({'type': 'market',
+                              'timestamp': '2021-06-21 09:00:00.000000',
+                              'side': 'bid',
+                              'quantity': Decimal(quantity),
+                              'trade_id': 1}, True, False)
+
+
+class TestTradeTape(unittest.TestCase):
+
+    def test_disabled_tape(self):
+        lob = fake_book(tape_mode=None)
+        trades, _ = sweep(lob)
+        self.assertIsNone(lob.tape, 'Disabled tape should not record anything')
+        self.assertEqual(len(trades), 3, 'Trades should still be returned with a disabled tape')
+
+    def test_ring_tape(self):
+        lob = fake_book(tape_mode='ring', tape_maxlen=2)
+        sweep(lob)
+        self.assertEqual(len(lob.tape), 2, 'Ring tape should be bounded')
+        self.assertEqual(lob.tape[-1]['price'], Decimal('30.2'), 'Ring tape should keep the most recent trade')
+
+    def test_columnar_tape(self):
+        lob_deque = fake_book()
+        lob_columnar = fake_book(tape_mode='columnar')
+        sweep(lob_deque)
+        sweep(lob_columnar)
+        self.assertEqual(len(lob_deque.tape), len(lob_columnar.tape), 'Tapes should record the same trades')
+        vwap = sum(t['price'] * t['quantity'] for t in lob_deque.tape) / sum(t['quantity'] for t in lob_deque.tape)
+        self.assertAlmostEqual(lob_columnar.tape.vwap()[0], float(vwap), 10, 'Columnar VWAP is not correct')
+
+    def test_tape_dump(self):
+        for tape_mode in ('deque', 'columnar'):
+            lob = fake_book(tape_mode=tape_mode)
+            sweep(lob)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                filename = os.path.join(tmp_dir, 'tape.txt')
+                lob.tape_dump(filename, 'w', 'wipe')
+                with open(filename) as f:
+                    lines = f.read().splitlines()
+            self.assertEqual(len(lines), 3, 'Tape dump should write one line per trade')
+            self.assertEqual(len(lob.tape), 0, 'Wiped tape should be empty')
+            self.assertEqual(lob.tape_mode, tape_mode, 'Wiping should keep the tape mode')
+
+    def test_simulator_tape(self):
+        raw = np.array([30, 30.1, 30.2, 1, 1, 1, 29.9, 29.8, 29.7, 1, 1, 1])
+        lob = raw_to_order_book(current_book=raw.reshape(-1, 3), time='2021-06-21 09:00:00.000000', depth=3)
+        trades, _ = sweep(lob, quantity='3')
+        self.assertEqual(len(trades), 3, 'All fills of an order should be returned without a tape')
+        self.assertIsNone(lob.tape, 'Simulator books should not keep a tape')
+
+
+class TestBatchOrders(unittest.TestCase):
+
+    def test_batch_matches_single_orders(self):
+        lob = fake_book()
+        quotes = [{'type': 'limit', 'side': side, 'quantity': Decimal('1'), 'price': Decimal(p), 'trade_id': 0}
+                  for side, p in (('ask', '30.0'), ('ask', '30.1'), ('ask', '30.2'),
+                                  ('bid', '29.9'), ('bid', '29.8'), ('bid', '29.7'))]
+        lob_batch = OrderBook()
+        _, orders_in_book = lob_batch.process_orders(quotes)
+        self.assertEqual(len(orders_in_book), 6, 'All orders should rest in the book')
+        self.assertEqual(str(lob_batch), str(lob), 'Batch and single order books differ')
+        self.assertEqual(lob_batch.next_order_id, lob.next_order_id, 'Order ids differ')
+
+    def test_batch_crossing_order(self):
+        lob = fake_book()
+        quotes = [{'type': 'limit', 'side': 'ask', 'quantity': Decimal('1'), 'price': Decimal('29.95'), 'trade_id': 2},
+                  {'type': 'limit', 'side': 'bid', 'quantity': Decimal('2'), 'price': Decimal('30.0'), 'trade_id': 3}]
+        trades, orders_in_book = lob.process_orders(quotes)
+        self.assertEqual(len(trades), 2, 'Crossing order should trade against the pending and the existing ask')
+        self.assertEqual(lob.get_best_ask(), Decimal('30.1'), 'Best ask after the batch is not correct')
+        self.assertEqual(lob.get_best_bid(), Decimal('29.9'), 'Best bid after the batch is not correct')
+
+
+class TestDepthArrays(unittest.TestCase):
+
+    def test_depth_arrays(self):
+        lob = fake_book()
+        bid_prices, bid_volumes, ask_prices, ask_volumes = lob.depth_arrays(2)
+        np.testing.assert_array_equal(bid_prices, [29.8, 29.9])
+        np.testing.assert_array_equal(ask_prices, [30.0, 30.1])
+        np.testing.assert_array_equal(bid_volumes, [1, 1])
+        self.assertEqual(lob.depth_arrays(0)[0].shape, (0,), 'Zero depth should return empty arrays')
+
+    def test_cache_invalidation(self):
+        lob = fake_book()
+        lob.depth_arrays(3)
+        sweep(lob)
+        _, _, ask_prices, ask_volumes = lob.depth_arrays(3)
+        np.testing.assert_array_equal(ask_prices, [30.2])
+        np.testing.assert_array_equal(ask_volumes, [0.5])
+
+    def test_seeded_arrays(self):
+        raw = np.array([30, 30.1, 30.2, 1, 2, 3, 29.9, 29.8, 29.7, 4, 5, 6])
+        lob = raw_to_order_book(current_book=raw.reshape(-1, 3), time='2021-06-21 09:00:00.000000', depth=3)
+        seeded = lob.depth_arrays(3)
+        lob.bids.invalidate_depth()
+        lob.asks.invalidate_depth()
+        for x, y in zip(seeded, lob.depth_arrays(3)):
+            np.testing.assert_array_equal(x, y)
+
+
+class TestLevelBook(unittest.TestCase):
+    raw = np.array([30, 30.1, 30.2, 1, 1, 1, 29.9, 29.8, 29.7, 1, 1, 1]).reshape(-1, 3)
+
+    def test_same_trades(self):
+        lob_order = raw_to_order_book(current_book=self.raw, time='2021-06-21 09:00:00.000000', depth=3, book_type='order')
+        lob_level = raw_to_order_book(current_book=self.raw, time='2021-06-21 09:00:00.000000', depth=3, book_type='level')
+        self.assertIsInstance(lob_level, LevelBook)
+        trades_order, _ = sweep(lob_order)
+        trades_level, _ = sweep(lob_level)
+        self.assertEqual([(t['price'], t['quantity']) for t in trades_order],
+                         [(t['price'], t['quantity']) for t in trades_level], 'Level book trades differently')
+        for x, y in zip(lob_order.depth_arrays(3), lob_level.depth_arrays(3)):
+            np.testing.assert_array_equal(x, y)
+
+    def test_crossed_snapshot(self):
+        raw = np.array([29.8, 30.1, 30.2, 1.5, 1, 1, 29.9, 29.8, 29.7, 1, 1, 1]).reshape(-1, 3)
+        lob_order = raw_to_order_book(current_book=raw, time='2021-06-21 09:00:00.000000', depth=3, book_type='order')
+        lob_level = raw_to_order_book(current_book=raw, time='2021-06-21 09:00:00.000000', depth=3, book_type='level')
+        for x, y in zip(lob_order.depth_arrays(3), lob_level.depth_arrays(3)):
+            np.testing.assert_array_equal(x, y, 'Crossed levels should be matched when seeding')
+        self.assertEqual(lob_level.get_best_ask(), Decimal('30.1'), 'Crossing ask should have traded')
+        self.assertEqual(lob_level.get_best_bid(), Decimal('29.8'), 'Crossed bid should have traded')
+        self.assertEqual(lob_level.get_volume_at_price('bid', Decimal('29.8')), Decimal('0.5'), 'Wrong rest of the bid')
+        trades_order, _ = sweep(lob_order)
+        trades_level, _ = sweep(lob_level)
+        self.assertEqual([(t['price'], t['quantity']) for t in trades_order],
+                         [(t['price'], t['quantity']) for t in trades_level], 'Level book trades differently')
+
+    def test_own_orders(self):
+        lob = raw_to_order_book(current_book=self.raw, time='2021-06-21 09:00:00.000000', depth=3)
+        _, order_in_book = lob.process_order({'type': 'limit',
+                                              'side': 'bid',
+                                              'quantity': Decimal('1'),
+                                              'price': Decimal('29.95'),
+                                              'trade_id': 1}, False, False)
+        self.assertEqual(lob.get_best_bid(), Decimal('29.9'), 'Own orders should not change the market levels')
+        self.assertTrue(lob.own_bids.order_exists(order_in_book['order_id']), 'Own order should rest in the book')
+        lob.cancel_order('bid', order_in_book['order_id'])
+        self.assertEqual(len(lob.own_bids), 0, 'Own order should be cancelled')
+
+    def test_snapshot(self):
+        lob = raw_to_order_book(current_book=self.raw, time='2021-06-21 09:00:00.000000', depth=3)
+        self.assertIsInstance(lob.snapshot().thaw(), LevelBook, 'Snapshot should rebuild the same type of book')
+
+
+class TestBookSnapshot(unittest.TestCase):
+
+    def test_snapshot_levels(self):
+        lob = fake_book()
+        snapshot = lob.snapshot()
+        self.assertEqual(snapshot.get_best_bid(), lob.get_best_bid(), 'Best bid of snapshot is not correct')
+        self.assertEqual(snapshot.get_best_ask(), lob.get_best_ask(), 'Best ask of snapshot is not correct')
+        np.testing.assert_array_equal(snapshot.ask_prices, [30.0, 30.1, 30.2])
+        np.testing.assert_array_equal(snapshot.bid_volumes, [1, 1, 1])
+
+    def test_copy_on_write(self):
+        lob = fake_book()
+        snapshot = lob.snapshot()
+        self.assertEqual(len(snapshot.tape), 0, 'Untouched snapshot should not have any trades')
+        sweep(snapshot)
+        self.assertEqual(len(snapshot.tape), 3, 'Snapshot should record the trades of its rebuilt book')
+        self.assertEqual(snapshot.get_best_ask(), Decimal('30.2'), 'Snapshot should reflect trades once rebuilt')
+        self.assertEqual(lob.get_best_ask(), Decimal('30.0'), 'Original book should not be affected by the snapshot')
+
+    def test_clone(self):
+        lob = fake_book()
+        clone = lob.clone()
+        sweep(clone)
+        self.assertEqual(len(lob.tape), 0, 'Original book should not be affected by trading on its clone')
+        self.assertEqual(clone.get_volume_at_price('ask', Decimal('30.2')), Decimal('0.5'), 'Clone did not trade correctly')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import shutil
+import tempfile
+import numpy as np
+
+from src.core.environment.limit_orders_setup.broker import Broker
+from src.core.environment.limit_orders_setup.execution_algo import TWAPAlgo, VWAPAlgo, POVAlgo, sample_placements, \
+    allocate_lots
+from src.tests.test_data_feed import FakeFeedTestCase, fake_feed
+
+
+class TestProfileAlgos(FakeFeedTestCase):
+
+    def test_volume_profile_algos(self):
+        data_dir = tempfile.mkdtemp()
+        # the volumes change every second during the first two minutes only
+        lob_feed = fake_feed(data_dir, self.day, n_rows=600, volume_func=lambda row: 1 + (row % 2) * (row < 120))
+        shutil.rmtree(data_dir)
+        kwargs = dict(trade_direction=1, volume=5, no_of_slices=3, bucket_placement_func=sample_placements,
+                      start_time='2021-06-21 09:00:00', end_time='2021-06-21 09:05:00')
+
+        self.assertEqual(allocate_lots(10, [1, 1, 2]).tolist(), [3, 2, 5], 'Leftover lots go to the largest remainder')
+        self.assertEqual(allocate_lots(5, [0, 0]).tolist(), [3, 2], 'Without weights the lots are split equally')
+
+        vwap = VWAPAlgo(broker_data_feed=lob_feed, **kwargs)
+        self.assertEqual(vwap.bucket_volumes.sum(), vwap.volume_lots, 'Buckets should add up to the volume')
+        self.assertEqual(vwap.bucket_volumes[4:].sum(), 0, 'Quiet buckets should not get any volume')
+        twap = TWAPAlgo(broker_data_feed=self.lob_feed, **kwargs)
+        np.testing.assert_array_equal(VWAPAlgo(broker_data_feed=self.lob_feed, **kwargs).bucket_volumes,
+                                      twap.bucket_volumes, 'Without any activity the VWAP should be the TWAP')
+
+        # a turnover of 2 per second (118 in the first minute, without the first row), 1% of it are 6 lots of 0.1
+        # per 30 second bucket
+        pov = POVAlgo(broker_data_feed=lob_feed, participation_rate=0.01, **kwargs)
+        self.assertEqual(pov.bucket_volumes.tolist(), [5, 5, 6, 6, 0, 0, 0, 0, 0, 28], 'Wrong POV schedule')
+        with self.assertRaises(ValueError):
+            POVAlgo(broker_data_feed=lob_feed, participation_rate=0, **kwargs)
+
+        broker = Broker(lob_feed)
+        broker.simulate_algos({'vwap': vwap, 'pov': pov})
+        self.assertEqual(vwap.vol_remaining, 0, 'Everything should have been executed')
+        self.assertEqual(pov.vol_remaining, 0, 'Everything should have been executed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import random
+import numpy as np
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from src.core.environment.limit_orders_setup.broker import Broker
+from src.core.environment.limit_orders_setup.execution_algo import TWAPAlgo, Bucket, EVENT_TYPES, SCHEDULE_TEMPLATES, \
+    split_across_buckets, sample_placements
+from src.tests.test_data_feed import FakeFeedTestCase
+
+
+class TestSchedule(FakeFeedTestCase):
+
+    def test_lot_accounting(self):
+        algo = self.twap(5)
+        self.assertEqual(algo.volumes_per_trade.dtype, np.int64, 'Volumes should be kept in lots')
+        self.assertEqual(algo.volumes_per_trade.sum(), algo.bucket_volumes.sum(),
+                         'Schedule should add up to the buckets')
+        self.assertEqual(algo.to_volume(algo.bucket_volumes.sum()), algo.volume, 'Buckets should add up to the volume')
+        broker = Broker(self.lob_feed)
+        broker.simulate_algos({'twap': algo})
+        executed_volume = sum(log['quantity'] for log in broker.trade_logs['twap'])
+        self.assertEqual(algo.vol_remaining, algo.to_lots(algo.volume - executed_volume), 'Remaining lots are off')
+        self.assertEqual(algo.vol_remaining, 0, 'Everything should have been executed')
+
+    def test_schedule_volumes_sum(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            volume = round(rng.uniform(0.1, 100), 1)
+            duration = rng.randint(1, 240)
+            algo = TWAPAlgo(trade_direction=1,
+                            volume=volume,
+                            no_of_slices=rng.randint(1, 6),
+                            bucket_placement_func=lambda no_of_slices: sorted(rng.uniform(0, 1)
+                                                                              for _ in range(no_of_slices)),
+                            start_time='2021-06-21 09:00:00',
+                            end_time=str(datetime(2021, 6, 21, 9) + timedelta(minutes=duration)),
+                            broker_data_feed=self.lob_feed)
+            self.assertEqual(algo.volumes_per_trade.sum(), algo.volume_lots, 'Schedule should add up to the order')
+            np.testing.assert_array_equal(algo.volumes_per_trade.sum(axis=1), algo.bucket_volumes,
+                                          'Schedule should add up to the buckets')
+            self.assertLessEqual(np.ptp(algo.volumes_per_trade, axis=1).max(), 1, 'Buckets should be split equally')
+            self.assertEqual(sum(split_across_buckets(volume, algo.no_of_slices, 0.1)), Decimal(str(volume)),
+                             'Splits should add up to the quantity')
+            buckets = algo.buckets
+            self.assertEqual(buckets.bucket_bounds[0], buckets.start_time, 'First bound should be the start')
+            self.assertEqual(buckets.bucket_bounds[-1], buckets.end_time, 'Last bound should be the end')
+            widths = np.diff(buckets.bucket_bounds[:-1]).astype('m8[us]')
+            self.assertTrue(np.all(widths == timedelta(seconds=buckets.bucket_width)), 'Bounds should be regular')
+
+        # random bounds still cover the order
+        buckets = Bucket(datetime(2021, 6, 21, 9), datetime(2021, 6, 21, 10), rand_width=20)
+        self.assertEqual(buckets.bucket_bounds[-1], buckets.end_time, 'Last bound should be the end')
+        self.assertTrue(all(a < b for a, b in zip(buckets.bucket_bounds, buckets.bucket_bounds[1:])),
+                        'Bounds should be increasing')
+
+    def test_sample_placements(self):
+        random.seed(0)
+        for no_of_slices in (1, 10, 99):
+            placements = sample_placements(no_of_slices)
+            self.assertEqual(len(set(placements)), no_of_slices, 'Placements should all differ')
+            self.assertEqual(placements, sorted(placements), 'Placements should be sorted')
+            self.assertTrue(all(0 < p < 1 for p in placements), 'Placements should not be on the bucket bounds')
+            self.assertTrue(all(round(p, 2) == p for p in placements), 'Placements should be on the grid')
+        with self.assertRaises(ValueError):
+            sample_placements(100)
+
+        # a placement func that never gives valid placements falls back to sample_placements
+        algo = TWAPAlgo(trade_direction=1,
+                        volume=5,
+                        no_of_slices=3,
+                        bucket_placement_func=lambda no_of_slices: [0.5] * no_of_slices,
+                        start_time='2021-06-21 09:01:00',
+                        end_time='2021-06-21 09:06:00',
+                        broker_data_feed=self.lob_feed)
+        for bucket_trades in algo.execution_times:
+            self.assertEqual(len(set(bucket_trades)), 3, 'Order placements should all differ')
+
+    def test_event_table(self):
+        algo = self.twap(6)
+        self.assertEqual(len(algo.event_table), len(algo.algo_events), 'One row per event expected')
+        for event_time, (_, event_type, bucket_idx, order_idx) in zip(algo.algo_events, algo.event_table):
+            if EVENT_TYPES[event_type] == 'order_placement':
+                self.assertEqual(algo.execution_times[bucket_idx][order_idx], event_time, 'Wrong order placement')
+            else:
+                self.assertEqual(algo.buckets.bucket_bounds[bucket_idx + 1], event_time, 'Wrong bucket bound')
+        algo.reset()
+        events = [algo.get_next_event()[0]['type'] for _ in algo.algo_events]
+        self.assertEqual(events.count('bucket_bound'), algo.buckets.n_buckets, 'Every bucket should end once')
+
+    def test_schedule_templates(self):
+        SCHEDULE_TEMPLATES.clear()
+        self.twap(7)
+        algo = self.twap(7, minute=2)
+        self.assertEqual(len(SCHEDULE_TEMPLATES), 1, 'Algos with the same parameters should share a template')
+        try:
+            TWAPAlgo.schedule_cache = None
+            algo_from_scratch = self.twap(7, minute=2)
+        finally:
+            TWAPAlgo.schedule_cache = SCHEDULE_TEMPLATES
+        self.assertEqual(algo.buckets.bucket_bounds, algo_from_scratch.buckets.bucket_bounds, 'Buckets differ')
+        self.assertEqual(algo.execution_times, algo_from_scratch.execution_times, 'Execution times differ')
+        np.testing.assert_array_equal(algo.volumes_per_trade, algo_from_scratch.volumes_per_trade)
+
+
+if __name__ == '__main__':
+    unittest.main()
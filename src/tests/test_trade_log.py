@@ -0,0 +1,99 @@
+import unittest
+import numpy as np
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from src.core.environment.limit_orders_setup.trade_log import TradeLog, Fill, MESSAGES, SIDES, ORDER_TYPES, \
+    to_unix_us
+
+
+def fake_log(dt, message, price, quantity):
+    return {'timestamp': datetime.strftime(dt, '%Y-%m-%d %H:%M:%S.%f'),
+            'message': message,
+            'type': 'limit',
+            'side': 'bid',
+            'price': Decimal(price),
+            'quantity': Decimal(quantity),
+            'target_quantity': Decimal('2.5')}
+
+
+def reference_vwap(logs):
+    """ VWAP of the trades of a list of log dicts, as the Broker calculated it before the TradeLog """
+
+    p = [Decimal(trade['price']) for trade in logs if trade['message'] == 'trade']
+    v = [trade['quantity'] for trade in logs if trade['message'] == 'trade']
+    if len(p) == 0 or len(v) == 0:
+        return 0
+    return float(np.dot(p, v) / sum(v))
+
+
+class TestTradeLog(unittest.TestCase):
+
+    def setUp(self):
+        self.start = datetime(2021, 6, 21, 9)
+        self.logs = [fake_log(self.start + timedelta(seconds=i), message, price, quantity)
+                     for i, (message, price, quantity) in enumerate((('trade', '30.1', '1'),
+                                                                     ('no_trade', '30.05', '0'),
+                                                                     ('trade', '30.2', '0.5'),
+                                                                     ('trade', '30.4', '1')))]
+        self.trade_log = TradeLog(capacity=1)
+        self.trade_log.extend(self.logs)
+
+    def test_adapter_view(self):
+        self.assertEqual(len(self.trade_log), 4, 'Log should grow beyond its capacity')
+        self.assertEqual(self.trade_log, self.logs, 'Logs should read back as the dicts they were built from')
+        self.assertEqual(self.trade_log[-1], self.logs[-1], 'Negative indices should work')
+        self.assertEqual(self.trade_log[1:3], self.logs[1:3], 'Slices should work')
+        self.assertEqual(self.trade_log.ts[0], to_unix_us(self.start), 'Wrong timestamp')
+
+    def test_vwap(self):
+        self.assertAlmostEqual(self.trade_log.vwap(), reference_vwap(self.logs), 12, 'Wrong VWAP')
+        # the range starts after start_date and includes the first log at or after end_date
+        start_date, end_date = self.start, self.start + timedelta(seconds=1, microseconds=1)
+        self.assertEqual(self.trade_log.range_indices(start_date, end_date), (1, 3), 'Wrong range')
+        self.assertAlmostEqual(self.trade_log.vwap(start_date, end_date), 30.2, 12, 'Wrong VWAP of the range')
+        self.assertEqual(self.trade_log.vwap(self.start, self.start), 0, 'No trades should give a VWAP of 0')
+        self.assertAlmostEqual(self.trade_log.vwap_rows(1, 3), 30.2, 12, 'Wrong VWAP of the rows')
+        self.assertEqual(self.trade_log.vwap_rows(1, 2), 0, 'No trades should give a VWAP of 0')
+        with self.assertRaises(ValueError):
+            self.trade_log.vwap(self.start + timedelta(hours=1))
+
+    def test_running_sums(self):
+        trade_log = TradeLog()
+        logs = [fake_log(self.start + timedelta(seconds=i // 2), ('trade', 'no_trade')[i % 3 == 0],
+                         '30.{}'.format(i % 10), '0' if i % 3 == 0 else '0.{}'.format(i % 7 + 1)) for i in range(500)]
+        trade_log.extend(logs)
+        for start_s, end_s in ((0, 10), (3, 3), (100, 249), (17, 400)):
+            start_date, end_date = self.start + timedelta(seconds=start_s), self.start + timedelta(seconds=end_s)
+            start, end = (datetime.strftime(dt, '%Y-%m-%d %H:%M:%S.%f') for dt in (start_date, end_date))
+            start_idx = next(i for i, log in enumerate(logs) if log['timestamp'] > start)
+            end_idx = next((i + 1 for i, log in enumerate(logs) if log['timestamp'] >= end), len(logs))
+            self.assertEqual(trade_log.range_indices(start_date, end_date), (start_idx, end_idx), 'Wrong range')
+            self.assertAlmostEqual(trade_log.vwap(start_date, end_date), reference_vwap(logs[start_idx:end_idx]), 10,
+                                   'Running sums give a wrong VWAP')
+
+    def test_append_fill(self):
+        trade_log = TradeLog(capacity=1)
+        for log in self.logs:
+            trade_log.append_fill(Fill(to_unix_us(log['timestamp']), float(log['price']), float(log['quantity']),
+                                       float(log['target_quantity']), MESSAGES.index(log['message']),
+                                       ORDER_TYPES.index(log['type']), SIDES.index(log['side'])))
+        self.assertEqual(trade_log, self.trade_log, 'Fills should give the same rows as the log dicts')
+        self.assertEqual(list(trade_log), self.logs, 'Fills should read back as log dicts')
+        self.assertEqual(trade_log.vwap(), self.trade_log.vwap(), 'Fills should give the same VWAP')
+
+    def test_fork(self):
+        fork = self.trade_log.fork()
+        self.assertIs(fork._ts, self.trade_log._ts, 'Fork should share the columns until it appends')
+        fork.append(self.logs[0])
+        self.trade_log.append(self.logs[1])
+        self.assertEqual(fork, self.logs + self.logs[:1], 'Appending to the log should not change the fork')
+        self.assertEqual(self.trade_log, self.logs + self.logs[1:2], 'Appending to the fork should not change the log')
+        fork = self.trade_log.fork()
+        self.trade_log.clear()
+        self.trade_log.append(self.logs[2])
+        self.assertEqual(fork, self.logs + self.logs[1:2], 'Clearing the log should not change the fork')
+
+
+if __name__ == '__main__':
+    unittest.main()